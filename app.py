@@ -1,10 +1,7 @@
 # Importation des bibliothèques nécessaires
 import streamlit as st  # Import de Streamlit pour créer l'interface utilisateur
-from rag.indexing.document_loader import DocumentLoader  # Chargement des documents depuis le disque
-from rag.indexing.text_splitter import TextSplitter  # Découpage des documents en morceaux
-from rag.indexing.vectorstore import VectorStore  # Gestion de la base de données vectorielle
-from rag.chat.chatbot import Chatbot  # Gestion du chatbot
-from rag.feedback.feedback_manager import FeedbackManager  # Gestion des retours d'utilisateur
+# Le moteur de recherche (modèles, ChromaDB) et le chatbot (Google AI) sont importés à la première utilisation :
+# l'écran de connexion s'affiche sans charger la pile de machine learning
 
 # Configuration de la page Streamlit
 st.set_page_config(
@@ -35,38 +32,34 @@ st.markdown("""
 def init_components(api_key: str):
     """
     Initialise tous les composants nécessaires au chatbot.
+    La base vectorielle et le gestionnaire de feedback proviennent du moteur partagé par
+    toutes les sessions ; seul le chatbot, lié à la clé API, est propre à la session. La base
+    n'est pas gardée dans la session : le moteur la remplace à chaque nouvelle version de l'index.
     Args:
         api_key (str): Clé API Google AI
     Returns:
-        tuple: (vector_store, chatbot, feedback_manager)
+        tuple: (chatbot, feedback_manager, conversation)
     """
     st.session_state.api_key = api_key  # Sauvegarde de la clé API dans l'état de la session
+    from rag.engine.retrieval_engine import get_engine  # Moteur de recherche partagé entre les sessions
+    from rag.chat.chatbot import Chatbot  # Gestion du chatbot
+    from rag.chat.conversation import ConversationSession  # Historique de la conversation et questions de relance
     
     # Chargement et traitement des documents dans un bloc d'attente
     with st.spinner("Initialisation en cours..."):  # Affiche un message de chargement
         try:
-            # Chargement des documents depuis le répertoire "documents"
-            st.info("Chargement des documents...")  # Affiche une information à l'utilisateur
-            loader = DocumentLoader("documents")  # Instance de DocumentLoader pour charger les fichiers
-            documents = loader.load_documents()  # Chargement des documents
+            # Récupération du moteur partagé (créé et indexé une seule fois par processus)
+            st.info("Chargement du moteur de recherche...")  # Affiche une info pendant le chargement du moteur
+            engine = get_engine()  # Modèle d'embedding, base vectorielle et index communs à toutes les sessions
+            feedback_manager = engine.feedback_manager
             
-            # Découpage des documents en morceaux plus petits
-            st.info("Découpage des documents...")  # Affiche une info pendant le découpage
-            splitter = TextSplitter()  # Instance de TextSplitter pour découper les documents
-            chunks = splitter.split_documents(documents)  # Découpe les documents en morceaux
-            
-            # Création de la base vectorielle pour stocker les documents découpés
-            st.info("Création de la base vectorielle...")  # Affiche une info pendant la création de la base
-            vector_store = VectorStore()  # Instance de VectorStore pour gérer les embeddings des documents
-            vector_store.add_documents(chunks)  # Ajoute les documents découpés à la base vectorielle
-            
-            # Initialisation du chatbot et du gestionnaire de feedback
+            # Initialisation du chatbot propre à la session
             st.info("Initialisation du chatbot...")  # Affiche une info pendant l'initialisation du chatbot
             chatbot = Chatbot(api_key)  # Instance du chatbot avec la clé API fournie
-            feedback_manager = FeedbackManager()  # Instance pour gérer les retours utilisateurs
+            conversation = ConversationSession(engine, chatbot)  # Mémoire des échanges propre à la session
             
             st.success("Initialisation terminée avec succès!")  # Affiche un message de succès
-            return vector_store, chatbot, feedback_manager  # Retourne les objets créés
+            return chatbot, feedback_manager, conversation  # Retourne les objets créés
             
         except Exception as e:
             st.error(f"Erreur lors de l'initialisation: {str(e)}")  # Affiche un message d'erreur si quelque chose ne va pas
@@ -90,6 +83,9 @@ def main():
         # Affichage du statut de connexion
         if 'api_key' in st.session_state:  # Vérifie si la clé API est enregistrée dans la session
             st.success("🟢 Connecté")  # Affiche un message de succès si la connexion est établie
+            if 'conversation' in st.session_state and st.button("Nouvelle conversation"):
+                st.session_state.conversation.reset()  # Les prochaines questions ne sont plus lues comme des relances
+                st.session_state.pop('last_query', None)
             if st.button("Déconnexion"):  # Si le bouton de déconnexion est cliqué
                 handle_logout()  # Déconnexion de l'utilisateur
                 st.rerun()  # Recharge la page
@@ -114,62 +110,91 @@ def main():
     
     # Initialisation des composants si nécessaire
     if 'api_key' in st.session_state and 'initialized' not in st.session_state:  # Si la clé API est présente et l'initialisation n'a pas encore été faite
-        vector_store, chatbot, feedback_manager = init_components(st.session_state.api_key)  # Initialise les composants
-        if vector_store and chatbot and feedback_manager:  # Si l'initialisation a réussi
+        chatbot, feedback_manager, conversation = init_components(st.session_state.api_key)  # Initialise les composants
+        if chatbot and feedback_manager and conversation:  # Si l'initialisation a réussi
             # Enregistre les objets dans l'état de la session pour les réutiliser plus tard
-            st.session_state.vector_store = vector_store
             st.session_state.chatbot = chatbot
             st.session_state.feedback_manager = feedback_manager
+            st.session_state.conversation = conversation
             st.session_state.initialized = True  # Marque que l'initialisation est terminée
     
 
     # Interface utilisateur principale si le système est initialisé
     if st.session_state.get('initialized'): # Si le système a été initialisé
+        conversation = st.session_state.conversation
+        history_area = st.container()  # Au-dessus de la question, rempli une fois la question connue
         st.markdown("<i class='fa fa-user'></i>  <strong>Posez votre question</strong>", unsafe_allow_html=True) # Sous-titre pour la section de la question
         query = st.text_input("Votre question sur les contrats d'assurance:") # Champ de saisie de la question
+        
+        # Échanges déjà mémorisés : une question courte ("et la franchise ?") est comprise dans leur continuité
+        previous_turns = [turn for turn in conversation.turns if turn['question'] != query]
+        if previous_turns:
+            with history_area.expander(f"Conversation en cours ({len(previous_turns)} échange(s) précédent(s))"):
+                for turn in previous_turns:
+                    st.markdown(f"**{turn['question']}**")
+                    st.write(turn['answer'])
 
         
         if query:  # Si une question est saisie
-            with st.spinner("Recherche en cours..."):  # Affiche un message de chargement pendant la recherche
-                try:
-                    # Recherche des documents pertinents pour la question posée
-                    context = st.session_state.vector_store.search(query)  
-                    # Génération de la réponse par le chatbot
-                    response = st.session_state.chatbot.generate_response(query, context)
-                    
-                    # Affichage de la réponse et des boutons de feedback
-                    with st.container():  # Crée un conteneur pour afficher la réponse
-                        st.markdown("---")
+            from rag.monitoring.tracing import get_tracer  # Durée de chaque étape de la réponse (page Statistiques)
+            try:
+                # Affichage de la réponse et des boutons de feedback
+                with st.container():  # Crée un conteneur pour afficher la réponse
+                    st.markdown("---")
 
-                        st.markdown("<i class='fa fa-robot'></i>  <strong>Réponse</strong>", unsafe_allow_html=True) # Affiche la réponse générée par le chatbot
+                    st.markdown("<i class='fa fa-robot'></i>  <strong>Réponse</strong>", unsafe_allow_html=True) # Affiche la réponse générée par le chatbot
+                    
+                    if st.session_state.get('last_query') == query:
+                        # Même question (ex : clic sur un bouton de feedback) : on réaffiche la réponse déjà obtenue
+                        response = st.session_state.last_response
+                        from_cache = st.session_state.last_from_cache
+                        sources = st.session_state.last_sources
+                        standalone = st.session_state.last_standalone
                         st.write(response)
-
+                    else:
+                        # Une trace par question : recherche, contexte et génération (jusqu'au dernier morceau affiché)
+                        with get_tracer().trace('question') as trace:
+                            with st.spinner("Recherche en cours..."):  # Affiche un message de chargement pendant la recherche
+                                # Recherche des documents pertinents (ou chunks de la question précédente pour une relance) ;
+                                # la génération (ou le cache) est consommée en flux
+                                stream, from_cache, sources = conversation.ask_stream(query)
+                            standalone = conversation.last_query
+                            if standalone != query:  # Relance : la question recherchée est affichée pour lever toute ambiguïté
+                                st.caption(f"Question comprise : {standalone}")
+                            response = st.write_stream(stream)  # Affiche les morceaux de texte au fur et à mesure
+                            trace.set(from_cache=from_cache, response_chars=len(response),
+                                      follow_up=standalone != query, reused_chunks=conversation.last_reused)
                         
-                        # Boutons de feedback avec styles personnalisés
-                        col1, col2 = st.columns(2)  # Crée deux colonnes pour les boutons
-                        with col1:  # Colonne pour le bouton "Utile"
-                            if st.button("👍 Utile", key="useful"):
-                                st.session_state.feedback_manager.add_feedback(  # Enregistre le feedback
-                                    query, response, True
-                                )
-                                st.success("Merci pour votre retour !")  # Affiche un message de remerciement
-                        
-                        with col2:  # Colonne pour le bouton "Pas utile"
-                            neg_button = st.button("👎 Pas utile", key="not_useful")
-                            if neg_button:
-                                st.session_state.feedback_manager.add_feedback(  # Enregistre le feedback négatif
-                                    query, response, False
-                                )
-                                st.success("Merci pour votre retour !")
-                        
-                        st.markdown("---")
-                except Exception as e:
-                    st.error(f"Une erreur est survenue : {str(e)}")  # Affiche un message d'erreur en cas de problème
-                    # Réinitialisation en cas d'erreur de ChromaDB
-                    if "no such table: collections" in str(e):  
-                        st.warning("Réinitialisation du système...")
-                        st.session_state.clear()  # Efface l'état de la session
-                        st.rerun()  # Recharge la page pour réinitialiser l'application
+                        # Mémorise la réponse complète pour les boutons de feedback et les réexécutions du script
+                        st.session_state.last_query = query
+                        st.session_state.last_response = response
+                        st.session_state.last_from_cache = from_cache
+                        st.session_state.last_sources = sources  # Documents du contexte, pour les statistiques par document
+                        st.session_state.last_standalone = standalone
+
+                    
+                    # Boutons de feedback avec styles personnalisés
+                    # La question enregistrée est sa forme autonome : elle reste compréhensible (et rejouable) sans l'historique
+                    col1, col2 = st.columns(2)  # Crée deux colonnes pour les boutons
+                    with col1:  # Colonne pour le bouton "Utile"
+                        if st.button("👍 Utile", key="useful"):
+                            st.session_state.feedback_manager.add_feedback(  # Enregistre le feedback
+                                standalone, response, True, from_cache=from_cache, sources=sources
+                            )
+                            st.success("Merci pour votre retour !")  # Affiche un message de remerciement
+                    
+                    with col2:  # Colonne pour le bouton "Pas utile"
+                        neg_button = st.button("👎 Pas utile", key="not_useful")
+                        if neg_button:
+                            st.session_state.feedback_manager.add_feedback(  # Enregistre le feedback négatif
+                                standalone, response, False, from_cache=from_cache, sources=sources
+                            )
+                            st.success("Merci pour votre retour !")
+                    
+                    st.markdown("---")
+            except Exception as e:
+                # L'index servi n'est jamais modifié en place (versions publiées par pointeur) : pas de base à réinitialiser
+                st.error(f"Une erreur est survenue : {str(e)}")  # Affiche un message d'erreur en cas de problème
 
 # Fonction principale appelée si le script est exécuté
 if __name__ == "__main__":
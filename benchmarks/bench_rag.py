@@ -0,0 +1,253 @@
+"""
+Banc de mesure hors ligne du pipeline RAG sur le corpus documents/.
+
+Mesure la latence de chaque étape (chargement, découpage, indexation, recherche, génération),
+le débit d'indexation, la mémoire maximale du processus et la qualité de la recherche
+(recall@k et MRR) sur un jeu de questions annotées. La génération utilise un modèle factice :
+aucun appel réseau n'est fait vers Gemini.
+
+Utilisation (depuis la racine du projet) :
+    python -m benchmarks.bench_rag
+    python -m benchmarks.bench_rag --k 5 --chunk-size 500 --output resultats.json
+"""
+from typing import Dict, List, Optional  # Importation des types pour la typisation statique
+import argparse  # Importation d'argparse pour les options de la ligne de commande
+import json  # Importation du module JSON pour lire les questions et écrire les résultats
+import os  # Importation de os pour les chemins de fichiers
+import resource  # Importation de resource pour mesurer la mémoire maximale (RSS)
+import tempfile  # Importation de tempfile pour une base vectorielle jetable
+import time  # Importation de time pour mesurer les durées
+
+from rag.indexing.document_loader import DocumentLoader  # Chargement des documents HTML
+from rag.indexing.text_splitter import TextSplitter  # Découpage des documents en chunks
+from rag.indexing.vectorstore import VectorStore  # Base vectorielle
+from rag.indexing.embedding_cache import QueryEmbeddingCache  # Cache des embeddings de requêtes
+from rag.indexing.reranker import Reranker  # Re-classement par cross-encoder
+from rag.indexing.embeddings import BACKENDS, create_backend  # Moteurs d'embedding (PyTorch, int8, ONNX)
+from rag.indexing.mmap_store import DTYPES  # Précisions du stockage projeté en mémoire
+from rag.chat.chatbot import Chatbot  # Construction du prompt et génération
+from rag.chat.llm_client import StubLLMClient  # Modèle factice : aucun appel réseau
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "questions.jsonl")  # Jeu de questions annotées par défaut
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Calcule un percentile par interpolation linéaire.
+
+    Args:
+        values (List[float]): Valeurs mesurées
+        p (float): Percentile souhaité, entre 0 et 100
+
+    Returns:
+        float: Valeur du percentile (0.0 si aucune mesure)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """
+    Résume une série de durées (en secondes) en millisecondes.
+
+    Args:
+        durations (List[float]): Durées mesurées en secondes
+
+    Returns:
+        Dict[str, float]: Nombre de mesures, p50, p95, p99 et maximum en millisecondes
+    """
+    return {
+        'n': len(durations),
+        'p50_ms': percentile(durations, 50) * 1000,
+        'p95_ms': percentile(durations, 95) * 1000,
+        'p99_ms': percentile(durations, 99) * 1000,
+        'max_ms': max(durations) * 1000 if durations else 0.0
+    }
+
+def peak_rss_mb() -> float:
+    """Retourne la mémoire résidente maximale du processus en Mo (ru_maxrss est en Ko sous Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_questions(path: str) -> List[Dict]:
+    """
+    Charge le jeu de questions annotées (une question JSON par ligne).
+
+    Args:
+        path (str): Chemin du fichier JSONL
+
+    Returns:
+        List[Dict]: Questions avec leurs sources attendues
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def retrieval_quality(questions: List[Dict], results: List[Dict], k: int) -> Dict[str, float]:
+    """
+    Calcule le recall@k et le MRR de la recherche.
+
+    Une question est réussie si l'un des k chunks retournés provient d'une de ses sources attendues.
+
+    Args:
+        questions (List[Dict]): Questions annotées ('sources' : fichiers pertinents)
+        results (List[Dict]): Résultats de VectorStore.search, dans le même ordre
+        k (int): Nombre de chunks retournés par question
+
+    Returns:
+        Dict[str, float]: recall@k et MRR
+    """
+    hits, reciprocal_ranks = 0, []
+    for question, result in zip(questions, results):
+        sources = [metadata.get('source') for metadata in result['metadatas'][0]]
+        ranks = [rank for rank, source in enumerate(sources[:k], start=1) if source in question['sources']]
+        hits += bool(ranks)
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+    return {
+        f'recall@{k}': hits / len(questions) if questions else 0.0,
+        'mrr': sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else 0.0
+    }
+
+def run(documents_path: str, questions_path: str, k: int, repeat: int,
+        chunk_size: int, chunk_overlap: int, token_chunks: bool = False, search_mode: str = 'dense',
+        rerank_pool: int = 0, embedding_backend: str = 'torch', threads: Optional[int] = None,
+        vector_backend: str = 'chroma', vector_dtype: str = 'float32') -> Dict:
+    """
+    Exécute le banc de mesure complet.
+
+    Args:
+        documents_path (str): Dossier des documents HTML
+        questions_path (str): Fichier JSONL des questions annotées
+        k (int): Nombre de chunks récupérés par question
+        repeat (int): Nombre de répétitions des étapes rapides (chargement, découpage, recherche)
+        chunk_size (int): Taille des chunks passée au TextSplitter
+        chunk_overlap (int): Chevauchement des chunks passé au TextSplitter
+        token_chunks (bool): Si True, tailles de chunks en tokens du modèle d'embedding plutôt qu'en caractères
+        search_mode (str): Mode de recherche du VectorStore ('dense', 'lexical' ou 'hybrid')
+        rerank_pool (int): Nombre de candidats re-classés par le cross-encoder. 0 : pas de re-classement
+        embedding_backend (str): Moteur d'embedding ('torch', 'torch-int8', 'onnx' ou 'onnx-int8')
+        threads (Optional[int]): Nombre de threads de calcul des embeddings
+        vector_backend (str): Stockage des embeddings ('chroma' ou 'mmap')
+        vector_dtype (str): Précision du stockage 'mmap' ('float32', 'float16' ou 'int8')
+
+    Returns:
+        Dict: Latences par étape, débit d'indexation, mémoire maximale et qualité de la recherche
+    """
+    questions = load_questions(questions_path)
+    loader = DocumentLoader(documents_path)
+    timings: Dict[str, List[float]] = {'load': [], 'split': [], 'search': [], 'search_batch': [], 'generate': []}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Base jetable. Cache de requêtes désactivé : chaque recherche encode réellement la question
+        model_started = time.perf_counter()
+        vector_store = VectorStore(collection_name="benchmark", persist_directory=os.path.join(workdir, "chroma_db"),
+                                   query_cache=QueryEmbeddingCache(max_size=0), search_mode=search_mode,
+                                   embedding_backend=create_backend(embedding_backend, VectorStore.MODEL_NAME, threads),
+                                   backend=vector_backend, vector_dtype=vector_dtype)
+        model_load_seconds = time.perf_counter() - model_started
+        tokenizer = vector_store.embedding_model.tokenizer if token_chunks else None
+        splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, tokenizer=tokenizer)
+        # Budget de latence illimité : on mesure le coût réel du re-classement, sans repli
+        reranker = Reranker(latency_budget=float('inf'), cache_size=0) if rerank_pool else None
+
+        # Chargement et découpage, répétés pour lisser les mesures
+        for _ in range(repeat):
+            started = time.perf_counter()
+            documents = loader.load_documents()
+            timings['load'].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            chunks = splitter.split_documents(documents)
+            timings['split'].append(time.perf_counter() - started)
+
+        ingestion = vector_store.add_documents_stream(iter(chunks))
+        _ = vector_store.lexical_index  # Construction de l'index BM25 hors des mesures de recherche
+
+        # Recherche et génération (modèle factice) pour chaque question
+        chatbot = Chatbot(llm_client=StubLLMClient())  # Le prompt est construit normalement, sans appel à Gemini
+        results = []
+        for _ in range(repeat):
+            results = []
+            for question in questions:
+                started = time.perf_counter()
+                context = vector_store.search(question['question'], max(k, rerank_pool))
+                if reranker is not None:
+                    context = reranker.rerank(question['question'], context, k)
+                timings['search'].append(time.perf_counter() - started)
+                results.append(context)
+
+                started = time.perf_counter()
+                chatbot.generate_response(question['question'], context)
+                timings['generate'].append(time.perf_counter() - started)
+
+            # Toutes les questions en un lot (encodage et recherche dense groupés), ramené à une question
+            started = time.perf_counter()
+            vector_store.search_batch([question['question'] for question in questions], max(k, rerank_pool))
+            timings['search_batch'].append((time.perf_counter() - started) / max(len(questions), 1))
+
+    return {
+        'config': {'k': k, 'repeat': repeat, 'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap,
+                   'length_unit': splitter.length_unit, 'search_mode': search_mode, 'embedding_backend': embedding_backend,
+                   'rerank_pool': rerank_pool, 'vector_backend': vector_backend, 'vector_dtype': vector_dtype,
+                   'documents': len(documents), 'chunks': len(chunks), 'questions': len(questions)},
+        'latency': {stage: summarize(durations) for stage, durations in timings.items()},
+        'model_load_s': model_load_seconds,
+        'ingestion': {'chunks': ingestion['processed'], 'seconds': ingestion['seconds'],
+                      'chunks_per_second': ingestion['chunks_per_second']},
+        'peak_rss_mb': peak_rss_mb(),
+        'retrieval': retrieval_quality(questions, results, k)
+    }
+
+def print_report(report: Dict) -> None:
+    """Affiche le rapport du banc de mesure sous forme de tableau lisible."""
+    config = report['config']
+    print(f"Corpus : {config['documents']} documents, {config['chunks']} chunks, {config['questions']} questions "
+          f"(k={config['k']}, chunk_size={config['chunk_size']}, chunk_overlap={config['chunk_overlap']} "
+          f"en {config['length_unit']}, recherche {config['search_mode']}, re-classement de {config['rerank_pool']} candidats, "
+          f"stockage {config['vector_backend']})")
+    print(f"{'étape':<10}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in report['latency'].items():
+        print(f"{stage:<10}{stats['n']:>6}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    ingestion = report['ingestion']
+    print(f"Chargement du modèle ({config['embedding_backend']}) : {report['model_load_s']:.2f} s")
+    print(f"Indexation : {ingestion['chunks']} chunks en {ingestion['seconds']:.2f} s "
+          f"({ingestion['chunks_per_second']:.1f} chunks/s)")
+    print(f"Mémoire maximale (RSS) : {report['peak_rss_mb']:.0f} Mo")
+    print("Qualité : " + ", ".join(f"{name} = {value:.3f}" for name, value in report['retrieval'].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de mesure hors ligne du pipeline RAG")
+    parser.add_argument('--documents', default="documents", help="Dossier des documents HTML")
+    parser.add_argument('--questions', default=QUESTIONS_PATH, help="Fichier JSONL des questions annotées")
+    parser.add_argument('--k', type=int, default=3, help="Nombre de chunks récupérés par question")
+    parser.add_argument('--repeat', type=int, default=5, help="Nombre de répétitions des étapes rapides")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Taille des chunks")
+    parser.add_argument('--chunk-overlap', type=int, default=200, help="Chevauchement des chunks")
+    parser.add_argument('--token-chunks', action='store_true',
+                        help="Tailles de chunks en tokens du modèle d'embedding (sinon en caractères)")
+    parser.add_argument('--search-mode', default='dense', choices=VectorStore.SEARCH_MODES,
+                        help="Mode de recherche : embeddings, BM25 ou fusion des deux")
+    parser.add_argument('--rerank-pool', type=int, default=0,
+                        help="Nombre de candidats re-classés par le cross-encoder (0 : désactivé)")
+    parser.add_argument('--embedding-backend', default='torch', choices=sorted(BACKENDS),
+                        help="Moteur d'embedding")
+    parser.add_argument('--threads', type=int, help="Nombre de threads de calcul des embeddings")
+    parser.add_argument('--vector-backend', default='chroma', choices=VectorStore.BACKENDS,
+                        help="Stockage des embeddings : ChromaDB (HNSW) ou fichier projeté en mémoire (recherche exacte)")
+    parser.add_argument('--vector-dtype', default='float32', choices=DTYPES,
+                        help="Précision des embeddings du stockage mmap")
+    parser.add_argument('--output', help="Fichier JSON où écrire le rapport complet")
+    args = parser.parse_args()
+
+    report = run(args.documents, args.questions, args.k, args.repeat, args.chunk_size, args.chunk_overlap,
+                 args.token_chunks, args.search_mode, args.rerank_pool,
+                 args.embedding_backend, args.threads, args.vector_backend, args.vector_dtype)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Mesure du temps de démarrage à froid de l'application et des modules du paquet rag.
+
+Chaque scénario est exécuté dans un nouvel interpréteur Python (comme au démarrage d'un pod) :
+import d'un module rag, ou rendu d'une page Streamlit avec streamlit.testing (écran de
+connexion, page À propos, page Statistiques). Pour chacun, on relève la durée et les
+bibliothèques lourdes (PyTorch, sentence-transformers, ChromaDB, Google AI) effectivement
+chargées. Les scénarios qui doivent rester légers échouent si l'une d'elles est importée.
+
+Utilisation (depuis la racine du projet) :
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 5 --max-seconds 3 --output demarrage.json
+"""
+from typing import Dict, List  # Importation des types pour la typisation statique
+import argparse  # Importation d'argparse pour les options de la ligne de commande
+import json  # Importation du module JSON pour échanger les mesures avec les sous-processus
+import os  # Importation de os pour les chemins de fichiers et l'environnement
+import subprocess  # Importation de subprocess pour démarrer un interpréteur neuf par mesure
+import sys  # Importation de sys pour connaître l'interpréteur courant
+import tempfile  # Importation de tempfile pour un dossier de travail jetable (base de feedback)
+import time  # Importation de time pour mesurer les durées
+
+from benchmarks.bench_rag import percentile  # Même calcul de percentile que le banc principal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Racine du projet
+
+# Bibliothèques dont le chargement domine le démarrage
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'transformers', 'chromadb', 'onnxruntime', 'google.generativeai')
+
+# Scénario -> (code exécuté dans le sous-processus, doit rester léger)
+SCENARIOS = {
+    'import rag.feedback': ("import rag.feedback.feedback_manager", True),
+    'import rag.monitoring': ("import rag.monitoring.tracing", True),
+    'import rag.chat': ("import rag.chat.chatbot, rag.chat.answer_cache, rag.chat.context_builder", True),
+    'import rag.indexing': ("import rag.indexing.vectorstore, rag.indexing.indexer, rag.indexing.reranker", True),
+    'import rag.engine': ("import rag.engine.retrieval_engine, rag.engine.async_service", True),
+    'page connexion': ("render('app.py')", True),
+    'page À propos': ("render('pages/1_A_propos.py')", True),
+    'page Statistiques': ("render('pages/2_Statistiques.py')", True),
+}
+
+# Code commun exécuté dans chaque sous-processus : rendu d'une page et rapport des modules chargés
+CHILD_TEMPLATE = """
+import json, os, sys, time
+started = time.perf_counter()
+
+def render(path):
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join({root!r}, path), default_timeout=120)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+{code}
+print(json.dumps({{
+    'seconds': time.perf_counter() - started,
+    'heavy': [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+def measure(code: str, workdir: str) -> Dict:
+    """
+    Exécute un scénario dans un nouvel interpréteur.
+
+    Args:
+        code (str): Code Python du scénario
+        workdir (str): Dossier de travail du sous-processus (les fichiers créés par les pages y restent)
+
+    Returns:
+        Dict: Durée totale du processus, durée du scénario seul et modules lourds chargés
+    """
+    script = CHILD_TEMPLATE.format(root=ROOT, code=code, heavy=HEAVY_MODULES)
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', script], cwd=workdir, env=env,
+                               capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "échec du scénario")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {'process_s': wall, 'scenario_s': result['seconds'], 'heavy': result['heavy']}
+
+def run(repeat: int) -> Dict[str, Dict]:
+    """
+    Mesure tous les scénarios.
+
+    Args:
+        repeat (int): Nombre de démarrages par scénario
+
+    Returns:
+        Dict[str, Dict]: Par scénario, médiane et maximum des durées, modules lourds chargés et verdict
+    """
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:  # La page Statistiques y crée sa base de feedback
+        for name, (code, must_be_light) in SCENARIOS.items():
+            try:
+                runs = [measure(code, workdir) for _ in range(repeat)]
+            except RuntimeError as error:
+                report[name] = {'error': str(error), 'ok': False}
+                continue
+            process_times: List[float] = [sample['process_s'] for sample in runs]
+            heavy = sorted({module for sample in runs for module in sample['heavy']})
+            report[name] = {
+                'process_p50_s': percentile(process_times, 50),
+                'process_max_s': max(process_times),
+                'scenario_p50_s': percentile([sample['scenario_s'] for sample in runs], 50),
+                'heavy_modules': heavy,
+                'ok': not (must_be_light and heavy)
+            }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de démarrage à froid de l'application")
+    parser.add_argument('--repeat', type=int, default=3, help="Nombre de démarrages par scénario")
+    parser.add_argument('--max-seconds', type=float,
+                        help="Durée maximale (médiane, processus complet) acceptée pour chaque scénario")
+    parser.add_argument('--output', help="Fichier JSON où écrire le rapport complet")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    print(f"{'scénario':<22}{'p50 s':>8}{'max s':>8}{'script s':>10}  modules lourds")
+    for name, stats in report.items():
+        if 'error' in stats:
+            print(f"{name:<22}  ERREUR : {stats['error']}")
+            continue
+        if args.max_seconds is not None and stats['process_p50_s'] > args.max_seconds:
+            stats['ok'] = False
+        print(f"{name:<22}{stats['process_p50_s']:>8.2f}{stats['process_max_s']:>8.2f}"
+              f"{stats['scenario_p50_s']:>10.2f}  {', '.join(stats['heavy_modules']) or '-'}"
+              f"{'' if stats['ok'] else '  <- RÉGRESSION'}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if not all(stats['ok'] for stats in report.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,78 @@
 import streamlit as st  # Importation de la bibliothèque Streamlit pour créer une interface web interactive
 import plotly.graph_objects as go  # Importation de Plotly pour créer des graphiques interactifs
-from rag.feedback.feedback_manager import FeedbackManager  # Importation du gestionnaire de feedback depuis le module 'rag'
+from datetime import datetime, timezone  # Importation de datetime pour convertir les intervalles en dates
+import os  # Importation de os pour raccourcir les noms des documents sources
+import time  # Importation de time pour calculer le début de la période affichée
+from rag.feedback.feedback_manager import get_feedback_manager  # Importation du gestionnaire de feedback partagé depuis le module 'rag'
+from rag.monitoring.tracing import get_tracer  # Importation du traceur partagé (durées des étapes des réponses)
+
+# Périodes proposées pour l'évolution : libellé -> (durée en secondes, granularité des agrégats)
+PERIODS = {
+    "48 dernières heures": (48 * 3600, 'hour'),
+    "7 derniers jours": (7 * 86400, 'day'),
+    "30 derniers jours": (30 * 86400, 'day'),
+    "Depuis le début": (None, 'day'),
+}
+
+# Périodes proposées pour les latences : libellé -> durée en secondes (toujours bornée, la base des traces grossit)
+TRACE_PERIODS = {
+    "Dernière heure": 3600,
+    "24 dernières heures": 86400,
+    "7 derniers jours": 7 * 86400,
+}
+
+def show_trends(feedback_manager):
+    """
+    Affiche l'évolution des retours et la satisfaction par document source sur une période.
+
+    Args:
+        feedback_manager (FeedbackManager): Gestionnaire de feedback partagé
+    """
+    st.subheader("Évolution")
+    period = st.selectbox("Période", list(PERIODS), index=1)  # Choix de la période (7 jours par défaut)
+    duration, granularity = PERIODS[period]
+    since = int(time.time()) - duration if duration else None
+
+    # Une ligne par heure ou par jour, lue dans les agrégats (pas de parcours de tous les retours)
+    series = feedback_manager.get_timeseries(granularity, since=since)
+    if not series:
+        st.info("Aucun retour sur cette période.")
+        return
+
+    dates = [datetime.fromtimestamp(bucket, timezone.utc) for bucket, _, _ in series]
+    positives = [positive for _, positive, _ in series]
+    negatives = [negative for _, _, negative in series]
+    rates = [positive / (positive + negative) * 100 for _, positive, negative in series]
+
+    # Barres empilées des retours et courbe du taux de satisfaction (axe de droite)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=dates, y=positives, name='Satisfait', marker_color='#00CC96'))
+    fig.add_trace(go.Bar(x=dates, y=negatives, name='Non satisfait', marker_color='#EF553B'))
+    fig.add_trace(go.Scatter(x=dates, y=rates, name='Satisfaction (%)', yaxis='y2', mode='lines+markers',
+                             line_color='#636EFA'))
+    fig.update_layout(
+        title="Retours par heure" if granularity == 'hour' else "Retours par jour",
+        barmode='stack',
+        yaxis=dict(title="Retours"),
+        yaxis2=dict(title="Satisfaction (%)", overlaying='y', side='right', range=[0, 100]),
+        legend=dict(orientation='h')
+    )
+    st.plotly_chart(fig)
+
+    # Satisfaction par document source (un retour compte pour chaque document de sa réponse)
+    sources = feedback_manager.get_source_statistics(since=since)
+    if sources:
+        names = sorted(sources, key=lambda name: sum(sources[name]), reverse=True)
+        labels = [os.path.splitext(name)[0] for name in names]
+        fig = go.Figure(data=[
+            go.Bar(y=labels, x=[sources[name][0] for name in names], name='Satisfait',
+                   orientation='h', marker_color='#00CC96'),
+            go.Bar(y=labels, x=[sources[name][1] for name in names], name='Non satisfait',
+                   orientation='h', marker_color='#EF553B')
+        ])
+        fig.update_layout(title="Retours par document source", barmode='stack',
+                          yaxis=dict(autorange='reversed'), legend=dict(orientation='h'))
+        st.plotly_chart(fig)
 
 def main():
     # Configuration de la page Streamlit
@@ -13,7 +85,7 @@ def main():
     st.title("Statistiques de Satisfaction")  # Titre principal de la page
 
     # Récupération des statistiques de feedback via FeedbackManager
-    feedback_manager = FeedbackManager()  # Création d'une instance de FeedbackManager pour accéder aux données
+    feedback_manager = get_feedback_manager()  # Gestionnaire partagé par le processus : connexion déjà ouverte, base déjà initialisée
     positive, negative = feedback_manager.get_statistics()  # Récupération du nombre de retours positifs et négatifs
     total = positive + negative  # Calcul du nombre total de retours
 
@@ -49,10 +121,44 @@ def main():
             st.metric("Retours positifs", positive)  # Affichage du nombre de retours positifs
         with col3:
             st.metric("Retours négatifs", negative)  # Affichage du nombre de retours négatifs
+
+        show_trends(feedback_manager)  # Évolution dans le temps et détail par document source
     else:
         # Si aucun retour utilisateur n'est enregistré, afficher un message informatif
         st.info("Aucun retour utilisateur n'a encore été enregistré.")
 
+    show_latencies()  # Durées des étapes des réponses (indépendantes des retours)
+
+def show_latencies():
+    """Affiche les percentiles de latence de chaque étape des réponses, d'après les traces conservées."""
+    st.subheader("Latence par étape")
+    tracer = get_tracer()
+    if not tracer.enabled:
+        st.info("Le traçage est désactivé (RAG_TRACING=0).")
+        return
+    period = st.selectbox("Période des traces", list(TRACE_PERIODS), index=1)  # 24 heures par défaut
+    # Seules les traces de la période sont lues (requête sur l'index de date de la base)
+    stages = tracer.stage_percentiles(since=time.time() - TRACE_PERIODS[period])
+    if not stages:
+        st.info("Aucune trace sur cette période : les durées apparaissent après les premières questions.")
+        return
+
+    names = list(stages)
+    # Percentiles côte à côte pour chaque étape : la médiane et la queue de distribution (p95, p99)
+    fig = go.Figure(data=[
+        go.Bar(x=names, y=[stages[name][key] for name in names], name=key)
+        for key in ('p50', 'p95', 'p99')
+    ])
+    fig.update_layout(title="Percentiles de latence (ms)", barmode='group', yaxis=dict(title="ms"))
+    st.plotly_chart(fig)
+
+    # Tableau détaillé : nombre de mesures et percentiles arrondis à 0,1 ms
+    st.dataframe([
+        {'Étape': name, 'Mesures': stats['count'],
+         **{key: round(stats[key], 1) for key in ('p50', 'p95', 'p99')}}
+        for name, stats in stages.items()
+    ], hide_index=True)
+
 # Exécution de la fonction main lorsque le script est exécuté
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+from collections import OrderedDict  # Importation d'OrderedDict pour l'éviction des plus anciennes entrées
+from typing import Dict, List, Optional, Sequence, Tuple  # Importation des types pour la typisation statique
+import itertools  # Importation d'itertools pour numéroter les entrées
+import threading  # Importation des verrous : le cache est partagé entre les sessions
+import time  # Importation de time pour l'expiration des entrées (TTL)
+
+import numpy as np  # Importation de numpy pour comparer les embeddings
+
+class AnswerCache:
+    """
+    Cache sémantique des réponses du chatbot.
+
+    Une réponse est réutilisée si la nouvelle question a récupéré exactement les mêmes chunks
+    et si son embedding est suffisamment proche (similarité cosinus) d'une question déjà traitée.
+    Les entrées expirent après un délai (TTL), les plus anciennes sont évincées au-delà d'une
+    taille maximale, et tout le cache est vidé quand le corpus indexé change.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600.0, max_size: int = 512):
+        """
+        Initialise le cache.
+
+        Args:
+            similarity_threshold (float): Similarité cosinus minimale pour réutiliser une réponse
+            ttl_seconds (float): Durée de vie d'une réponse en secondes
+            max_size (int): Nombre maximal de réponses conservées
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.corpus_version: Optional[str] = None  # Version du corpus pour laquelle les réponses sont valides
+        self.hits = 0  # Nombre de réponses servies depuis le cache
+        self.misses = 0  # Nombre de questions envoyées au modèle
+        # Identifiant -> (embedding normalisé, clé des chunks, réponse, date de création)
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Tuple[str, ...], str, float]]" = OrderedDict()
+        self._by_chunks: Dict[Tuple[str, ...], List[int]] = {}  # Clé des chunks -> identifiants des entrées
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        """Normalise un embedding pour que le produit scalaire soit une similarité cosinus."""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _remove(self, entry_id: int) -> None:
+        """Retire une entrée du cache et de l'index par chunks (verrou déjà pris)."""
+        _, chunk_key, _, _ = self._entries.pop(entry_id)
+        ids = self._by_chunks[chunk_key]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_chunks[chunk_key]
+
+    def get(self, query_embedding: np.ndarray, chunk_ids: Sequence[str]) -> Optional[str]:
+        """
+        Cherche une réponse réutilisable pour une question.
+
+        Args:
+            query_embedding (np.ndarray): Embedding de la question
+            chunk_ids (Sequence[str]): Identifiants des chunks récupérés pour la question
+
+        Returns:
+            Optional[str]: Réponse en cache, ou None si aucune n'est assez proche
+        """
+        query_embedding = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._by_chunks.get(tuple(chunk_ids), ())):
+                embedding, _, _, created_at = self._entries[entry_id]
+                if now - created_at > self.ttl_seconds:  # Entrée expirée : supprimée au passage
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(embedding, query_embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[best_id][2]
+
+    def put(self, query_embedding: np.ndarray, chunk_ids: Sequence[str], answer: str) -> None:
+        """
+        Mémorise la réponse générée pour une question.
+
+        Args:
+            query_embedding (np.ndarray): Embedding de la question
+            chunk_ids (Sequence[str]): Identifiants des chunks utilisés pour la réponse
+            answer (str): Réponse générée par le modèle
+        """
+        entry = (self._normalize(query_embedding), tuple(chunk_ids), answer, time.time())
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._by_chunks.setdefault(entry[1], []).append(entry_id)
+            while len(self._entries) > self.max_size:  # Éviction de la plus ancienne réponse
+                self._remove(next(iter(self._entries)))
+
+    def set_corpus_version(self, version: str) -> None:
+        """
+        Indique la version courante du corpus ; le cache est vidé si elle a changé.
+
+        Args:
+            version (str): Empreinte du corpus indexé
+        """
+        with self._lock:
+            if version != self.corpus_version:
+                self._entries.clear()
+                self._by_chunks.clear()
+                self.corpus_version = version
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            Dict[str, float]: Taille, succès, échecs et taux de succès
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -1,44 +1,139 @@
-import google.generativeai as genai  # Importation de la bibliothèque Google AI pour utiliser le modèle génératif
-from typing import List, Dict  # Importation des types pour la typisation statique (List et Dict)
+from typing import Dict, Iterator, Optional  # Importation des types pour la typisation statique
+import time  # Importation de time pour mesurer le délai avant le premier morceau de réponse
+
+from rag.chat.context_builder import ContextBuilder  # Contexte compact (textes seuls, dédupliqués, budget de tokens)
+from rag.chat.llm_client import GeminiClient, LLMClient, ResilientLLMClient  # Clients des modèles de langage (Gemini, modèle factice)
+from rag.monitoring.tracing import span  # Durée des appels au modèle (sans effet hors d'une trace)
 
 class Chatbot:
     """
     Classe principale du chatbot utilisant Google AI.
     """
+
+    # Ajouté à une réponse en flux coupée par une panne du modèle
+    INTERRUPTED_NOTICE = "\n\n*(Réponse interrompue : le modèle ne répond plus. Veuillez reposer la question.)*"
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: Optional[str] = None, context_builder: Optional[ContextBuilder] = None,
+                 llm_client: Optional[LLMClient] = None):
         """
         Initialise le chatbot.
         
         Args:
-            api_key (str): Clé API Google AI
+            api_key (Optional[str]): Clé API Google AI (inutile si llm_client est fourni)
+            context_builder (Optional[ContextBuilder]): Construction du contexte du prompt. Par défaut un budget de 1200 tokens
+            llm_client (Optional[LLMClient]): Client du modèle de langage. Par défaut Gemini ('gemini-pro') avec api_key,
+                avec délais, reprises, quota et disjoncteur (ResilientLLMClient)
+        """
+        self.llm_client = llm_client or ResilientLLMClient(GeminiClient(api_key))
+        self.context_builder = context_builder or ContextBuilder()
+        
+    def _build_prompt(self, query: str, context: Dict, history: str = '') -> str:
+        """
+        Construit le prompt envoyé au modèle à partir de la requête et du contexte.
+        
+        Seuls les textes des chunks, étiquetés et dédupliqués, sont insérés : ni identifiants,
+        ni distances, ni structure ChromaDB.
+        
+        Args:
+            query (str): Question de l'utilisateur
+            context (Dict): Résultats de la recherche dans la base vectorielle
+            history (str): Échanges précédents de la conversation (voir ConversationSession), vide pour une question isolée
+            
+        Returns:
+            str: Prompt complet
         """
-        genai.configure(api_key=api_key)  # Configuration de l'API Google AI avec la clé API fournie
-        self.model = genai.GenerativeModel('gemini-pro')  # Initialisation du modèle génératif 'gemini-pro' de Google AI
+        # L'historique précède le contexte : le modèle peut résoudre "et pour ce contrat ?" sans que la question soit réécrite
+        conversation = f"Conversation précédente :\n{history}\n\n" if history else ""
+        return (
+            "En tant qu'assistant spécialisé dans les documents d'assurance, utilise le contexte suivant "
+            "pour répondre à la question. Réponds en français, de manière concise et précise.\n\n"
+            f"{conversation}"
+            f"Contexte :\n{self.context_builder.build(context)}\n\n"
+            f"Question : {query}"
+        )
         
-    def generate_response(self, query: str, context: List[Dict]) -> str:
+    def generate_response(self, query: str, context: Dict, history: str = '') -> str:
         """
         Génère une réponse à partir de la requête et du contexte.
         
         Args:
             query (str): Question de l'utilisateur
-            context (List[Dict]): Contexte récupéré de la base vectorielle
+            context (Dict): Résultats de la recherche dans la base vectorielle
+            history (str): Échanges précédents de la conversation (vide pour une question isolée)
             
         Returns:
             str: Réponse générée
         """
         # Construction du prompt à envoyer au modèle génératif
-        prompt = f"""En tant qu'assistant spécialisé dans les documents d'assurance, utilise le contexte suivant 
-        pour répondre à la question. Réponds en français, de manière concise et précise.
+        prompt = self._build_prompt(query, context, history)
         
-        Contexte:
-        {context}  # Le contexte est inséré ici, il est attendu sous forme de liste de dictionnaires
+        # Appel du modèle génératif pour générer la réponse
+        with span('generate', prompt_tokens=self.context_builder.count_tokens(prompt)) as current:
+            text = self.llm_client.generate(prompt)
+            current.set(response_chars=len(text))
         
-        Question: {query}  # La question de l'utilisateur est insérée ici
+        # Retour de la réponse générée par le modèle (texte sous forme de chaîne de caractères)
+        return text
+    
+    async def generate_response_async(self, query: str, context: Dict, history: str = '') -> str:
         """
+        Version asynchrone de generate_response : l'appel réseau ne bloque pas la boucle d'événements.
         
-        # Appel du modèle génératif pour générer la réponse
-        response = self.model.generate_content(prompt)
+        Args:
+            query (str): Question de l'utilisateur
+            context (Dict): Résultats de la recherche dans la base vectorielle
+            history (str): Échanges précédents de la conversation (vide pour une question isolée)
+            
+        Returns:
+            str: Réponse générée
+        """
+        prompt = self._build_prompt(query, context, history)
+        with span('generate', prompt_tokens=self.context_builder.count_tokens(prompt)) as current:
+            text = await self.llm_client.generate_async(prompt)
+            current.set(response_chars=len(text))
+        return text
+    
+    def generate_response_stream(self, query: str, context: Dict, history: str = '') -> Iterator[str]:
+        """
+        Génère une réponse en flux : les morceaux de texte sont produits dès que le modèle les envoie.
         
-        # Retour de la réponse générée par le modèle (texte sous forme de chaîne de caractères)
-        return response.text
+        Args:
+            query (str): Question de l'utilisateur
+            context (Dict): Résultats de la recherche dans la base vectorielle
+            history (str): Échanges précédents de la conversation (vide pour une question isolée)
+            
+        Yields:
+            str: Morceaux successifs de la réponse
+        """
+        prompt = self._build_prompt(query, context, history)
+        # Durée mesurée jusqu'au dernier morceau consommé, avec le délai avant le premier (latence perçue)
+        with span('generate', prompt_tokens=self.context_builder.count_tokens(prompt), stream=True) as current:
+            started = time.perf_counter()
+            chars = 0
+            # Appel du modèle en mode flux : la réponse arrive par morceaux
+            for part in self.llm_client.generate_stream(prompt):
+                if not chars:
+                    current.set(first_chunk_ms=(time.perf_counter() - started) * 1000)
+                chars += len(part)
+                yield part
+            current.set(response_chars=chars)
+    
+    def fallback_response(self, context: Dict) -> str:
+        """
+        Réponse de repli quand le modèle est indisponible (LLMUnavailableError) : les extraits
+        les plus pertinents, tels qu'ils auraient été envoyés au modèle.
+        
+        Args:
+            context (Dict): Résultats de la recherche dans la base vectorielle
+            
+        Returns:
+            str: Message d'indisponibilité suivi des extraits
+        """
+        passages = self.context_builder.build(context)
+        if not passages:
+            return "Le service de réponse est momentanément indisponible et aucun document pertinent n'a été trouvé."
+        return (
+            "Le service de réponse est momentanément indisponible. "
+            "Voici les extraits des documents les plus pertinents pour votre question :\n\n"
+            f"{passages}"
+        )
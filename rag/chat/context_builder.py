@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional, Tuple  # Importation des types pour la typisation statique
+import os  # Importation de os pour raccourcir les noms de fichiers sources
+
+from rag.monitoring.tracing import span  # Taille du contexte construit (sans effet hors d'une trace)
+
+class ContextBuilder:
+    """
+    Construit le contexte compact envoyé au modèle à partir des résultats de la recherche.
+
+    Seul le texte des chunks est conservé (pas les identifiants, distances ni listes imbriquées
+    de ChromaDB). Les chunks sont gardés dans l'ordre de pertinence de la recherche, les
+    doublons et les chevauchements entre chunks voisins d'un même document sont retirés, et
+    le total respecte un budget de tokens. Chaque extrait porte une étiquette courte
+    ("[1] Vol - 2. Prise en charge") que le modèle peut citer.
+    """
+
+    MIN_PASSAGE_CHARS = 40  # En dessous, un reste de chunk après suppression du chevauchement n'apporte rien
+    MIN_OVERLAP_CHARS = 20  # Chevauchement minimal pour être attribué au découpage (et non au hasard d'une ponctuation)
+
+    def __init__(self, max_tokens: int = 1200, chars_per_token: float = 4.0):
+        """
+        Initialise le constructeur de contexte.
+
+        Args:
+            max_tokens (int): Budget de tokens du contexte (étiquettes comprises)
+            chars_per_token (float): Nombre moyen de caractères par token, pour estimer la taille sans tokenizer
+        """
+        self.max_tokens = max_tokens
+        self.chars_per_token = chars_per_token
+
+    def count_tokens(self, text: str) -> int:
+        """Estime le nombre de tokens d'un texte (arrondi au supérieur)."""
+        return int(len(text) / self.chars_per_token) + 1
+
+    @staticmethod
+    def label(metadata: Optional[Dict]) -> str:
+        """
+        Étiquette courte d'un chunk : nom court du document et, s'il est connu, titre de section.
+
+        Args:
+            metadata (Optional[Dict]): Métadonnées du chunk
+
+        Returns:
+            str: Étiquette (ex : "Vol - 2. Prise en charge selon les contrats")
+        """
+        metadata = metadata or {}
+        name = os.path.splitext(metadata.get('source', 'document'))[0]
+        name = name.rsplit(' - ', 1)[-1]  # "OptiSecure Assurances - Vol" -> "Vol"
+        section = metadata.get('section')
+        return f"{name} - {section}" if section else name
+
+    @staticmethod
+    def _overlap(left: str, right: str) -> int:
+        """
+        Longueur du plus long suffixe de left qui est aussi un préfixe de right.
+
+        Args:
+            left (str): Texte qui précède
+            right (str): Texte qui suit
+
+        Returns:
+            int: Nombre de caractères communs (0 si aucun chevauchement significatif)
+        """
+        for size in range(min(len(left), len(right)), ContextBuilder.MIN_OVERLAP_CHARS - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    def _passages(self, results: Dict) -> List[Tuple[str, Dict]]:
+        """
+        Extrait les textes des résultats de recherche, sans doublons ni chevauchements.
+
+        Args:
+            results (Dict): Résultats de VectorStore.search (format ChromaDB, une seule requête)
+
+        Returns:
+            List[Tuple[str, Dict]]: (texte, métadonnées) dans l'ordre de pertinence
+        """
+        documents = (results.get('documents') or [[]])[0]
+        metadatas = (results.get('metadatas') or [[None] * len(documents)])[0]
+
+        kept: List[Tuple[str, Dict]] = []
+        seen = set()
+        for text, metadata in zip(documents, metadatas):
+            text = (text or '').strip()
+            metadata = metadata or {}
+            if not text or text in seen:  # Chunk vide ou déjà retenu
+                continue
+            seen.add(text)
+
+            # Chunks voisins d'un même document : on retire la partie déjà présente dans un extrait retenu
+            for other, other_metadata in kept:
+                if other_metadata.get('source') != metadata.get('source'):
+                    continue
+                if text in other:  # Entièrement contenu dans un extrait retenu
+                    text = ''
+                    break
+                head = self._overlap(other, text)  # Début du chunk = fin d'un extrait retenu
+                if head:
+                    text = text[head:].strip()
+                tail = self._overlap(text, other)  # Fin du chunk = début d'un extrait retenu
+                if tail:
+                    text = text[:-tail].strip()
+            if len(text) >= self.MIN_PASSAGE_CHARS:
+                kept.append((text, metadata))
+        return kept
+
+    def build(self, results: Dict) -> str:
+        """
+        Construit le texte du contexte à insérer dans le prompt.
+
+        Args:
+            results (Dict): Résultats de VectorStore.search (format ChromaDB, une seule requête)
+
+        Returns:
+            str: Extraits étiquetés, séparés par une ligne vide (chaîne vide si aucun résultat)
+        """
+        with span('context') as current:
+            blocks = []
+            budget = self.max_tokens
+            for text, metadata in self._passages(results):
+                block = f"[{len(blocks) + 1}] {self.label(metadata)}\n{text}"
+                cost = self.count_tokens(block)
+                if cost > budget:
+                    if blocks:  # Extrait trop long pour le reste du budget : on essaie les suivants, plus courts
+                        continue
+                    # Le meilleur extrait est toujours gardé, tronqué au budget sur une limite de mot
+                    block = block[:int(budget * self.chars_per_token)].rsplit(' ', 1)[0]
+                    cost = budget
+                blocks.append(block)
+                budget -= cost
+            current.set(chunks=len(blocks), tokens=self.max_tokens - budget)
+        return "\n\n".join(blocks)
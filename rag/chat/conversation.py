@@ -0,0 +1,207 @@
+"""
+Mémoire d'une conversation : les questions de relance ("et la franchise ?") sont comprises sans être reformulées.
+
+Les derniers échanges sont gardés dans un historique borné en tokens ; les plus anciens sont
+condensés dans un résumé glissant, lui aussi borné : la taille du prompt reste constante quelle
+que soit la longueur de la conversation. Aucun appel supplémentaire au modèle n'est fait : la
+réécriture des relances et le résumé sont extractifs.
+"""
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple  # Importation des types pour la typisation statique
+import re  # Importation du module regex pour repérer les marques de relance
+
+import numpy as np  # Importation de numpy pour le typage des embeddings
+
+from rag.chat.chatbot import Chatbot  # Génération des réponses
+from rag.chat.llm_client import LLMUnavailableError  # Modèle en panne : réponse de repli avec les extraits
+from rag.indexing.bm25_index import tokenize  # Termes d'une question (sans accents ni mots outils)
+from rag.indexing.products import detect_products  # Produits cités dans une question
+
+if TYPE_CHECKING:  # Le moteur importe lui-même le package chat : pas d'import circulaire à l'exécution
+    from rag.engine.retrieval_engine import RetrievalEngine
+
+# Début ou mots d'une question qui renvoient à l'échange précédent
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(et|mais|alors|aussi|sinon|dans ce cas|et si|pareil|idem)\b"
+    r"|\b(ce contrat|cette garantie|cette formule|celui-ci|celle-ci|celui-là|celle-là|ça|cela|le même|la même|dessus)\b",
+    re.IGNORECASE
+)
+# Mots interrogatifs : ils ne disent rien du sujet de la question
+QUESTION_TERMS = frozenset("comment combien pourquoi quand quoi lequel laquelle lesquels lesquelles faut peut puis".split())
+
+class ConversationSession:
+    """
+    Conversation d'un utilisateur avec le moteur partagé : historique, réécriture des relances et
+    réutilisation des chunks déjà récupérés.
+
+    Une relance est une question qui ne cite pas d'autre produit que le sujet en cours et qui est
+    courte ou renvoie explicitement à l'échange précédent. Elle est recherchée sous une forme autonome (la relance suivie de la
+    question qui a ouvert le sujet). Si les chunks de l'échange précédent contiennent déjà ses
+    termes, ils sont réutilisés sans nouvelle recherche.
+
+    Une instance par session Streamlit (non partagée entre threads).
+    """
+
+    SHORT_QUESTION_TERMS = 2  # Jusqu'à ce nombre de termes (hors mots outils), une question sans produit est une relance
+
+    def __init__(self, engine: "RetrievalEngine", chatbot: Chatbot, k: int = 3, history_tokens: int = 600,
+                 summary_tokens: int = 200):
+        """
+        Initialise la conversation.
+
+        Args:
+            engine (RetrievalEngine): Moteur de recherche partagé
+            chatbot (Chatbot): Chatbot de la session
+            k (int): Nombre de chunks récupérés par question
+            history_tokens (int): Budget de tokens des derniers échanges repris tels quels dans le prompt
+            summary_tokens (int): Budget de tokens du résumé des échanges plus anciens
+        """
+        self.engine = engine
+        self.chatbot = chatbot
+        self.k = k
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.turns: List[Dict] = []  # Derniers échanges, du plus ancien au plus récent
+        self.summary: List[str] = []  # Une ligne par échange sorti de l'historique
+        self.last_query: Optional[str] = None  # Forme autonome de la dernière question (recherche, retours)
+        self.last_reused = False  # True si la dernière question a réutilisé les chunks de la précédente
+
+    def reset(self) -> None:
+        """Oublie toute la conversation (nouveau sujet)."""
+        self.turns = []
+        self.summary = []
+        self.last_query = None
+        self.last_reused = False
+
+    def _count_tokens(self, text: str) -> int:
+        return self.chatbot.context_builder.count_tokens(text)
+
+    def rewrite(self, question: str) -> Tuple[str, bool]:
+        """
+        Réécrit une question de relance en question autonome pour la recherche.
+
+        Args:
+            question (str): Question telle que saisie
+
+        Returns:
+            Tuple[str, bool]: (question autonome, True si c'était une relance)
+        """
+        if not self.turns:
+            return question, False
+        # Un autre produit que celui du sujet en cours ouvre un nouveau sujet ("et la fumée ?" reste sur l'incendie)
+        products = set(detect_products(question))
+        if products and not products <= set(detect_products(self.turns[-1]['topic'])):
+            return question, False
+        terms = [term for term in tokenize(question) if term not in QUESTION_TERMS]
+        if len(terms) > self.SHORT_QUESTION_TERMS and not FOLLOW_UP_PATTERN.search(question):
+            return question, False
+        # La question qui a ouvert le sujet (et non la précédente relance) : la forme autonome reste courte
+        return f"{question.strip()} ({self.turns[-1]['topic']})", True
+
+    def _reusable(self, question: str) -> bool:
+        """Indique si les chunks du dernier échange contiennent déjà les termes de la relance."""
+        previous = self.turns[-1]['context']
+        terms = {term for term in tokenize(question) if term not in QUESTION_TERMS}
+        known = set(tokenize(' '.join((previous.get('documents') or [[]])[0])))
+        return terms <= known
+
+    def history(self) -> str:
+        """
+        Échanges précédents tels qu'insérés dans le prompt : résumé des plus anciens, puis les derniers.
+
+        Returns:
+            str: Historique (vide au premier échange)
+        """
+        blocks = []
+        if self.summary:
+            blocks.append("Résumé des échanges précédents :\n" + "\n".join(self.summary))
+        for turn in self.turns:
+            blocks.append(f"Question : {turn['question']}\nRéponse : {turn['answer']}")
+        return "\n\n".join(blocks)
+
+    @staticmethod
+    def _summarize(turn: Dict, max_chars: int = 200) -> str:
+        """Ligne de résumé d'un échange : la question et la première phrase de la réponse."""
+        answer = ' '.join(turn['answer'].split())
+        first_sentence = re.split(r'(?<=[.!?])\s', answer, maxsplit=1)[0]
+        line = f"- {turn['question']} → {first_sentence}"
+        return line if len(line) <= max_chars else line[:max_chars].rsplit(' ', 1)[0] + '…'
+
+    def _add_turn(self, question: str, standalone: str, topic: str, answer: str, context: Dict) -> None:
+        """Ajoute un échange à l'historique, en condensant les plus anciens au-delà du budget."""
+        # Une réponse très longue est tronquée : le dernier échange tient toujours dans le budget
+        max_chars = int(self.history_tokens * self.chatbot.context_builder.chars_per_token / 2)
+        if len(answer) > max_chars:
+            answer = answer[:max_chars].rsplit(' ', 1)[0] + '…'
+        self.turns.append({'question': question, 'standalone': standalone, 'topic': topic,
+                           'answer': answer, 'context': context})
+
+        def cost(turn: Dict) -> int:
+            return self._count_tokens(f"Question : {turn['question']}\nRéponse : {turn['answer']}")
+
+        while len(self.turns) > 1 and sum(cost(turn) for turn in self.turns) > self.history_tokens:
+            self.summary.append(self._summarize(self.turns.pop(0)))
+        # Résumé glissant : les lignes les plus anciennes sortent en premier
+        while self.summary and self._count_tokens("\n".join(self.summary)) > self.summary_tokens:
+            self.summary.pop(0)
+
+    def ask_stream(self, question: str) -> Tuple[Iterator[str], bool, List[str]]:
+        """
+        Répond à une question de la conversation, en flux (comme RetrievalEngine.answer_stream).
+
+        L'échange est ajouté à l'historique une fois le flux entièrement consommé. Les relances
+        ne passent pas par le cache de réponses : leur réponse dépend de l'historique. Une réponse
+        de repli (modèle indisponible) n'entre ni dans le cache ni dans l'historique.
+
+        Args:
+            question (str): Question telle que saisie
+
+        Returns:
+            Tuple[Iterator[str], bool, List[str]]: (flux de morceaux de réponse, True si la réponse provient
+                du cache, documents sources du contexte)
+        """
+        standalone, follow_up = self.rewrite(question)
+        topic = self.turns[-1]['topic'] if follow_up else question
+        self.last_query = standalone
+        self.last_reused = follow_up and self._reusable(question)
+
+        query_embedding: Optional[np.ndarray] = None
+        if self.last_reused:
+            context = self.turns[-1]['context']  # Même sujet, termes déjà couverts : pas de nouvelle recherche
+        else:
+            query_embedding, context, chunk_ids = self.engine.retrieve(standalone, self.k)
+        sources = self.engine.context_sources(context)
+
+        if not follow_up:
+            cached = self.engine.cached_answer(query_embedding, chunk_ids)
+            if cached is not None:
+                self._add_turn(question, standalone, topic, cached, context)
+                return iter([cached]), True, sources
+
+        history = self.history()
+
+        def stream() -> Iterator[str]:
+            parts = []  # Morceaux déjà produits, pour reconstituer la réponse complète
+            try:
+                for part in self.chatbot.generate_response_stream(question, context, history=history):
+                    parts.append(part)
+                    yield part
+            except LLMUnavailableError:
+                yield self.chatbot.INTERRUPTED_NOTICE if parts else self.chatbot.fallback_response(context)
+                return
+            # Échange mémorisé (et mis en cache) uniquement si la génération est allée jusqu'au bout
+            answer = ''.join(parts)
+            if not follow_up:
+                self.engine.answer_cache.put(query_embedding, chunk_ids, answer)
+            self._add_turn(question, standalone, topic, answer, context)
+
+        return stream(), False, sources
+
+    def ask(self, question: str) -> Tuple[str, bool, List[str]]:
+        """
+        Comme ask_stream, avec la réponse complète.
+
+        Returns:
+            Tuple[str, bool, List[str]]: (réponse, True si elle provient du cache, documents sources du contexte)
+        """
+        stream, from_cache, sources = self.ask_stream(question)
+        return ''.join(stream), from_cache, sources
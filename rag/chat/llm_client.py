@@ -0,0 +1,621 @@
+"""
+Clients des modèles de langage : le Chatbot construit le prompt, le client l'envoie au modèle.
+
+GeminiClient appelle l'API Google AI ; StubLLMClient répond localement, sans réseau ni clé API
+(bancs de mesure, traitements par lots hors ligne, tests de charge).
+
+ResilientLLMClient enveloppe un client pour borner la latence et respecter le quota : délai
+maximal par appel, reprises espacées aléatoirement, débit limité par un seau à jetons, nombre
+d'appels simultanés borné, appels identiques en cours regroupés en un seul, et disjoncteur qui
+refuse immédiatement les appels quand le modèle est en panne (LLMUnavailableError : l'appelant
+répond alors avec les extraits les plus pertinents). Ces limites sont communes à toutes les
+sessions du processus (voir get_upstream_limits).
+"""
+from concurrent.futures import ThreadPoolExecutor  # Importation du pool de threads des appels au modèle
+from typing import Dict, Iterator, List, Optional, Tuple  # Importation des types pour la typisation statique
+import asyncio  # Importation d'asyncio pour la version asynchrone par défaut
+import hashlib  # Importation de hashlib pour séparer les quotas par clé API sans garder la clé en clair
+import logging  # Importation de logging pour signaler les reprises et l'ouverture du disjoncteur
+import os  # Importation de os pour lire les limites dans l'environnement
+import random  # Importation de random pour simuler des erreurs passagères et étaler les reprises
+import threading  # Importation des verrous : un client est partagé entre plusieurs threads
+import time  # Importation de time pour les délais, le débit et la latence simulée
+import weakref  # Importation de weakref pour oublier les boucles d'événements fermées
+
+from rag.monitoring.tracing import span  # Attente du modèle, reprises et regroupements (sans effet hors d'une trace)
+
+logger = logging.getLogger(__name__)
+
+LLM_CLIENTS = ('gemini', 'stub')  # Clients disponibles (voir create_llm_client)
+
+class LLMClient:
+    """
+    Interface commune des clients : un prompt en entrée, le texte de la réponse en sortie.
+    """
+
+    name = ''  # Identifiant du client (voir LLM_CLIENTS)
+    quota_key = ''  # Compte facturé (empreinte de la clé API) : quota, disjoncteur et regroupement sont propres à chaque compte
+
+    def generate(self, prompt: str) -> str:
+        """
+        Génère la réponse complète à un prompt.
+
+        Args:
+            prompt (str): Prompt complet
+
+        Returns:
+            str: Réponse du modèle
+        """
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str) -> str:
+        """Version asynchrone de generate. Par défaut, l'appel bloquant tourne dans un thread."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Génère la réponse en flux. Par défaut, la réponse complète en un seul morceau.
+
+        Yields:
+            str: Morceaux successifs de la réponse
+        """
+        yield self.generate(prompt)
+
+class GeminiClient(LLMClient):
+    """Modèle Gemini de Google AI."""
+
+    name = 'gemini'
+
+    def __init__(self, api_key: str, model_name: str = 'gemini-pro', timeout: float = 60.0):
+        """
+        Initialise le client.
+
+        Args:
+            api_key (str): Clé API Google AI
+            model_name (str): Modèle génératif utilisé
+            timeout (float): Durée maximale (en secondes) d'un appel à l'API, flux compris : au-delà, l'appel
+                est abandonné et le thread qui l'attend est libéré
+        """
+        import google.generativeai as genai  # Import différé : la bibliothèque Google AI n'est chargée qu'à la connexion
+        genai.configure(api_key=api_key)  # Configuration de l'API Google AI avec la clé API fournie
+        self.model = genai.GenerativeModel(model_name)
+        self.timeout = timeout  # Réduit par ResilientLLMClient à son délai maximal
+        self.quota_key = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+    @property
+    def request_options(self) -> Dict[str, float]:
+        return {'timeout': self.timeout}
+
+    def generate(self, prompt: str) -> str:
+        return self.model.generate_content(prompt, request_options=self.request_options).text
+
+    async def generate_async(self, prompt: str) -> str:
+        # Appel réseau asynchrone natif : la boucle d'événements n'est pas bloquée
+        response = await self.model.generate_content_async(prompt, request_options=self.request_options)
+        return response.text
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        # Appel du modèle en mode flux : la réponse arrive par morceaux
+        for chunk in self.model.generate_content(prompt, stream=True, request_options=self.request_options):
+            if chunk.text:  # Certains morceaux (métadonnées de fin) ne contiennent pas de texte
+                yield chunk.text
+
+class StubLLMClient(LLMClient):
+    """
+    Modèle factice : répond sans réseau, avec une latence et un taux d'erreurs réglables.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        Initialise le client factice.
+
+        Args:
+            latency (float): Durée (en secondes) de chaque appel
+            failure_rate (float): Probabilité qu'un appel échoue (ConnectionError), pour éprouver les reprises
+            seed (Optional[int]): Graine du tirage des erreurs (reproductibilité)
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0  # Nombre d'appels reçus, erreurs comprises
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise ConnectionError("Erreur simulée du modèle factice")
+        return f"Réponse factice ({len(prompt)} caractères de prompt)."
+
+class LLMUnavailableError(RuntimeError):
+    """Le modèle n'a pas répondu : délai dépassé, erreurs répétées, quota atteint ou disjoncteur ouvert."""
+
+class RateLimitedError(LLMUnavailableError):
+    """Quota local d'appels atteint dans le délai : le modèle lui-même n'est pas en cause."""
+
+class QueueTimeoutError(LLMUnavailableError):
+    """Délai dépassé avant l'envoi au modèle (file d'attente locale) : le modèle lui-même n'est pas en cause."""
+
+class TokenBucket:
+    """
+    Seau à jetons : en moyenne rate appels par seconde, avec des pointes jusqu'à capacity appels.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialise le seau, plein.
+
+        Args:
+            rate (float): Jetons ajoutés par seconde (0 : débit illimité)
+            capacity (float): Nombre maximal de jetons accumulés
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Prend un jeton, en attendant au plus timeout secondes.
+
+        Args:
+            timeout (float): Attente maximale en secondes
+
+        Returns:
+            bool: True si un jeton a été obtenu, False si le délai ne le permet pas
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:  # Inutile d'attendre un jeton qui arriverait trop tard
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: float) -> bool:
+        """Version asynchrone de acquire : l'attente ne bloque pas la boucle d'événements."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def _take(self) -> float:
+        """Prend un jeton s'il y en a un ; sinon retourne le temps (en secondes) avant le prochain."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+class CircuitBreaker:
+    """
+    Disjoncteur : après failure_threshold échecs consécutifs, les appels sont refusés pendant
+    reset_timeout secondes, puis un seul appel d'essai décide de la reprise.
+
+    Chaque appel autorisé par allow() doit se conclure par record_success, record_failure ou,
+    si son issue ne dit rien de l'état du modèle (clé invalide, quota local), par release.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'  # États du disjoncteur
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialise le disjoncteur, fermé (les appels passent).
+
+        Args:
+            failure_threshold (int): Nombre d'échecs consécutifs qui ouvre le disjoncteur
+            reset_timeout (float): Durée (en secondes) pendant laquelle les appels sont refusés
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False  # Appel d'essai en cours (état semi-ouvert)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """État courant : 'closed', 'open' ou 'half_open'."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state, self._trial = self.HALF_OPEN, False
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Indique si un appel peut partir.
+
+        Returns:
+            bool: True si le disjoncteur est fermé, ou pour le seul appel d'essai en semi-ouvert
+        """
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Un appel a réussi : le disjoncteur se referme."""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Modèle de nouveau disponible : disjoncteur refermé")
+            self._state, self._failures, self._trial = self.CLOSED, 0, False
+
+    def record_failure(self) -> None:
+        """Un appel a échoué : le disjoncteur s'ouvre au-delà du seuil, ou si l'appel d'essai échoue."""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                logger.warning("Modèle indisponible (%d échecs consécutifs) : appels refusés pendant %g s",
+                               self._failures, self.reset_timeout)
+                self._state, self._opened_at, self._trial = self.OPEN, time.monotonic(), False
+
+    def release(self) -> None:
+        """Un appel s'est terminé sans renseigner sur le modèle : l'appel d'essai éventuel est rendu."""
+        with self._lock:
+            self._trial = False
+
+class _InFlightCall:
+    """Appel au modèle en cours, dont les morceaux de réponse sont lus par un ou plusieurs demandeurs."""
+
+    def __init__(self):
+        self.chunks: List[str] = []  # Morceaux reçus, relus par les demandeurs arrivés en cours de route
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.attempts = 0
+        self._settled = False  # Issue déjà rapportée au disjoncteur (par le demandeur ou par le thread du pool)
+        self._condition = threading.Condition()
+
+    def settle(self) -> bool:
+        """Retourne True au premier appel seulement : l'issue d'un appel n'est comptée qu'une fois."""
+        with self._condition:
+            settled, self._settled = self._settled, True
+            return not settled
+
+    def publish(self, chunk: str) -> None:
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        with self._condition:
+            self.error, self.done = error, True
+            self._condition.notify_all()
+
+    def iterate(self, first_timeout: float, chunk_timeout: float) -> Iterator[str]:
+        """
+        Lit les morceaux de la réponse au fur et à mesure de leur arrivée.
+
+        Raises:
+            LLMUnavailableError: Si le premier morceau, ou le suivant, n'arrive pas dans le délai
+        """
+        position = 0
+        while True:
+            timeout = first_timeout if position == 0 else chunk_timeout
+            with self._condition:
+                if not self._condition.wait_for(lambda: len(self.chunks) > position or self.done, timeout=timeout):
+                    raise LLMUnavailableError(f"Pas de réponse du modèle en {timeout:g} s")
+                if len(self.chunks) <= position:  # Appel terminé, tous les morceaux lus
+                    if self.error is not None:
+                        raise self.error
+                    return
+                chunk = self.chunks[position]
+            position += 1
+            yield chunk  # Hors du verrou : le demandeur peut consommer lentement
+
+class UpstreamLimits:
+    """
+    Limites communes à tous les clients d'un même modèle et d'un même compte (clé API) dans le
+    processus : débit, nombre d'appels simultanés, disjoncteur et appels en cours (pour regrouper
+    les prompts identiques).
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 10, max_concurrency: int = 8,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialise les limites.
+
+        Args:
+            rate (float): Appels par seconde en moyenne (0 : illimité)
+            burst (float): Appels possibles d'un coup après une période calme
+            max_concurrency (int): Nombre maximal d'appels simultanés au modèle
+            failure_threshold (int): Échecs consécutifs qui ouvrent le disjoncteur
+            reset_timeout (float): Durée (en secondes) d'ouverture du disjoncteur
+        """
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_concurrency = max_concurrency
+        # Les appels tournent dans ce pool : au-delà de max_concurrency, ils attendent leur tour (dans leur délai)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self.in_flight: Dict[str, _InFlightCall] = {}  # Prompt -> appel en cours
+        self.in_flight_async: Dict[Tuple[str, asyncio.AbstractEventLoop], asyncio.Task] = {}  # Idem, par boucle d'événements
+        # Appels asynchrones simultanés : même borne que le pool, un sémaphore par boucle d'événements
+        self._async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def async_slots(self) -> asyncio.Semaphore:
+        """Sémaphore des appels asynchrones de la boucle d'événements courante (max_concurrency places)."""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            slots = self._async_slots.get(loop)
+            if slots is None:
+                slots = self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+            return slots
+
+_upstream_limits: Dict[Tuple[str, str], UpstreamLimits] = {}  # Une instance par modèle et par compte, pour tout le processus
+_upstream_lock = threading.Lock()
+
+def get_upstream_limits(name: str, quota_key: str = '') -> UpstreamLimits:
+    """
+    Retourne les limites partagées d'un modèle pour un compte, en les créant au premier appel.
+
+    Réglages par variables d'environnement : RAG_LLM_RATE (appels par seconde, 1 par défaut),
+    RAG_LLM_BURST (10) et RAG_LLM_CONCURRENCY (8), pour chaque clé API.
+
+    Args:
+        name (str): Nom du client (voir LLM_CLIENTS)
+        quota_key (str): Compte facturé (voir LLMClient.quota_key)
+
+    Returns:
+        UpstreamLimits: Instance unique pour ce modèle et ce compte
+    """
+    key = (name, quota_key)
+    limits = _upstream_limits.get(key)
+    if limits is None:
+        with _upstream_lock:
+            limits = _upstream_limits.get(key)
+            if limits is None:  # Une autre session a pu les créer entre-temps
+                limits = UpstreamLimits(rate=float(os.environ.get('RAG_LLM_RATE', 1.0)),
+                                        burst=float(os.environ.get('RAG_LLM_BURST', 10)),
+                                        max_concurrency=int(os.environ.get('RAG_LLM_CONCURRENCY', 8)))
+                _upstream_limits[key] = limits
+    return limits
+
+class ResilientLLMClient(LLMClient):
+    """
+    Enveloppe un client avec délais, reprises, limitation de débit, regroupement et disjoncteur.
+
+    Chaque prompt part au plus une fois à la fois par compte : un demandeur qui envoie un prompt
+    déjà en cours avec la même clé API lit la réponse de l'appel existant (y compris en flux) sans
+    consommer de quota. Les reprises n'ont lieu qu'avant le premier morceau de réponse, et
+    seulement dans le délai ; un appel resté en file d'attente au-delà du délai n'est jamais envoyé.
+    La version asynchrone passe par l'appel asynchrone natif du client, avec la même borne
+    d'appels simultanés.
+    """
+
+    # Erreurs dues à la requête elle-même (clé invalide, prompt refusé) : inutile de réessayer
+    PERMANENT_ERRORS = frozenset(('InvalidArgument', 'PermissionDenied', 'Unauthenticated', 'NotFound',
+                                  'BlockedPromptException', 'StopCandidateException', 'ValueError'))
+
+    def __init__(self, client: LLMClient, deadline: float = 20.0, chunk_timeout: float = 10.0, retries: int = 2,
+                 backoff: float = 0.5, limits: Optional[UpstreamLimits] = None):
+        """
+        Initialise le client.
+
+        Args:
+            client (LLMClient): Client appelé réellement
+            deadline (float): Délai maximal (en secondes) avant le premier morceau de réponse, reprises comprises
+            chunk_timeout (float): Délai maximal (en secondes) entre deux morceaux d'une réponse en flux
+            retries (int): Nombre maximal de nouvelles tentatives après une erreur passagère
+            backoff (float): Attente maximale (en secondes) avant la première reprise, doublée à chaque reprise
+            limits (Optional[UpstreamLimits]): Limites à utiliser. Par défaut celles partagées du modèle et du compte
+        """
+        self.client = client
+        self.name = client.name
+        self.deadline = deadline
+        self.chunk_timeout = chunk_timeout
+        self.retries = max(retries, 0)
+        self.backoff = backoff
+        self.limits = limits or get_upstream_limits(client.name, client.quota_key)
+        # Un appel abandonné par le demandeur n'occupe pas un thread du pool au-delà du délai
+        if getattr(client, 'timeout', None) is not None:
+            client.timeout = min(client.timeout, deadline)
+
+    def generate(self, prompt: str) -> str:
+        return ''.join(self._call(prompt, stream=False))
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        yield from self._call(prompt, stream=True)
+
+    async def generate_async(self, prompt: str) -> str:
+        # Regroupement limité à la boucle d'événements courante : une tâche ne s'attend pas depuis une autre boucle
+        key = (prompt, asyncio.get_running_loop())
+        with self.limits.lock:
+            task = self.limits.in_flight_async.get(key)
+            coalesced = task is not None
+            if task is None:
+                if not self.limits.circuit_breaker.allow():
+                    raise LLMUnavailableError("Modèle indisponible (disjoncteur ouvert)")
+                task = asyncio.create_task(self._produce_async(prompt))
+                self.limits.in_flight_async[key] = task
+                task.add_done_callback(lambda _: self._forget_async(key))
+
+        with span('llm', coalesced=coalesced) as current:
+            # shield : l'annulation d'un demandeur n'interrompt pas l'appel attendu par les autres
+            text, attempts = await asyncio.shield(task)
+            current.set(attempts=attempts)
+        return text
+
+    def _forget_async(self, key: Tuple[str, asyncio.AbstractEventLoop]) -> None:
+        with self.limits.lock:
+            self.limits.in_flight_async.pop(key, None)
+
+    def _call(self, prompt: str, stream: bool) -> Iterator[str]:
+        """
+        Rejoint l'appel en cours pour ce prompt, ou en lance un, puis lit sa réponse.
+
+        Raises:
+            LLMUnavailableError: Disjoncteur ouvert, délai dépassé, quota atteint ou erreurs répétées
+        """
+        with self.limits.lock:
+            call = self.limits.in_flight.get(prompt)
+            coalesced = call is not None
+            if call is None:
+                if not self.limits.circuit_breaker.allow():
+                    raise LLMUnavailableError("Modèle indisponible (disjoncteur ouvert)")
+                call = _InFlightCall()
+                self.limits.in_flight[prompt] = call
+                self.limits.executor.submit(self._produce, call, prompt, stream, time.monotonic())
+
+        with span('llm', coalesced=coalesced) as current:
+            try:
+                yield from call.iterate(self.deadline, self.chunk_timeout)
+            except LLMUnavailableError as error:
+                if not coalesced:  # Délai dépassé : le disjoncteur l'apprend sans attendre la fin de l'appel
+                    if not call.attempts:  # Jamais envoyé (file d'attente, quota) : le modèle n'est pas en cause
+                        error = QueueTimeoutError(str(error))
+                    self._settle(error, call)
+                raise
+            finally:
+                current.set(attempts=call.attempts)
+
+    def _retryable(self, error: Exception) -> bool:
+        return type(error).__name__ not in self.PERMANENT_ERRORS
+
+    def _settle(self, error: Optional[BaseException], call: Optional[_InFlightCall] = None) -> None:
+        """
+        Rapporte l'issue d'un appel au disjoncteur, une seule fois par appel (call, s'il est partagé).
+
+        Seules les erreurs du modèle (LLMUnavailableError après les reprises, délai dépassé pendant
+        l'appel) comptent comme des échecs ; une erreur de la requête (clé invalide, prompt refusé),
+        le quota local ou un délai dépassé avant l'envoi rendent seulement l'éventuel appel d'essai.
+        """
+        if call is not None and not call.settle():
+            return
+        breaker = self.limits.circuit_breaker
+        if error is None:
+            breaker.record_success()
+        elif isinstance(error, LLMUnavailableError) and not isinstance(error, (RateLimitedError, QueueTimeoutError)):
+            breaker.record_failure()
+        else:
+            breaker.release()
+
+    def _produce(self, call: _InFlightCall, prompt: str, stream: bool, started: float) -> None:
+        """Appelle le modèle (avec reprises) et publie sa réponse dans call (thread du pool)."""
+        error = None
+        try:
+            self._attempt(call, prompt, stream, started)
+        except BaseException as exception:
+            error = exception
+        finally:
+            self._settle(error, call)  # Sur tous les chemins : un appel d'essai ne reste jamais en suspens
+            # Retiré des appels en cours avant d'être terminé : un nouveau demandeur relance un appel frais
+            with self.limits.lock:
+                self.limits.in_flight.pop(prompt, None)
+            call.finish(error)
+
+    def _next_delay(self, error: Exception, attempt: int, started: float, streamed: bool) -> float:
+        """
+        Attente avant la tentative suivante, ou erreur finale s'il n'y en a plus.
+
+        Raises:
+            Exception: L'erreur elle-même si elle est due à la requête (inutile de réessayer)
+            LLMUnavailableError: Si la réponse avait commencé, ou si les tentatives ou le délai sont épuisés
+        """
+        if not self._retryable(error):
+            raise error
+        # Gigue complète : les demandeurs en échec au même moment ne relancent pas ensemble
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        # Une réponse en flux déjà commencée ne peut pas être reprise
+        if streamed or attempt == self.retries or time.monotonic() - started + delay >= self.deadline:
+            raise LLMUnavailableError(f"Le modèle n'a pas répondu ({attempt + 1} tentative(s)) : {error}") from error
+        logger.warning("Erreur du modèle (%s), nouvelle tentative dans %.2f s", error, delay)
+        return delay
+
+    def _attempt(self, call: _InFlightCall, prompt: str, stream: bool, started: float) -> None:
+        """Tentatives successives, avec attente aléatoire croissante, jusqu'au succès ou à l'échéance."""
+        for attempt in range(self.retries + 1):
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:  # Resté trop longtemps dans la file du pool : le demandeur est déjà parti
+                raise QueueTimeoutError(f"Délai de {self.deadline:g} s dépassé avant l'envoi au modèle")
+            if not self.limits.rate_limiter.acquire(remaining):
+                raise RateLimitedError("Quota d'appels au modèle atteint")
+            call.attempts = attempt + 1
+            try:
+                if stream:
+                    for part in self.client.generate_stream(prompt):
+                        call.publish(part)
+                else:
+                    call.publish(self.client.generate(prompt))
+                return
+            except Exception as error:
+                time.sleep(self._next_delay(error, attempt, started, bool(call.chunks)))
+
+    async def _produce_async(self, prompt: str) -> Tuple[str, int]:
+        """
+        Version asynchrone de _produce : au plus max_concurrency appels simultanés par boucle
+        d'événements, et chaque tentative est bornée par le temps restant avant l'échéance.
+
+        Returns:
+            Tuple[str, int]: (réponse, nombre de tentatives)
+        """
+        started = time.monotonic()
+        error = None
+        slots = self.limits.async_slots()
+        try:
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=self.deadline)
+            except asyncio.TimeoutError:
+                raise QueueTimeoutError(f"Délai de {self.deadline:g} s dépassé avant l'envoi au modèle") from None
+            try:
+                for attempt in range(self.retries + 1):
+                    remaining = self.deadline - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise QueueTimeoutError(f"Délai de {self.deadline:g} s dépassé avant l'envoi au modèle")
+                    if not await self.limits.rate_limiter.acquire_async(remaining):
+                        raise RateLimitedError("Quota d'appels au modèle atteint")
+                    try:
+                        remaining = self.deadline - (time.monotonic() - started)
+                        return await asyncio.wait_for(self.client.generate_async(prompt), timeout=max(remaining, 0.0)), attempt + 1
+                    except Exception as exception:
+                        await asyncio.sleep(self._next_delay(exception, attempt, started, streamed=False))
+            finally:
+                slots.release()
+        except BaseException as exception:
+            error = exception
+            raise
+        finally:
+            self._settle(error)
+
+def create_llm_client(name: str, api_key: Optional[str] = None) -> LLMClient:
+    """
+    Crée un client de modèle de langage à partir de son nom.
+
+    Args:
+        name (str): 'gemini' ou 'stub'
+        api_key (Optional[str]): Clé API Google AI (obligatoire pour 'gemini')
+
+    Returns:
+        LLMClient: Client prêt à l'emploi (Gemini avec délais, reprises, quota et disjoncteur)
+
+    Raises:
+        ValueError: Si le client est inconnu ou si la clé API manque
+    """
+    if name == 'stub':
+        return StubLLMClient()
+    if name == 'gemini':
+        if not api_key:
+            raise ValueError("Une clé API Google AI est nécessaire pour le client 'gemini'")
+        return ResilientLLMClient(GeminiClient(api_key))
+    raise ValueError(f"Client inconnu : {name} (disponibles : {', '.join(LLM_CLIENTS)})")
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor  # Importation du pool de threads pour le travail CPU (embedding, ChromaDB)
+from typing import List, Optional, Tuple  # Importation des types pour la typisation statique
+import asyncio  # Importation d'asyncio pour servir plusieurs questions en parallèle
+import contextvars  # Importation de contextvars pour garder la trace en cours dans le pool de threads
+import functools  # Importation de functools pour passer la recherche et ses arguments au pool
+
+from rag.engine.retrieval_engine import RetrievalEngine  # Moteur de recherche partagé
+from rag.chat.chatbot import Chatbot  # Génération des réponses
+from rag.chat.llm_client import LLMUnavailableError  # Modèle en panne : réponse de repli avec les extraits
+
+class AsyncRAGService:
+    """
+    Service asynchrone de questions-réponses, utilisable hors de Streamlit (serveur HTTP, traitement par lots).
+
+    L'encodage de la question et la recherche ChromaDB, qui consomment du CPU, tournent dans un
+    pool de threads ; l'appel à Gemini est une entrée/sortie asynchrone. Le nombre de requêtes
+    simultanées et d'appels au modèle est borné, et chaque étape a un délai maximal.
+    Une instance s'utilise dans une seule boucle d'événements (ses sémaphores y sont rattachés).
+
+    Exemple :
+        service = AsyncRAGService(get_engine())
+        response, from_cache = asyncio.run(service.answer("Quelle franchise pour un vol ?", chatbot))
+    """
+
+    def __init__(self, engine: RetrievalEngine, max_concurrent_requests: int = 32,
+                 max_concurrent_generations: int = 8, retrieval_timeout: float = 10.0,
+                 generation_timeout: float = 60.0, executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Initialise le service.
+
+        Args:
+            engine (RetrievalEngine): Moteur de recherche partagé
+            max_concurrent_requests (int): Nombre maximal de questions traitées en même temps
+            max_concurrent_generations (int): Nombre maximal d'appels simultanés au modèle de langage
+            retrieval_timeout (float): Délai maximal (en secondes) pour l'encodage et la recherche
+            generation_timeout (float): Délai maximal (en secondes) pour la génération de la réponse
+            executor (Optional[ThreadPoolExecutor]): Pool de threads pour le travail CPU. Par défaut un pool de 4 threads
+        """
+        self.engine = engine
+        self.retrieval_timeout = retrieval_timeout
+        self.generation_timeout = generation_timeout
+        self._executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-retrieval")
+        self._requests = asyncio.Semaphore(max_concurrent_requests)  # Limite globale de questions en cours
+        self._generations = asyncio.Semaphore(max_concurrent_generations)  # Limite des appels à Gemini (quota)
+
+    async def answer(self, query: str, chatbot: Chatbot, k: int = 3) -> Tuple[str, bool]:
+        """
+        Répond à une question de manière asynchrone, en passant par le cache de réponses.
+
+        Args:
+            query (str): Question de l'utilisateur
+            chatbot (Chatbot): Chatbot à utiliser si la réponse n'est pas en cache
+            k (int): Nombre de chunks à récupérer
+
+        Returns:
+            Tuple[str, bool]: (réponse, True si elle provient du cache)
+
+        Raises:
+            asyncio.TimeoutError: Si la recherche ou la génération dépasse son délai
+        """
+        async with self._requests:
+            # Encodage et recherche dans un thread : la boucle d'événements reste libre pendant ce temps.
+            # Le contexte est copié : les étapes de la recherche sont rattachées à la trace de la requête
+            loop = asyncio.get_running_loop()
+            retrieve = functools.partial(contextvars.copy_context().run, self.engine.retrieve, query, k)
+            query_embedding, context, chunk_ids = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, retrieve),
+                timeout=self.retrieval_timeout
+            )
+
+            cached = self.engine.cached_answer(query_embedding, chunk_ids)
+            if cached is not None:
+                return cached, True
+
+            # Appel réseau asynchrone, borné en nombre et en durée
+            async with self._generations:
+                try:
+                    response = await asyncio.wait_for(
+                        chatbot.generate_response_async(query, context),
+                        timeout=self.generation_timeout
+                    )
+                except LLMUnavailableError:
+                    # Modèle en panne : les extraits trouvés, jamais mis en cache
+                    return chatbot.fallback_response(context), False
+            self.engine.answer_cache.put(query_embedding, chunk_ids, response)
+            return response, False
+
+    async def answer_many(self, queries: List[str], chatbot: Chatbot, k: int = 3) -> List[Tuple[str, bool]]:
+        """
+        Répond à plusieurs questions en parallèle, dans les limites de concurrence du service.
+
+        Args:
+            queries (List[str]): Questions à traiter
+            chatbot (Chatbot): Chatbot à utiliser
+            k (int): Nombre de chunks à récupérer par question
+
+        Returns:
+            List[Tuple[str, bool]]: Réponses dans l'ordre des questions
+        """
+        return await asyncio.gather(*(self.answer(query, chatbot, k) for query in queries))
+
+    def close(self) -> None:
+        """Arrête le pool de threads du service."""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,267 @@
+"""
+Questions-réponses par lots, hors de Streamlit : évaluation hors ligne, non-régression et préchauffage des caches.
+
+Entrée : un fichier JSON Lines avec une question par ligne ({"question": ...}, les autres champs sont
+recopiés dans la sortie), ou les questions déjà notées dans la base des retours (--from-feedback).
+Sortie : un fichier JSON Lines écrit au fil des réponses : les champs d'entrée, la réponse ('answer'),
+les documents du contexte ('retrieved_sources'), les durées et le nombre de tentatives de chaque question.
+
+Les questions sont encodées et recherchées par lots (RetrievalEngine.retrieve_batch), puis les
+réponses sont générées en parallèle, en nombre borné, avec reprises à délai croissant en cas d'erreur.
+Les embeddings des questions sont conservés dans le cache persistant de l'index ; les réponses
+alimentent le cache de réponses du moteur utilisé (préchauffage quand BatchQA tourne dans le
+processus qui sert l'application).
+
+Exemples (depuis la racine du projet) :
+    python -m rag.engine.batch_qa --input benchmarks/questions.jsonl --output answers.jsonl --llm stub
+    GOOGLE_API_KEY=... python -m rag.engine.batch_qa --from-feedback --only-negative --output regression.jsonl
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait  # Pool de threads des générations
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple  # Importation des types pour la typisation statique
+import argparse  # Importation d'argparse pour les options de la ligne de commande
+import json  # Importation du module JSON pour lire les questions et écrire les réponses
+import logging  # Importation de logging pour signaler les reprises
+import os  # Importation de os pour lire la clé API dans l'environnement
+import random  # Importation de random pour étaler les reprises (gigue)
+import time  # Importation de time pour mesurer les durées et attendre entre deux tentatives
+
+import numpy as np  # Importation de numpy pour le typage des embeddings
+
+from rag.engine.retrieval_engine import RetrievalEngine  # Moteur de recherche partagé
+from rag.chat.chatbot import Chatbot  # Construction du prompt et génération
+from rag.chat.llm_client import LLM_CLIENTS, LLMUnavailableError, create_llm_client  # Clients des modèles de langage (Gemini, factice)
+
+logger = logging.getLogger(__name__)
+
+def load_questions(path: str) -> Iterator[Dict]:
+    """
+    Lit les questions d'un fichier JSON Lines, au fil de l'eau.
+
+    Args:
+        path (str): Fichier avec un objet {"question": ...} par ligne
+
+    Yields:
+        Dict: Une question et ses autres champs
+
+    Raises:
+        ValueError: Si une ligne n'a pas de champ 'question'
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get('question'):
+                raise ValueError(f"{path}, ligne {number} : champ 'question' absent")
+            yield record
+
+def feedback_questions(db_path: str = "feedback.db", only_negative: bool = False,
+                       limit: Optional[int] = None) -> List[Dict]:
+    """
+    Questions déjà notées par les utilisateurs, avec la réponse et la note reçues (champ 'reference').
+
+    Args:
+        db_path (str): Base des retours utilisateurs
+        only_negative (bool): Ne garder que les questions dont le dernier retour est négatif
+        limit (Optional[int]): Nombre maximal de questions, les plus récemment notées d'abord
+
+    Returns:
+        List[Dict]: Questions au format de load_questions
+    """
+    from rag.feedback.feedback_manager import get_feedback_manager  # Retours utilisateurs
+    manager = get_feedback_manager(db_path)
+    manager.flush()  # Retours encore en file dans ce processus
+    return [{'question': entry.pop('question'), 'reference': entry}
+            for entry in manager.get_questions(is_helpful=False if only_negative else None, limit=limit)]
+
+class _GenerationFailed(Exception):
+    """Échec de la génération d'une réponse, avec le nombre de tentatives réellement faites."""
+
+    def __init__(self, error: Exception, attempts: int):
+        super().__init__(str(error))
+        self.error = error  # Dernière erreur du modèle
+        self.attempts = attempts
+
+class BatchQA:
+    """
+    Répond à une série de questions avec le moteur partagé et un chatbot.
+
+    Exemple :
+        batch = BatchQA(get_engine(), Chatbot(llm_client=StubLLMClient()))
+        with open("answers.jsonl", "w", encoding="utf-8") as output:
+            stats = batch.run(load_questions("questions.jsonl"), output)
+    """
+
+    def __init__(self, engine: RetrievalEngine, chatbot: Chatbot, k: int = 3, batch_size: int = 32,
+                 concurrency: int = 4, retries: int = 3, backoff: float = 1.0):
+        """
+        Initialise le traitement par lots.
+
+        Args:
+            engine (RetrievalEngine): Moteur de recherche (et cache de réponses)
+            chatbot (Chatbot): Chatbot utilisé pour les questions absentes du cache
+            k (int): Nombre de chunks récupérés par question
+            batch_size (int): Nombre de questions encodées et recherchées ensemble
+            concurrency (int): Nombre maximal d'appels simultanés au modèle de langage
+            retries (int): Nombre de nouvelles tentatives après une erreur de génération
+            backoff (float): Délai (en secondes) avant la première reprise, doublé à chaque nouvelle tentative
+        """
+        self.engine = engine
+        self.chatbot = chatbot
+        self.k = k
+        self.batch_size = max(batch_size, 1)
+        self.concurrency = max(concurrency, 1)
+        self.retries = max(retries, 0)
+        self.backoff = backoff
+
+    @staticmethod
+    def _batches(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+        """Découpe un flux de questions en lots, sans tout charger en mémoire."""
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _generate(self, query: str, context: Dict) -> Tuple[str, int]:
+        """
+        Génère une réponse, avec reprises à délai exponentiel (et gigue) en cas d'erreur.
+
+        LLMUnavailableError n'est pas reprise : le client a déjà épuisé ses propres reprises, ou son
+        disjoncteur est ouvert (voir ResilientLLMClient).
+
+        Returns:
+            Tuple[str, int]: (réponse, nombre de tentatives)
+
+        Raises:
+            _GenerationFailed: La dernière erreur et le nombre de tentatives, si la génération a échoué
+        """
+        for attempt in range(1, self.retries + 2):
+            try:
+                return self.chatbot.generate_response(query, context), attempt
+            except LLMUnavailableError as error:
+                raise _GenerationFailed(error, attempt) from error
+            except Exception as error:
+                if attempt > self.retries:
+                    raise _GenerationFailed(error, attempt) from error
+                # Gigue : les threads en échec au même moment ne relancent pas tous ensemble
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning("Échec de la génération (%s), tentative %d dans %.1f s", error, attempt + 1, delay)
+                time.sleep(delay)
+
+    def _answer(self, record: Dict, query_embedding: np.ndarray, context: Dict, chunk_ids: List[str],
+                retrieve_ms: float) -> Dict:
+        """
+        Répond à une question déjà recherchée (cache de réponses, sinon génération).
+
+        Returns:
+            Dict: Question d'origine complétée par la réponse (ou l'erreur), les sources et les durées
+        """
+        started = time.perf_counter()
+        result = dict(record, answer=None, from_cache=False, retrieved_sources=self.engine.context_sources(context),
+                      chunk_ids=list(chunk_ids), attempts=0, error=None)
+        cached = self.engine.cached_answer(query_embedding, chunk_ids)
+        if cached is not None:
+            result.update(answer=cached, from_cache=True)
+        else:
+            try:
+                result['answer'], result['attempts'] = self._generate(record['question'], context)
+                self.engine.answer_cache.put(query_embedding, chunk_ids, result['answer'])
+            except _GenerationFailed as failure:  # La question est notée en erreur, le lot continue
+                result.update(attempts=failure.attempts, error=f"{type(failure.error).__name__}: {failure.error}")
+            except Exception as error:  # Erreur hors du modèle (cache de réponses) : même traitement
+                result['error'] = f"{type(error).__name__}: {error}"
+        generate_ms = (time.perf_counter() - started) * 1000
+        result['timings'] = {'retrieve_ms': round(retrieve_ms, 2), 'generate_ms': round(generate_ms, 2),
+                             'total_ms': round(retrieve_ms + generate_ms, 2)}
+        return result
+
+    @staticmethod
+    def _write(done: Iterable[Future], output: TextIO, stats: Dict[str, float]) -> None:
+        """Écrit les réponses terminées et met à jour les compteurs (thread principal uniquement)."""
+        for future in done:
+            result = future.result()
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            stats['errors' if result['error'] else 'answered'] += 1
+            stats['from_cache'] += result['from_cache']
+            stats['retries'] += max(result['attempts'] - 1, 0)
+        output.flush()  # Réponses lisibles au fil de l'eau, et conservées si le traitement est interrompu
+
+    def run(self, records: Iterable[Dict], output: TextIO) -> Dict[str, float]:
+        """
+        Traite toutes les questions et écrit une ligne JSON par réponse, dans l'ordre où elles se terminent.
+
+        Le lot suivant est recherché pendant que les réponses du précédent sont générées ; au plus
+        un lot de questions attend sa génération.
+
+        Args:
+            records (Iterable[Dict]): Questions ({"question": ...} et champs libres)
+            output (TextIO): Fichier de sortie (JSON Lines)
+
+        Returns:
+            Dict[str, float]: Nombre de questions, de réponses, d'erreurs, de réponses en cache, de reprises,
+                durée totale et débit
+        """
+        stats = {'questions': 0, 'answered': 0, 'errors': 0, 'from_cache': 0, 'retries': 0}
+        started = time.perf_counter()
+        pending: Set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="rag-batch") as executor:
+            for batch in self._batches(records, self.batch_size):
+                retrieve_started = time.perf_counter()
+                retrieved = self.engine.retrieve_batch([record['question'] for record in batch], self.k)
+                retrieve_ms = (time.perf_counter() - retrieve_started) * 1000 / len(batch)  # Part de chaque question
+                for record, (query_embedding, context, chunk_ids) in zip(batch, retrieved):
+                    pending.add(executor.submit(self._answer, record, query_embedding, context, chunk_ids, retrieve_ms))
+                stats['questions'] += len(batch)
+                # Contre-pression : la recherche ne prend pas plus d'un lot d'avance sur la génération
+                while len(pending) > self.batch_size:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._write(done, output, stats)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self._write(done, output, stats)
+        stats['seconds'] = time.perf_counter() - started
+        stats['questions_per_second'] = stats['questions'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Questions-réponses par lots (évaluation, non-régression, préchauffage)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help="Fichier JSON Lines des questions ({\"question\": ...} par ligne)")
+    source.add_argument('--from-feedback', nargs='?', const="feedback.db", metavar='DB',
+                        help="Rejouer les questions notées de la base des retours (par défaut feedback.db)")
+    parser.add_argument('--only-negative', action='store_true', help="Avec --from-feedback : questions mal notées seulement")
+    parser.add_argument('--limit', type=int, help="Avec --from-feedback : nombre maximal de questions")
+    parser.add_argument('--output', required=True, help="Fichier JSON Lines des réponses")
+    parser.add_argument('--llm', default='gemini', choices=LLM_CLIENTS,
+                        help="Modèle de langage ('stub' : réponses factices, sans réseau)")
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'),
+                        help="Clé API Google AI (par défaut la variable d'environnement GOOGLE_API_KEY)")
+    parser.add_argument('--documents', default="documents", help="Dossier des documents HTML")
+    parser.add_argument('--index', default="./chroma_db", help="Dossier racine des versions de l'index")
+    parser.add_argument('--k', type=int, default=3, help="Nombre de chunks récupérés par question")
+    parser.add_argument('--batch-size', type=int, default=32, help="Nombre de questions recherchées ensemble")
+    parser.add_argument('--concurrency', type=int, default=4, help="Nombre maximal d'appels simultanés au modèle")
+    parser.add_argument('--retries', type=int, default=3, help="Nombre de reprises après une erreur de génération")
+    parser.add_argument('--backoff', type=float, default=1.0, help="Délai (en secondes) avant la première reprise")
+    parser.add_argument('--no-rerank', action='store_true', help="Désactiver le re-classement par cross-encoder")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s : %(message)s")
+
+    chatbot = Chatbot(llm_client=create_llm_client(args.llm, args.api_key))
+    records = (load_questions(args.input) if args.input
+               else feedback_questions(args.from_feedback, args.only_negative, args.limit))
+    engine = RetrievalEngine(args.documents, args.index, rerank=not args.no_rerank)
+    batch = BatchQA(engine, chatbot, k=args.k, batch_size=args.batch_size, concurrency=args.concurrency,
+                    retries=args.retries, backoff=args.backoff)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        stats = batch.run(records, output)
+    print(f"{stats['questions']} questions en {stats['seconds']:.1f} s ({stats['questions_per_second']:.1f} questions/s) : "
+          f"{stats['answered']} réponses dont {stats['from_cache']} depuis le cache, {stats['errors']} erreurs, "
+          f"{stats['retries']} reprises")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from typing import Dict, Optional  # Importation des types pour la typisation statique
+
+from rag.indexing.products import detect_products  # Détection des gammes de produits par mots-clés
+
+class QueryRouter:
+    """
+    Routeur de questions léger : restreint la recherche aux produits cités dans la question.
+
+    Aucun modèle n'est appelé : la question est comparée aux mots-clés de chaque produit
+    (voiture, fuite, cambriolage...). Une question qui ne cite aucun produit, ou qui en cite
+    trop, n'est pas filtrée.
+    """
+
+    def __init__(self, max_products: int = 2):
+        """
+        Initialise le routeur.
+
+        Args:
+            max_products (int): Nombre maximal de produits retenus pour le filtre. Au-delà, la question est jugée générale
+        """
+        self.max_products = max_products
+
+    def route(self, query: str) -> Optional[Dict]:
+        """
+        Construit le filtre de métadonnées adapté à une question.
+
+        Args:
+            query (str): Question de l'utilisateur
+
+        Returns:
+            Optional[Dict]: Filtre au format ChromaDB (ex : {'product': 'vol'}), ou None pour chercher partout
+        """
+        products = detect_products(query)
+        if not products or len(products) > self.max_products:
+            return None
+        if len(products) == 1:
+            return {'product': products[0]}
+        return {'product': {'$in': products}}
@@ -0,0 +1,496 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple  # Importation des types pour la typisation statique
+import json  # Importation de json pour regrouper les questions par filtre de produit
+import logging  # Importation de logging pour tracer les changements de version de l'index
+import threading  # Importation des verrous pour la création unique du moteur
+import os  # Importation de os pour connaître le nombre de processeurs
+import time  # Importation de time pour espacer les vérifications du pointeur de version
+
+import numpy as np  # Importation de numpy pour le typage des embeddings
+
+from rag.indexing.document_loader import DocumentLoader  # Chargement des documents HTML
+from rag.indexing.text_splitter import TextSplitter  # Découpage des documents en chunks
+from rag.indexing.vectorstore import VectorStore  # Base vectorielle (modèle d'embedding + ChromaDB)
+from rag.indexing.embedding_cache import QueryEmbeddingCache  # Cache des embeddings de requêtes
+from rag.indexing.embeddings import create_backend  # Moteurs d'embedding (PyTorch, int8, ONNX)
+from rag.indexing.indexer import Indexer  # Indexation incrémentale des documents
+from rag.indexing.snapshots import SnapshotStore  # Versions de l'index publiées par pointeur atomique
+from rag.indexing.reranker import Reranker  # Re-classement des candidats par cross-encoder
+from rag.engine.query_router import QueryRouter  # Restriction de la recherche au produit concerné
+from rag.feedback.feedback_manager import get_feedback_manager  # Gestion des retours utilisateurs
+from rag.chat.answer_cache import AnswerCache  # Cache sémantique des réponses
+from rag.chat.chatbot import Chatbot  # Génération des réponses
+from rag.chat.llm_client import LLMUnavailableError  # Modèle en panne : réponse de repli avec les extraits
+from rag.monitoring.tracing import span  # Durée des étapes de la réponse (sans effet hors d'une trace)
+
+logger = logging.getLogger(__name__)
+
+class RetrievalEngine:
+    """
+    Moteur de recherche partagé par toutes les sessions d'un même processus.
+
+    Il regroupe les composants coûteux (modèle d'embedding, client ChromaDB, index) qui ne
+    dépendent pas de l'utilisateur. L'état propre à chaque utilisateur (clé API, chatbot)
+    reste dans sa session.
+
+    L'index est versionné (voir SnapshotStore) : une mise à jour est construite et validée dans
+    une nouvelle version pendant que la version servie continue de répondre, puis publiée.
+    Le moteur vérifie régulièrement le pointeur de version et bascule sur la version publiée,
+    y compris quand elle l'a été par un autre processus.
+    """
+
+    SMOKE_QUERIES = ("franchise vol", "dégât des eaux", "incendie", "assurance auto")  # Requêtes de validation d'une version
+    RETIRE_GRACE = 60.0  # Délai (en secondes) avant de fermer une base remplacée : les recherches en cours s'y terminent
+
+    def __init__(self, documents_path: str = "documents", persist_directory: str = "./chroma_db",
+                 rerank: bool = True, rerank_pool: int = 20,
+                 embedding_backend: Optional[str] = None, embedding_threads: Optional[int] = None,
+                 keep_versions: int = 3, reload_interval: float = 2.0,
+                 smoke_queries: Sequence[str] = SMOKE_QUERIES, min_count_ratio: float = 0.5,
+                 vector_backend: Optional[str] = None, vector_dtype: Optional[str] = None):
+        """
+        Initialise le moteur et met l'index à jour.
+
+        Args:
+            documents_path (str): Dossier contenant les documents HTML
+            persist_directory (str): Dossier racine des versions de l'index
+            rerank (bool): Si True, les candidats de la recherche sont réordonnés par un cross-encoder
+            rerank_pool (int): Nombre de candidats récupérés avant le re-classement
+            embedding_backend (Optional[str]): 'torch', 'torch-int8', 'onnx' ou 'onnx-int8'.
+                Par défaut la variable d'environnement RAG_EMBEDDING_BACKEND, sinon 'torch'
+            embedding_threads (Optional[int]): Threads de calcul des embeddings. Par défaut RAG_EMBEDDING_THREADS
+            keep_versions (int): Nombre de versions de l'index conservées pour revenir en arrière
+            reload_interval (float): Délai (en secondes) entre deux vérifications du pointeur de version
+            smoke_queries (Sequence[str]): Requêtes qui doivent toutes donner un résultat pour qu'une version soit publiée
+            min_count_ratio (float): Part minimale du nombre de chunks de la version servie qu'une nouvelle version
+                doit contenir (protège contre un corpus vidé par erreur ou une construction tronquée)
+            vector_backend (Optional[str]): Stockage des embeddings, 'chroma' ou 'mmap' (recherche exacte).
+                Par défaut la variable d'environnement RAG_VECTOR_BACKEND, sinon 'chroma'
+            vector_dtype (Optional[str]): Précision du stockage 'mmap' ('float32', 'float16' ou 'int8').
+                Par défaut RAG_VECTOR_DTYPE, sinon 'float32'
+        """
+        # Moteur choisi au déploiement (vérifier la dérive avec : python -m rag.indexing.embeddings --backend ...)
+        embedding_backend = embedding_backend or os.environ.get('RAG_EMBEDDING_BACKEND', 'torch')
+        embedding_threads = embedding_threads or int(os.environ.get('RAG_EMBEDDING_THREADS', 0)) or None
+        self.embedding_backend = create_backend(embedding_backend, VectorStore.MODEL_NAME, embedding_threads)
+
+        # Cache des embeddings de requêtes persisté à la racine (commun à toutes les versions de l'index) :
+        # les questions fréquentes restent chaudes au redémarrage comme après une publication
+        self.query_cache = QueryEmbeddingCache(persist_path=os.path.join(persist_directory, "query_cache.npz"),
+                                               namespace=self.embedding_backend.id)
+        self.loader = DocumentLoader(documents_path, workers=os.cpu_count() or 1)  # Parsing parallèle des gros corpus
+        # Chunks mesurés avec le tokenizer du modèle d'embedding : aucun chunk n'est tronqué à l'encodage
+        self.splitter = TextSplitter(chunk_size=256, chunk_overlap=48, tokenizer=self.embedding_backend.tokenizer)
+        self.snapshots = SnapshotStore(persist_directory, keep=keep_versions)
+        self.reload_interval = reload_interval
+        self.smoke_queries = tuple(smoke_queries)
+        self.min_count_ratio = min_count_ratio
+        # Changer de stockage réindexe entièrement la version suivante (collection vide dans le nouveau stockage)
+        self.vector_backend = vector_backend or os.environ.get('RAG_VECTOR_BACKEND', 'chroma')
+        self.vector_dtype = vector_dtype or os.environ.get('RAG_VECTOR_DTYPE', 'float32')
+
+        self.query_router = QueryRouter()  # Filtre par produit déduit de la question
+        self.reranker = Reranker() if rerank else None  # Second étage de la recherche (optionnel)
+        self.rerank_pool = rerank_pool
+        self.feedback_manager = get_feedback_manager()  # Même instance que la page Statistiques (connexion unique, écritures par lots)
+        self.answer_cache = AnswerCache()  # Réponses réutilisables entre sessions pour des questions quasi identiques
+        self._index_lock = threading.Lock()  # Une seule construction de version à la fois
+        self._swap_lock = threading.Lock()  # Une seule bascule de version à la fois (sans attendre une construction)
+
+        self.version: Optional[str] = None  # Version de l'index servie par ce processus
+        self.vector_store: Optional[VectorStore] = None
+        self.indexer: Optional[Indexer] = None
+        self._retired: List[Tuple[str, VectorStore, float]] = []  # Bases remplacées, fermées après RETIRE_GRACE
+        self._checked_at = time.monotonic()  # Dernière vérification du pointeur de version
+        current = self.snapshots.current()
+        if current is not None:
+            self._activate(current)
+        self.update_index()
+
+    def _open(self, version: str) -> Tuple[VectorStore, Indexer]:
+        """
+        Ouvre la base et l'indexeur d'une version (le modèle et les caches sont partagés).
+
+        Args:
+            version (str): Nom de la version
+
+        Returns:
+            Tuple[VectorStore, Indexer]: Base vectorielle et indexeur de la version
+        """
+        # Recherche hybride : embeddings + BM25 pour les termes exacts (franchise, montants)
+        vector_store = VectorStore(persist_directory=self.snapshots.path(version), query_cache=self.query_cache,
+                                   search_mode='hybrid', embedding_backend=self.embedding_backend,
+                                   backend=self.vector_backend, vector_dtype=self.vector_dtype)
+        return vector_store, Indexer(self.loader, self.splitter, vector_store)
+
+    def _activate(self, version: str, components: Optional[Tuple[VectorStore, Indexer]] = None) -> None:
+        """
+        Bascule le moteur sur une version de l'index.
+
+        Les recherches en cours terminent sur l'ancienne base ; les suivantes utilisent la nouvelle.
+
+        Args:
+            version (str): Nom de la version
+            components (Optional[Tuple[VectorStore, Indexer]]): Base et indexeur déjà ouverts (version construite ici)
+        """
+        vector_store, indexer = components or self._open(version)
+        _ = vector_store.lexical_index  # Index BM25 chargé avant la bascule plutôt qu'à la première question
+        # Les réponses en cache ne sont plus valides si le corpus a changé
+        self.answer_cache.set_corpus_version(indexer.corpus_version())
+        if self.vector_store is not None:
+            self._retired.append((self.version, self.vector_store, time.monotonic()))
+        self.vector_store, self.indexer, self.version = vector_store, indexer, version
+        self._close_retired()
+
+    def _close_retired(self, grace: Optional[float] = None) -> None:
+        """
+        Ferme les bases remplacées depuis plus de grace secondes (RETIRE_GRACE par défaut).
+
+        Une version dont la base a été ouverte par ce processus n'est supprimée qu'après sa fermeture
+        (voir SnapshotStore.prune) : les versions ainsi libérées sont nettoyées ici.
+        """
+        grace = self.RETIRE_GRACE if grace is None else grace
+        now = time.monotonic()
+        closed = [entry for entry in self._retired if now - entry[2] >= grace]
+        if not closed:
+            return
+        self._retired = [entry for entry in self._retired if now - entry[2] < grace]
+        for _, vector_store, _ in closed:
+            vector_store.close()
+        self.snapshots.prune(in_use=self._open_versions())
+
+    def _open_versions(self) -> List[str]:
+        """Versions dont la base est ouverte par ce processus (servie ou en attente de fermeture)."""
+        return [version for version in [self.version] + [entry[0] for entry in self._retired] if version is not None]
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Bascule sur la version publiée si le pointeur a changé (publication ou retour en arrière).
+
+        Args:
+            force (bool): Si True, vérifie le pointeur sans attendre reload_interval
+
+        Returns:
+            bool: True si le moteur a changé de version
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = now
+        if self._retired:
+            with self._swap_lock:
+                self._close_retired()
+        published = self.snapshots.current()
+        if published is None or published == self.version:
+            return False
+        with self._swap_lock:
+            if published == self.version:  # Une autre session a déjà basculé
+                return False
+            try:
+                self._activate(published)
+            except Exception:
+                # Version illisible : on continue de servir l'ancienne (nouvelle tentative au prochain intervalle)
+                logger.exception("Impossible d'ouvrir la version %s de l'index", published)
+                return False
+        logger.info("Version de l'index chargée : %s", published)
+        return True
+
+    def _validate(self, vector_store: VectorStore) -> int:
+        """
+        Vérifie une version avant sa publication.
+
+        Args:
+            vector_store (VectorStore): Base de la version construite
+
+        Returns:
+            int: Nombre de chunks de la version
+
+        Raises:
+            ValueError: Si la version est vide, a perdu trop de chunks, ou si une requête de validation ne donne rien
+        """
+        count = vector_store.count()
+        if count == 0:
+            raise ValueError("Version vide : aucun chunk indexé")
+        if self.vector_store is not None:
+            previous = self.vector_store.count()
+            if count < previous * self.min_count_ratio:
+                raise ValueError(f"Version suspecte : {count} chunks contre {previous} dans la version servie")
+        lexical = vector_store.lexical_index
+        if len(lexical) != count:
+            raise ValueError(f"Index BM25 incohérent : {len(lexical)} chunks pour {count} dans la collection")
+        for query in self.smoke_queries:
+            if not vector_store.search(query, 1)['ids'][0]:
+                raise ValueError(f"Aucun résultat pour la requête de validation : {query!r}")
+        return count
+
+    def update_index(self) -> Dict[str, int]:
+        """
+        Synchronise l'index avec le dossier de documents, dans une nouvelle version publiée une fois validée.
+
+        La nouvelle version part d'une copie de la version servie et n'est mise à jour que pour les
+        fichiers modifiés. Si rien n'a changé, aucune version n'est créée. Des fichiers seulement
+        "touchés" (même contenu, autre date) donnent une nouvelle version dont seul le manifeste
+        diffère : une version publiée n'est jamais modifiée.
+
+        Returns:
+            Dict[str, int]: Statistiques de la mise à jour (avec 'version' : la version servie ensuite)
+
+        Raises:
+            ValueError: Si la nouvelle version échoue à la validation (la version servie reste en place)
+        """
+        with self._index_lock:
+            base = self.version
+            empty = {'changed_files': 0, 'removed_files': 0, 'added': 0, 'unchanged': 0, 'updated': 0, 'deleted': 0}
+            if base is not None and not self.indexer.has_changes():
+                return dict(empty, version=base)
+
+            version = self.snapshots.create(base)
+            vector_store = None
+            try:
+                components = self._open(version)
+                vector_store, indexer = components
+                stats = indexer.update()
+                count = self._validate(vector_store)
+                self.snapshots.mark_ready(version, {'count': count, 'corpus_version': indexer.corpus_version(),
+                                                    'embedding': self.embedding_backend.id, 'base': base})
+            except Exception:
+                if vector_store is not None:
+                    vector_store.close()  # Fermée avant la suppression de son dossier
+                self.snapshots.discard(version)  # La version servie n'a pas été touchée
+                raise
+            # Les versions encore ouvertes par ce processus ne sont pas supprimées (voir _close_retired)
+            self.snapshots.publish(version, in_use=self._open_versions())
+            with self._swap_lock:
+                self._activate(version, components)
+            return dict(stats, version=version)
+
+    def search(self, query: str, k: int = 3, query_embedding: Optional[np.ndarray] = None):
+        """
+        Recherche les chunks les plus pertinents pour une requête, restreinte au produit qu'elle cite.
+
+        Si le filtre du routeur donne moins de k chunks (produit absent du corpus, mauvais routage),
+        la recherche est refaite sur toute la collection. Avec le re-classement, un ensemble plus
+        large de candidats est récupéré puis réduit aux k meilleurs par le cross-encoder.
+
+        Args:
+            query (str): Question de l'utilisateur
+            k (int): Nombre de chunks à retourner
+            query_embedding (Optional[np.ndarray]): Embedding de la question s'il est déjà calculé
+
+        Returns:
+            Résultats de la recherche ChromaDB
+        """
+        self.refresh()  # Bascule sur une version publiée entre-temps (par ce processus ou un autre)
+        vector_store = self.vector_store  # Même version pour les deux recherches, même si une bascule survient
+        if query_embedding is None:
+            # Une seule consultation du cache par question, même si la recherche est refaite sans filtre
+            query_embedding = vector_store.embed_query(query)
+        n_candidates = max(k, self.rerank_pool) if self.reranker is not None else k
+        where = self.query_router.route(query)
+        context = (vector_store.search(query, n_candidates, where=where, query_embedding=query_embedding)
+                   if where is not None else None)
+        if context is None or len(context['ids'][0]) < k:
+            context = vector_store.search(query, n_candidates, query_embedding=query_embedding)
+        if self.reranker is not None:
+            context = self.reranker.rerank(query, context, k)
+        return context
+
+    def search_batch(self, queries: List[str], k: int = 3,
+                     query_embeddings: Optional[List[np.ndarray]] = None) -> List[Dict]:
+        """
+        Comme search(), pour plusieurs questions : une recherche groupée par filtre de produit.
+
+        Les questions routées vers le même filtre sont encodées et recherchées ensemble ; celles dont
+        le filtre donne moins de k chunks sont recherchées ensemble sur toute la collection.
+
+        Args:
+            queries (List[str]): Questions à traiter
+            k (int): Nombre de chunks à retourner par question
+            query_embeddings (Optional[List[np.ndarray]]): Embeddings des questions s'ils sont déjà calculés
+
+        Returns:
+            List[Dict]: Résultats de la recherche, dans l'ordre des questions
+        """
+        self.refresh()
+        vector_store = self.vector_store  # Même version pour toutes les recherches du lot
+        if query_embeddings is None:
+            query_embeddings = vector_store.embed_queries(queries)  # Un seul encodage et une seule consultation du cache
+        n_candidates = max(k, self.rerank_pool) if self.reranker is not None else k
+        contexts: List[Optional[Dict]] = [None] * len(queries)
+
+        groups: Dict[str, Tuple[Dict, List[int]]] = {}  # Filtre sérialisé -> (filtre, positions des questions)
+        for position, query in enumerate(queries):
+            where = self.query_router.route(query)
+            if where is not None:
+                groups.setdefault(json.dumps(where, sort_keys=True), (where, []))[1].append(position)
+        for where, positions in groups.values():
+            results = vector_store.search_batch([queries[position] for position in positions], n_candidates, where=where,
+                                                query_embeddings=[query_embeddings[position] for position in positions])
+            for position, context in zip(positions, results):
+                if len(context['ids'][0]) >= k:
+                    contexts[position] = context
+
+        # Questions sans produit, ou dont le filtre ne donne pas assez de chunks : toute la collection
+        remaining = [position for position, context in enumerate(contexts) if context is None]
+        if remaining:
+            results = vector_store.search_batch([queries[position] for position in remaining], n_candidates,
+                                                query_embeddings=[query_embeddings[position] for position in remaining])
+            for position, context in zip(remaining, results):
+                contexts[position] = context
+
+        if self.reranker is not None:
+            contexts = [self.reranker.rerank(query, context, k) for query, context in zip(queries, contexts)]
+        return contexts
+
+    def retrieve_batch(self, queries: List[str], k: int = 3) -> List[Tuple[np.ndarray, Dict, List[str]]]:
+        """
+        Comme retrieve(), pour plusieurs questions encodées en un seul lot.
+
+        Args:
+            queries (List[str]): Questions à traiter
+            k (int): Nombre de chunks à récupérer par question
+
+        Returns:
+            List[Tuple[np.ndarray, Dict, List[str]]]: (embedding, résultats de la recherche, identifiants des chunks)
+                pour chaque question, dans l'ordre
+        """
+        with span('retrieve', k=k, queries=len(queries)):
+            # Un seul appel au modèle pour les questions absentes du cache, réutilisé par les recherches
+            query_embeddings = self.vector_store.embed_queries(queries)
+            contexts = self.search_batch(queries, k, query_embeddings=query_embeddings)
+        return [(query_embedding, context, context['ids'][0])
+                for query_embedding, context in zip(query_embeddings, contexts)]
+
+    def retrieve(self, query: str, k: int = 3) -> Tuple[np.ndarray, Dict, List[str]]:
+        """
+        Encode la question et récupère les chunks pertinents.
+
+        Args:
+            query (str): Question de l'utilisateur
+            k (int): Nombre de chunks à récupérer
+
+        Returns:
+            Tuple[np.ndarray, Dict, List[str]]: (embedding de la question, résultats de la recherche, identifiants des chunks)
+        """
+        with span('retrieve', k=k):
+            query_embedding = self.vector_store.embed_query(query)
+            context = self.search(query, k, query_embedding=query_embedding)  # Sans nouvelle consultation du cache
+        return query_embedding, context, context['ids'][0]
+
+    def cached_answer(self, query_embedding: np.ndarray, chunk_ids: List[str]) -> Optional[str]:
+        """
+        Cherche une réponse déjà générée pour une question proche et le même contexte.
+
+        Args:
+            query_embedding (np.ndarray): Embedding de la question
+            chunk_ids (List[str]): Identifiants des chunks du contexte
+
+        Returns:
+            Optional[str]: Réponse en cache, ou None
+        """
+        with span('answer_cache') as current:
+            cached = self.answer_cache.get(query_embedding, chunk_ids)
+            current.set(hit=cached is not None)
+        return cached
+
+    def answer(self, query: str, chatbot: Chatbot, k: int = 3) -> Tuple[str, bool]:
+        """
+        Répond à une question en réutilisant, si possible, une réponse déjà générée.
+
+        Args:
+            query (str): Question de l'utilisateur
+            chatbot (Chatbot): Chatbot de la session, utilisé si la réponse n'est pas en cache
+            k (int): Nombre de chunks à récupérer
+
+        Returns:
+            Tuple[str, bool]: (réponse, True si elle provient du cache)
+        """
+        query_embedding, context, chunk_ids = self.retrieve(query, k)
+
+        cached = self.cached_answer(query_embedding, chunk_ids)
+        if cached is not None:
+            return cached, True
+
+        try:
+            response = chatbot.generate_response(query, context)
+        except LLMUnavailableError:
+            # Modèle en panne : les extraits trouvés, jamais mis en cache (le modèle répondra plus tard)
+            return chatbot.fallback_response(context), False
+        self.answer_cache.put(query_embedding, chunk_ids, response)
+        return response, False
+
+    @staticmethod
+    def context_sources(context: Dict) -> List[str]:
+        """
+        Documents sources d'un résultat de recherche, sans doublons et dans l'ordre de pertinence.
+
+        Args:
+            context (Dict): Résultats de la recherche (une seule requête)
+
+        Returns:
+            List[str]: Noms des fichiers sources
+        """
+        metadatas = (context.get('metadatas') or [[]])[0]
+        return list(dict.fromkeys(metadata['source'] for metadata in metadatas if metadata and metadata.get('source')))
+
+    def answer_stream(self, query: str, chatbot: Chatbot, k: int = 3) -> Tuple[Iterator[str], bool, List[str]]:
+        """
+        Comme answer(), mais la réponse est produite en flux pour être affichée au fil de l'eau.
+
+        La recherche est faite immédiatement ; seule la génération est différée dans le flux.
+        La réponse complète est mise en cache une fois le flux entièrement consommé. Si le modèle
+        est indisponible, le flux contient la réponse de repli (Chatbot.fallback_response), ou
+        une mention d'interruption si la réponse avait commencé.
+
+        Args:
+            query (str): Question de l'utilisateur
+            chatbot (Chatbot): Chatbot de la session, utilisé si la réponse n'est pas en cache
+            k (int): Nombre de chunks à récupérer
+
+        Returns:
+            Tuple[Iterator[str], bool, List[str]]: (flux de morceaux de réponse, True si la réponse provient du cache,
+                documents sources du contexte, pour rattacher les retours utilisateurs aux documents)
+        """
+        query_embedding, context, chunk_ids = self.retrieve(query, k)
+        sources = self.context_sources(context)
+
+        cached = self.cached_answer(query_embedding, chunk_ids)
+        if cached is not None:
+            return iter([cached]), True, sources
+
+        def stream() -> Iterator[str]:
+            parts = []  # Morceaux déjà produits, pour reconstituer la réponse complète
+            try:
+                for part in chatbot.generate_response_stream(query, context):
+                    parts.append(part)
+                    yield part
+            except LLMUnavailableError:
+                yield chatbot.INTERRUPTED_NOTICE if parts else chatbot.fallback_response(context)
+                return
+            # Mise en cache uniquement si la génération est allée jusqu'au bout
+            self.answer_cache.put(query_embedding, chunk_ids, ''.join(parts))
+
+        return stream(), False, sources
+
+
+_engine: Optional[RetrievalEngine] = None  # Instance unique du moteur pour le processus
+_engine_lock = threading.Lock()  # Évite que deux sessions construisent le moteur en même temps
+
+def get_engine() -> RetrievalEngine:
+    """
+    Retourne le moteur partagé, en le créant au premier appel.
+
+    Returns:
+        RetrievalEngine: Instance unique du moteur
+    """
+    global _engine
+    if _engine is None:  # Premier test sans verrou : cas courant une fois le moteur créé
+        with _engine_lock:
+            if _engine is None:  # Second test sous verrou : une autre session a pu le créer entre-temps
+                _engine = RetrievalEngine()
+    return _engine
+
+def reset_engine() -> None:
+    """Oublie le moteur partagé : le prochain appel à get_engine() en construira un nouveau."""
+    global _engine
+    with _engine_lock:
+        _engine = None
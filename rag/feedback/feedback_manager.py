@@ -1,27 +1,82 @@
 import sqlite3  # Importation de sqlite3 pour interagir avec la base de données SQLite
-from datetime import datetime  # Importation de datetime pour gérer les horodatages
-from typing import Dict, List, Tuple  # Importation des types pour la typisation statique
+from contextlib import contextmanager  # Importation de contextmanager pour emprunter une connexion de lecture
+from datetime import datetime, timezone  # Importation de datetime pour gérer les horodatages
+from typing import Dict, List, Optional, Tuple  # Importation des types pour la typisation statique
+import atexit  # Importation d'atexit pour écrire les derniers retours à l'arrêt du processus
+import logging  # Importation de logging pour signaler les échecs d'écriture en arrière-plan
 import os  # Importation de la bibliothèque os pour manipuler les chemins de fichiers et répertoires
+import queue  # Importation de queue pour la file des retours en attente d'écriture
+import threading  # Importation de threading pour le thread d'écriture et le verrou de la connexion
+import time  # Importation de time pour l'horodatage en secondes (epoch) des retours
+
+from rag.monitoring.tracing import get_tracer  # Durée des écritures par lots
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {'hour': 3600, 'day': 86400}  # Taille des intervalles des agrégats, en secondes (jours UTC)
+ALL_SOURCES = ''  # Valeur de 'source' des agrégats qui comptent tous les retours
 
 class FeedbackManager:
     """
     Gère le stockage et la récupération des retours utilisateurs.
+
+    En plus de la table des retours, des agrégats par heure et par jour (au total et par document
+    source) sont mis à jour dans la même transaction que chaque insertion : les statistiques se
+    calculent en parcourant des intervalles de temps, et non toute la table des retours.
+
+    La base est en mode WAL. Une connexion d'écriture, utilisée par le thread d'écriture, reçoit
+    les retours placés dans une file et les écrit par lots : enregistrer un vote ne bloque jamais
+    la requête de l'utilisateur. Les statistiques sont lues par un pool de connexions en lecture
+    seule : elles n'attendent pas la fin d'un lot d'écriture et plusieurs sessions lisent en même
+    temps. Elles reflètent les votes écrits, soit au plus flush_interval secondes de retard ;
+    flush() force l'écriture. Un lot dont l'écriture échoue (base verrouillée, disque plein) est
+    réessayé avec une attente croissante ; il n'est abandonné, et compté dans dropped, qu'après
+    write_retries nouvelles tentatives.
     """
-    
-    def __init__(self, db_path: str = "feedback.db"):
+
+    def __init__(self, db_path: str = "feedback.db", batch_size: int = 64, flush_interval: float = 0.5,
+                 max_idle_readers: int = 4, write_retries: int = 5, retry_backoff: float = 0.5):
         """
         Initialise le gestionnaire de feedback.
-        
+
         Args:
             db_path (str): Chemin vers la base de données SQLite
+            batch_size (int): Nombre maximal de retours écrits dans une même transaction
+            flush_interval (float): Délai maximal (en secondes) avant l'écriture d'un retour
+            max_idle_readers (int): Nombre de connexions de lecture gardées ouvertes entre deux lectures
+            write_retries (int): Nouvelles tentatives d'écriture d'un lot en échec avant de l'abandonner
+            retry_backoff (float): Attente (en secondes) avant la première nouvelle tentative, doublée à chaque fois
         """
         self.db_path = db_path  # Sauvegarde du chemin de la base de données dans un attribut
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_idle_readers = max_idle_readers
+        self.write_retries = max(write_retries, 0)
+        self.retry_backoff = retry_backoff
+        self.dropped = 0  # Retours abandonnés après des échecs d'écriture répétés
+
+        # Connexion d'écriture durable (thread d'écriture, migrations), protégée par un verrou
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._lock = threading.Lock()
         self._init_db()  # Appelle la méthode pour initialiser la base de données
+        # Connexions de lecture libres, réutilisées d'une lecture à l'autre (créées à la demande)
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+
+        # File des retours en attente et thread d'écriture par lots
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self._closed = False
+        self._state_lock = threading.Lock()  # Un vote n'entre jamais dans la file après le signal d'arrêt
+        self._writer = threading.Thread(target=self._write_loop, name="feedback-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)  # Les retours encore en file sont écrits à l'arrêt du processus
 
     def _init_db(self):
         """Initialise la base de données si elle n'existe pas."""
-        # Connexion à la base de données SQLite (elle sera créée si elle n'existe pas)
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock:
+            conn = self._conn
+            # WAL : les lectures (page Statistiques) ne bloquent pas les écritures, et inversement
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # Sûr en WAL, et bien moins d'appels à fsync
             # Création de la table 'feedback' si elle n'existe pas déjà
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS feedback (
@@ -29,47 +84,374 @@ class FeedbackManager:
                     question TEXT NOT NULL,
                     response TEXT NOT NULL,
                     is_helpful BOOLEAN NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    from_cache BOOLEAN NOT NULL DEFAULT 0
                 )
             ''')
+            # Migration des bases créées avant l'ajout de la colonne 'from_cache'
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(feedback)')]
+            if 'from_cache' not in columns:
+                conn.execute('ALTER TABLE feedback ADD COLUMN from_cache BOOLEAN NOT NULL DEFAULT 0')
+            # Horodatage en secondes (indexé) et documents sources de la réponse notée
+            if 'created_at' not in columns:
+                conn.execute('ALTER TABLE feedback ADD COLUMN created_at INTEGER')
+                conn.execute("UPDATE feedback SET created_at = CAST(strftime('%s', timestamp) AS INTEGER)")
+            if 'sources' not in columns:
+                conn.execute("ALTER TABLE feedback ADD COLUMN sources TEXT NOT NULL DEFAULT ''")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_feedback_created_at ON feedback (created_at)')
+
+            # Agrégats : compteurs par intervalle de temps, par document source et selon l'origine (cache ou non)
+            has_rollup = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feedback_rollup'"
+            ).fetchone()
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS feedback_rollup (
+                    granularity TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    from_cache INTEGER NOT NULL,
+                    positive INTEGER NOT NULL DEFAULT 0,
+                    negative INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, source, bucket, from_cache)
+                ) WITHOUT ROWID
+            ''')
             conn.commit()  # Applique les changements dans la base de données
+        if not has_rollup:  # Base existante : les agrégats sont calculés une fois à partir des retours
+            self._rebuild_rollups()
 
-    def add_feedback(self, question: str, response: str, is_helpful: bool):
+    @staticmethod
+    def _rollup_increments(rows: List[Tuple[int, bool, bool, str]]) -> List[Tuple]:
         """
-        Ajoute un nouveau feedback dans la base de données.
-        
+        Calcule les incréments des agrégats pour un lot de retours.
+
+        Args:
+            rows (List[Tuple[int, bool, bool, str]]): (created_at, utile, depuis le cache, sources) pour chaque retour,
+                les sources étant séparées par des retours à la ligne
+
+        Returns:
+            List[Tuple]: (granularité, source, intervalle, depuis le cache, positifs, négatifs) pour chaque agrégat touché
+        """
+        counts: Dict[Tuple[str, str, int, int], List[int]] = {}
+        for created_at, is_helpful, from_cache, sources in rows:
+            for source in [ALL_SOURCES] + [name for name in (sources or '').split('\n') if name]:
+                for granularity, size in GRANULARITIES.items():
+                    key = (granularity, source, created_at - created_at % size, int(bool(from_cache)))
+                    counter = counts.setdefault(key, [0, 0])
+                    counter[0 if is_helpful else 1] += 1
+        return [key + tuple(counter) for key, counter in counts.items()]
+
+    def _apply_rollups(self, increments: List[Tuple]):
+        """Ajoute des incréments aux agrégats (verrou et transaction pris par l'appelant)."""
+        self._conn.executemany('''
+            INSERT INTO feedback_rollup (granularity, source, bucket, from_cache, positive, negative)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, source, bucket, from_cache) DO UPDATE SET
+                positive = positive + excluded.positive,
+                negative = negative + excluded.negative
+        ''', increments)
+
+    def _rebuild_rollups(self, chunk_size: int = 10000):
+        """
+        Recalcule tous les agrégats à partir de la table des retours (migration d'une base existante).
+
+        Args:
+            chunk_size (int): Nombre de retours lus à la fois
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM feedback_rollup')
+                cursor = self._conn.execute(
+                    'SELECT created_at, is_helpful, from_cache, sources FROM feedback WHERE created_at IS NOT NULL'
+                )
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    self._apply_rollups(self._rollup_increments(rows))
+
+    def add_feedback(self, question: str, response: str, is_helpful: bool, from_cache: bool = False,
+                     sources: Optional[List[str]] = None):
+        """
+        Ajoute un nouveau feedback à la file d'écriture (retour immédiat, écriture en arrière-plan).
+
         Args:
             question (str): Question posée par l'utilisateur
             response (str): Réponse du chatbot
             is_helpful (bool): True si la réponse était utile, False sinon
+            from_cache (bool): True si la réponse provenait du cache de réponses
+            sources (Optional[List[str]]): Documents sources du contexte de la réponse
+
+        Raises:
+            RuntimeError: Si le gestionnaire a été fermé (close)
         """
-        # Connexion à la base de données pour ajouter un retour
-        with sqlite3.connect(self.db_path) as conn:
-            # Exécution de la commande d'insertion dans la table 'feedback'
-            conn.execute(
-                'INSERT INTO feedback (question, response, is_helpful) VALUES (?, ?, ?)',
-                (question, response, is_helpful)  # Remplacement des paramètres par les valeurs réelles
-            )
-            conn.commit()  # Applique les changements dans la base de données
+        # Horodatage au moment du vote (et non de l'écriture) : en secondes, et au format de CURRENT_TIMESTAMP (UTC)
+        created_at = int(time.time())
+        timestamp = datetime.fromtimestamp(created_at, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        sources_text = '\n'.join(dict.fromkeys(sources or []))  # Sans doublons, dans l'ordre de pertinence
+        with self._state_lock:
+            if self._closed:
+                raise RuntimeError("Gestionnaire de feedback fermé : le retour n'a pas été enregistré")
+            self._queue.put((question, response, bool(is_helpful), bool(from_cache), timestamp, created_at, sources_text))
+
+    def _write_loop(self):
+        """Boucle du thread d'écriture : regroupe les retours en attente et les écrit par lots."""
+        while True:
+            item = self._queue.get()
+            if item is None:  # Signal d'arrêt envoyé par close()
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            # Laisse flush_interval aux votes proches dans le temps pour rejoindre la même transaction,
+            # puis prend sans attendre tout ce qui est déjà en file
+            while len(batch) < self.batch_size:
+                try:
+                    if len(batch) == 1:
+                        item = self._queue.get(timeout=self.flush_interval)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_with_retries(batch)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_with_retries(self, rows: List[Tuple]):
+        """
+        Écrit un lot, en réessayant avec une attente croissante si la base est indisponible.
+
+        Chaque échec annule sa transaction : une nouvelle tentative n'écrit jamais un retour deux fois.
+
+        Args:
+            rows (List[Tuple]): Lot de retours (voir _write_batch)
+        """
+        for attempt in range(self.write_retries + 1):
+            try:
+                self._write_batch(rows)
+                return
+            except sqlite3.Error as error:
+                if attempt == self.write_retries:
+                    self.dropped += len(rows)  # Seul le thread d'écriture modifie ce compteur
+                    logger.exception("Échec de l'écriture de %d retours utilisateurs après %d tentatives : "
+                                     "retours perdus (%d au total)", len(rows), attempt + 1, self.dropped)
+                    return
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning("Échec de l'écriture de %d retours utilisateurs (%s), nouvelle tentative dans %.1f s",
+                               len(rows), error, delay)
+                time.sleep(delay)
+
+    def _write_batch(self, rows: List[Tuple]):
+        """
+        Écrit un lot de retours et met à jour les agrégats dans une seule transaction.
+
+        Args:
+            rows (List[Tuple]): (question, réponse, utile, depuis le cache, horodatage, created_at, sources)
+                pour chaque retour
+        """
+        with get_tracer().trace('feedback.write', rows=len(rows)):
+            increments = self._rollup_increments([(row[5], row[2], row[3], row[6]) for row in rows])
+            with self._lock:
+                with self._conn:  # Transaction : retours et agrégats restent cohérents (validés ou annulés ensemble)
+                    self._conn.executemany(
+                        'INSERT INTO feedback (question, response, is_helpful, from_cache, timestamp, created_at, sources) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        rows
+                    )
+                    self._apply_rollups(increments)
+
+    def flush(self):
+        """Attend que tous les retours en file soient écrits dans la base."""
+        self._queue.join()
+
+    def close(self):
+        """Écrit les retours en attente, arrête le thread d'écriture et ferme les connexions."""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+    @contextmanager
+    def _reader(self):
+        """
+        Emprunte une connexion de lecture au pool (nouvelle connexion si aucune n'est libre).
 
-    def get_statistics(self) -> Tuple[int, int]:
+        Yields:
+            sqlite3.Connection: Connexion en lecture seule, rendue au pool après usage
+        """
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0)
+            conn.execute('PRAGMA query_only=ON')
+        try:
+            yield conn
+        finally:
+            # Au-delà de max_idle_readers connexions libres (pic de lectures), la connexion est fermée
+            if self._closed or self._readers.qsize() >= self.max_idle_readers:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    @staticmethod
+    def _bucket_start(since: Optional[int], granularity: str) -> int:
+        """Début de l'intervalle qui contient la date since (0 si aucune date)."""
+        if since is None:
+            return 0
+        return since - since % GRANULARITIES[granularity]
+
+    def get_statistics(self, since: Optional[int] = None) -> Tuple[int, int]:
         """
         Récupère les statistiques de satisfaction.
-        
+
+        Args:
+            since (Optional[int]): Début de la période (epoch, arrondi au jour). None : depuis le début
+
         Returns:
             Tuple[int, int]: (nombre de retours positifs, nombre de retours négatifs)
         """
-        # Connexion à la base de données pour récupérer les statistiques
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()  # Création d'un curseur pour exécuter des requêtes SQL
-            # Requête SQL pour compter les retours positifs et négatifs
-            cursor.execute('''
-                SELECT 
-                    SUM(CASE WHEN is_helpful THEN 1 ELSE 0 END) as positive,
-                    SUM(CASE WHEN NOT is_helpful THEN 1 ELSE 0 END) as negative
-                FROM feedback
-            ''')
+        with self._reader() as conn:
+            # Somme des agrégats journaliers : une ligne par jour au lieu d'une par retour
+            cursor = conn.execute('''
+                SELECT SUM(positive), SUM(negative)
+                FROM feedback_rollup
+                WHERE granularity = 'day' AND source = ? AND bucket >= ?
+            ''', (ALL_SOURCES, self._bucket_start(since, 'day')))
             # Récupère les résultats de la requête
             positive, negative = cursor.fetchone()
-            # Retourne les statistiques, en s'assurant que si aucune donnée n'est présente, on retourne 0
-            return (positive or 0, negative or 0)
+        # Retourne les statistiques, en s'assurant que si aucune donnée n'est présente, on retourne 0
+        return (positive or 0, negative or 0)
+
+    def get_cache_statistics(self) -> Dict[bool, Tuple[int, int]]:
+        """
+        Récupère les statistiques de satisfaction selon que la réponse provenait du cache ou non.
+
+        Permet de régler le seuil de similarité du cache de réponses : si les réponses servies
+        depuis le cache sont moins bien notées, le seuil est trop permissif.
+
+        Returns:
+            Dict[bool, Tuple[int, int]]: {from_cache: (retours positifs, retours négatifs)}
+        """
+        with self._reader() as conn:
+            rows = conn.execute('''
+                SELECT from_cache, SUM(positive), SUM(negative)
+                FROM feedback_rollup
+                WHERE granularity = 'day' AND source = ?
+                GROUP BY from_cache
+            ''', (ALL_SOURCES,)).fetchall()
+        statistics = {False: (0, 0), True: (0, 0)}
+        for from_cache, positive, negative in rows:
+            statistics[bool(from_cache)] = (positive or 0, negative or 0)
+        return statistics
+
+    def get_timeseries(self, granularity: str = 'day', since: Optional[int] = None,
+                       source: Optional[str] = None) -> List[Tuple[int, int, int]]:
+        """
+        Évolution des retours par heure ou par jour.
+
+        Args:
+            granularity (str): 'hour' ou 'day'
+            since (Optional[int]): Début de la période (epoch, arrondi à l'intervalle). None : depuis le début
+            source (Optional[str]): Document source à suivre. None : tous les retours
+
+        Returns:
+            List[Tuple[int, int, int]]: (début de l'intervalle en epoch, positifs, négatifs) par date croissante,
+                sans les intervalles qui n'ont reçu aucun retour
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularité inconnue : {granularity} (disponibles : {', '.join(GRANULARITIES)})")
+        with self._reader() as conn:
+            rows = conn.execute('''
+                SELECT bucket, SUM(positive), SUM(negative)
+                FROM feedback_rollup
+                WHERE granularity = ? AND source = ? AND bucket >= ?
+                GROUP BY bucket
+                ORDER BY bucket
+            ''', (granularity, source or ALL_SOURCES, self._bucket_start(since, granularity))).fetchall()
+        return [(bucket, positive or 0, negative or 0) for bucket, positive, negative in rows]
+
+    def get_source_statistics(self, since: Optional[int] = None) -> Dict[str, Tuple[int, int]]:
+        """
+        Statistiques de satisfaction par document source.
+
+        Un retour compte pour chacun des documents qui ont servi de contexte à la réponse notée.
+
+        Args:
+            since (Optional[int]): Début de la période (epoch, arrondi au jour). None : depuis le début
+
+        Returns:
+            Dict[str, Tuple[int, int]]: {document source: (retours positifs, retours négatifs)}
+        """
+        with self._reader() as conn:
+            rows = conn.execute('''
+                SELECT source, SUM(positive), SUM(negative)
+                FROM feedback_rollup
+                WHERE granularity = 'day' AND source != ? AND bucket >= ?
+                GROUP BY source
+            ''', (ALL_SOURCES, self._bucket_start(since, 'day'))).fetchall()
+        return {source: (positive or 0, negative or 0) for source, positive, negative in rows}
+
+    def get_questions(self, is_helpful: Optional[bool] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Questions notées, avec le dernier retour reçu pour chacune (rejeu pour les tests de non-régression).
+
+        Args:
+            is_helpful (Optional[bool]): Ne garder que les questions dont le dernier retour est positif (True)
+                ou négatif (False). None : toutes
+            limit (Optional[int]): Nombre maximal de questions, les plus récemment notées d'abord
+
+        Returns:
+            List[Dict]: 'question', 'response', 'is_helpful', 'created_at' (epoch) et 'sources' du dernier retour
+        """
+        with self._reader() as conn:
+            # Dernier retour de chaque question (l'identifiant croît avec l'ordre d'arrivée)
+            rows = conn.execute('''
+                SELECT question, response, is_helpful, created_at, sources
+                FROM feedback
+                WHERE id IN (SELECT MAX(id) FROM feedback GROUP BY question)
+                ORDER BY id DESC
+            ''').fetchall()
+        questions = [{'question': question, 'response': response, 'is_helpful': bool(helpful),
+                      'created_at': created_at, 'sources': sources.split('\n') if sources else []}
+                     for question, response, helpful, created_at, sources in rows
+                     if is_helpful is None or bool(helpful) == is_helpful]
+        return questions[:limit] if limit is not None else questions
+
+
+_feedback_managers: Dict[str, FeedbackManager] = {}  # Une instance par fichier de base, pour tout le processus
+_feedback_lock = threading.Lock()
+
+def get_feedback_manager(db_path: str = "feedback.db") -> FeedbackManager:
+    """
+    Retourne le gestionnaire de feedback partagé pour une base, en le créant au premier appel.
+
+    Args:
+        db_path (str): Chemin vers la base de données SQLite
+
+    Returns:
+        FeedbackManager: Instance unique pour ce fichier
+    """
+    key = os.path.abspath(db_path)
+    manager = _feedback_managers.get(key)
+    if manager is None:
+        with _feedback_lock:
+            manager = _feedback_managers.get(key)
+            if manager is None:  # Une autre session a pu le créer entre-temps
+                manager = _feedback_managers[key] = FeedbackManager(db_path)
+    return manager
@@ -0,0 +1,203 @@
+from typing import Dict, Iterable, List, Optional, Tuple  # Importation des types pour la typisation statique
+import os  # Importation de os pour l'écriture atomique de l'index
+import re  # Importation du module regex pour découper le texte en termes
+import tempfile  # Importation de tempfile pour un fichier temporaire propre à chaque sauvegarde
+import unicodedata  # Importation d'unicodedata pour ignorer les accents
+
+import numpy as np  # Importation de numpy pour les listes de postings compactes et le calcul des scores
+
+# Mots outils français ignorés : très fréquents, ils n'aident pas à distinguer les documents
+STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette d dans de des du elle en est et il ils l la le les leur leurs lui
+ma mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sont
+sur ta te tes toi ton tu un une vos votre vous y etre avoir si est-ce quel quelle quels quelles
+""".split())
+
+TOKEN_PATTERN = re.compile(r'\w+')  # Mots et nombres (montants, numéros d'articles)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en termes pour l'index lexical.
+
+    Les accents et la casse sont ignorés ("Dégât" et "degat" donnent le même terme) ;
+    les nombres sont conservés car les questions portent souvent sur des montants ou des articles.
+
+    Args:
+        text (str): Texte à découper
+
+    Returns:
+        List[str]: Termes du texte, sans les mots outils
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))  # Suppression des accents
+    return [term for term in TOKEN_PATTERN.findall(text) if term not in STOPWORDS]
+
+class BM25Index:
+    """
+    Index lexical BM25 en mémoire.
+
+    Les postings sont stockés au format CSR dans des tableaux numpy : pour le terme t, les
+    documents sont doc_ids[offsets[t]:offsets[t + 1]] et les fréquences correspondantes
+    term_freqs[offsets[t]:offsets[t + 1]]. L'index est reconstruit en bloc (il n'est pas
+    modifié en place) et peut être sauvegardé à côté de la base ChromaDB.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialise un index vide.
+
+        Args:
+            k1 (float): Saturation de la fréquence des termes
+            b (float): Normalisation par la longueur des documents
+        """
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []  # Identifiants des chunks (position = numéro de document)
+        self.vocabulary: Dict[str, int] = {}  # Terme -> numéro de terme
+        self.offsets = np.zeros(1, dtype=np.int64)  # Début des postings de chaque terme
+        self.doc_ids = np.zeros(0, dtype=np.int32)  # Numéros de documents des postings
+        self.term_freqs = np.zeros(0, dtype=np.uint16)  # Fréquence du terme dans chaque document
+        self.doc_lengths = np.zeros(0, dtype=np.int32)  # Nombre de termes de chaque document
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Construit un index à partir d'un flux de documents.
+
+        Args:
+            documents (Iterable[Tuple[str, str]]): Couples (identifiant du chunk, texte)
+            k1 (float): Saturation de la fréquence des termes
+            b (float): Normalisation par la longueur des documents
+
+        Returns:
+            BM25Index: Index construit
+        """
+        index = cls(k1, b)
+        postings: Dict[int, Tuple[List[int], List[int]]] = {}  # Numéro de terme -> (documents, fréquences)
+        lengths = []
+        for doc_number, (chunk_id, text) in enumerate(documents):
+            terms = tokenize(text)
+            index.ids.append(chunk_id)
+            lengths.append(len(terms))
+            counts: Dict[int, int] = {}
+            for term in terms:
+                term_id = index.vocabulary.setdefault(term, len(index.vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            for term_id, count in counts.items():
+                docs, freqs = postings.setdefault(term_id, ([], []))
+                docs.append(doc_number)
+                freqs.append(min(count, np.iinfo(np.uint16).max))
+
+        # Passage au format CSR : une seule paire de tableaux pour tout le vocabulaire
+        sizes = np.array([len(postings[term_id][0]) for term_id in range(len(index.vocabulary))], dtype=np.int64)
+        index.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        index.doc_ids = np.fromiter(
+            (doc for term_id in range(len(index.vocabulary)) for doc in postings[term_id][0]),
+            dtype=np.int32, count=int(index.offsets[-1])
+        )
+        index.term_freqs = np.fromiter(
+            (freq for term_id in range(len(index.vocabulary)) for freq in postings[term_id][1]),
+            dtype=np.uint16, count=int(index.offsets[-1])
+        )
+        index.doc_lengths = np.array(lengths, dtype=np.int32)
+        return index
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Retourne les k chunks ayant le meilleur score BM25 pour la requête.
+
+        Args:
+            query (str): Requête de l'utilisateur
+            k (int): Nombre de résultats
+            mask (Optional[np.ndarray]): Tableau booléen (un élément par document) des chunks autorisés. None : tous
+
+        Returns:
+            List[Tuple[str, float]]: Couples (identifiant du chunk, score), du meilleur au moins bon
+        """
+        if not self.ids:
+            return []
+        n_docs = len(self.ids)
+        average_length = float(self.doc_lengths.mean()) or 1.0
+        norms = self.k1 * (1 - self.b + self.b * self.doc_lengths / average_length)  # Normalisation par longueur
+        scores = np.zeros(n_docs, dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms[docs])
+
+        if mask is not None:
+            scores[~mask] = 0  # Chunks exclus par le filtre de métadonnées
+
+        # Sélection partielle des k meilleurs (argpartition), puis tri de ces seuls k
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.ids[doc], float(scores[doc])) for doc in candidates]
+
+    def mask_for(self, allowed_ids: Iterable[str]) -> np.ndarray:
+        """
+        Construit le masque des documents autorisés à partir de leurs identifiants.
+
+        Args:
+            allowed_ids (Iterable[str]): Identifiants des chunks autorisés
+
+        Returns:
+            np.ndarray: Tableau booléen à passer à search()
+        """
+        allowed = set(allowed_ids)
+        return np.fromiter((chunk_id in allowed for chunk_id in self.ids), dtype=bool, count=len(self.ids))
+
+    def save(self, path: str) -> None:
+        """
+        Sauvegarde l'index dans un fichier .npz de manière atomique.
+
+        Args:
+            path (str): Chemin du fichier
+        """
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)  # Termes dans l'ordre de leur numéro
+        directory = os.path.dirname(os.path.abspath(path))
+        # Fichier temporaire unique : deux sessions qui reconstruisent l'index n'écrivent jamais dans le même fichier
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, ids=np.array(self.ids, dtype=str), terms=np.array(terms, dtype=str),
+                         offsets=self.offsets, doc_ids=self.doc_ids, term_freqs=self.term_freqs,
+                         doc_lengths=self.doc_lengths, params=np.array([self.k1, self.b]))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """
+        Charge un index sauvegardé.
+
+        Args:
+            path (str): Chemin du fichier
+
+        Returns:
+            Optional[BM25Index]: Index chargé, ou None si le fichier est absent ou illisible
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                index = cls(*data['params'].tolist())
+                index.ids = data['ids'].tolist()
+                index.vocabulary = {term: term_id for term_id, term in enumerate(data['terms'].tolist())}
+                index.offsets = data['offsets']
+                index.doc_ids = data['doc_ids']
+                index.term_freqs = data['term_freqs']
+                index.doc_lengths = data['doc_lengths']
+        except (OSError, KeyError, ValueError):
+            return None
+        return index
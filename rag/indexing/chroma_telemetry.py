@@ -0,0 +1,16 @@
+"""
+Télémétrie ChromaDB désactivée.
+
+Le client de télémétrie fourni avec ChromaDB 0.5 regroupe ses événements dans un dictionnaire
+sans verrou, même quand la télémétrie est désactivée : des recherches simultanées sur une même
+base y provoquent des KeyError. VectorStore le remplace par ce client qui ignore les événements.
+"""
+from chromadb.telemetry.product import ProductTelemetryClient, ProductTelemetryEvent  # Interface du client de télémétrie
+from overrides import override  # Exigé par ChromaDB pour toute méthode redéfinie d'un composant
+
+class NoTelemetry(ProductTelemetryClient):
+    """Client de télémétrie qui n'envoie ni ne regroupe aucun événement."""
+
+    @override
+    def capture(self, event: ProductTelemetryEvent) -> None:
+        pass
@@ -1,51 +1,169 @@
-from bs4 import BeautifulSoup  # Importation de BeautifulSoup pour parser les documents HTML
-from typing import List, Dict  # Importation des types pour une typisation statique claire
+from typing import List, Dict, Optional, Iterator  # Importation des types pour une typisation statique claire
+from collections import deque  # Importation de deque pour la fenêtre de tâches en cours
+from concurrent.futures import ProcessPoolExecutor  # Importation du pool de processus pour le parsing parallèle
+import multiprocessing  # Importation de multiprocessing pour choisir le mode de démarrage des processus
 import os  # Importation de la bibliothèque os pour manipuler les fichiers et répertoires
 
+from rag.indexing.products import product_of  # Gamme de produits déduite du nom de fichier
+
+def _resolve_parser(parser: str) -> str:
+    """
+    Choisit le parser HTML utilisé par BeautifulSoup.
+
+    Args:
+        parser (str): "auto", "lxml" ou "html.parser". "auto" utilise lxml s'il est installé
+
+    Returns:
+        str: Nom du parser à passer à BeautifulSoup
+    """
+    if parser != 'auto':
+        return parser
+    try:
+        import lxml  # noqa: F401  (lxml est optionnel : beaucoup plus rapide que html.parser)
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+def _extract_text(file_path: str, parser: str) -> str:
+    """
+    Lit un fichier HTML et en extrait le texte.
+
+    Fonction de module (et non méthode) pour pouvoir être exécutée dans un processus du pool.
+
+    Args:
+        file_path (str): Chemin complet du fichier HTML
+        parser (str): Parser HTML utilisé par BeautifulSoup
+
+    Returns:
+        str: Texte du document
+    """
+    from bs4 import BeautifulSoup  # Import différé : BeautifulSoup n'est chargé que si des documents sont parsés
+    with open(file_path, 'r', encoding='utf-8') as file:  # Ouvre le fichier en mode lecture avec encodage UTF-8
+        soup = BeautifulSoup(file.read(), parser)  # Utilise BeautifulSoup pour parser le contenu HTML
+
+    # Extraction du texte en supprimant les éléments <script> et <style>
+    for script in soup(['script', 'style']):  # Parcourt tous les éléments <script> et <style>
+        script.decompose()  # Supprime ces éléments du document HTML pour ne garder que le texte
+
+    # Récupère le texte du document HTML, un élément par ligne pour conserver les titres de sections, sans espaces superflus
+    return soup.get_text(separator='\n', strip=True)
+
 class DocumentLoader:
     """
     Classe responsable du chargement et du parsing des documents HTML.
     """
-    
-    def __init__(self, documents_path: str):
+
+    VERSION = 3  # À incrémenter quand l'extraction du texte change (force la réindexation)
+    MIN_PARALLEL_FILES = 8  # En dessous, démarrer des processus coûte plus cher que parser en série
+
+    def __init__(self, documents_path: str, parser: str = 'auto', workers: int = 1):
         """
         Initialise le chargeur de documents.
-        
+
         Args:
             documents_path (str): Chemin vers le dossier contenant les documents HTML
+            parser (str): Parser HTML ("auto", "lxml" ou "html.parser"). "auto" préfère lxml s'il est installé
+            workers (int): Nombre de processus pour le parsing. 1 pour un parsing séquentiel
         """
         self.documents_path = documents_path  # Le chemin vers le dossier des documents HTML est sauvegardé comme attribut
-    
-    def load_documents(self) -> List[Dict[str, str]]:
+        self.parser = _resolve_parser(parser)  # Parser effectivement utilisé
+        self.workers = max(1, workers)  # Nombre de processus de parsing
+
+    def list_files(self) -> List[str]:
+        """
+        Liste les fichiers HTML du dossier, triés par nom pour un ordre déterministe.
+
+        Returns:
+            List[str]: Noms des fichiers HTML (sans le chemin du dossier)
+        """
+        return sorted(filename for filename in os.listdir(self.documents_path) if filename.endswith('.html'))
+
+    def _make_document(self, filename: str, text: str) -> Dict[str, str]:
+        """
+        Construit le dictionnaire d'un document à partir de son texte.
+
+        Args:
+            filename (str): Nom du fichier HTML
+            text (str): Texte extrait du fichier
+
+        Returns:
+            Dict[str, str]: Dictionnaire contenant le contenu et les métadonnées du document
+        """
+        return {
+            'page_content': text,  # Le texte du document
+            'metadata': {  # Les métadonnées associées au document
+                'source': filename,  # Nom du fichier comme source
+                'type': 'assurance',  # Type de document (dans ce cas, "assurance")
+                'product': product_of(filename)  # Gamme de produits (auto, degat_des_eaux, incendie, vol), pour filtrer la recherche
+            }
+        }
+
+    def load_document(self, filename: str) -> Dict[str, str]:
+        """
+        Charge un seul document HTML et le convertit en format texte.
+
+        Args:
+            filename (str): Nom du fichier HTML dans le dossier des documents
+
+        Returns:
+            Dict[str, str]: Dictionnaire contenant le contenu et les métadonnées du document
+        """
+        file_path = os.path.join(self.documents_path, filename)  # Construit le chemin complet du fichier HTML
+        return self._make_document(filename, _extract_text(file_path, self.parser))
+
+    def iter_documents(self, filenames: Optional[List[str]] = None) -> Iterator[Dict[str, str]]:
+        """
+        Charge les documents HTML un par un, dans l'ordre des noms de fichiers.
+
+        Avec plusieurs workers, le parsing est fait par un pool de processus pendant que
+        l'appelant découpe et encode les documents déjà produits. Seule une fenêtre bornée
+        de fichiers est en cours de traitement, et l'ordre de sortie reste déterministe.
+
+        Args:
+            filenames (Optional[List[str]]): Fichiers à charger. Par défaut, tous les fichiers HTML du dossier
+
+        Yields:
+            Dict[str, str]: Documents avec leur contenu et leurs métadonnées
         """
-        Charge tous les documents HTML du dossier spécifié et les convertit en format texte.
-        
+        if filenames is None:  # Sans liste explicite, on charge tout le dossier
+            filenames = self.list_files()
+
+        # Parsing séquentiel : peu de fichiers ou un seul worker
+        if self.workers == 1 or len(filenames) < self.MIN_PARALLEL_FILES:
+            for filename in filenames:
+                yield self.load_document(filename)
+            return
+
+        # Parsing parallèle. "spawn" évite de dupliquer un processus qui a déjà chargé le modèle et ses threads
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            pending = deque()  # Tâches soumises, dans l'ordre des fichiers
+            remaining = iter(filenames)
+
+            def submit_next() -> None:
+                # Soumet le fichier suivant au pool, s'il en reste
+                filename = next(remaining, None)
+                if filename is not None:
+                    file_path = os.path.join(self.documents_path, filename)
+                    pending.append((filename, executor.submit(_extract_text, file_path, self.parser)))
+
+            # Fenêtre de quelques tâches par worker : mémoire bornée, processus toujours occupés
+            for _ in range(self.workers * 4):
+                submit_next()
+
+            while pending:
+                filename, future = pending.popleft()  # Toujours le plus ancien : ordre déterministe
+                submit_next()
+                yield self._make_document(filename, future.result())
+
+    def load_documents(self, filenames: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """
+        Charge les documents HTML du dossier spécifié et les convertit en format texte.
+
+        Args:
+            filenames (Optional[List[str]]): Fichiers à charger. Par défaut, tous les fichiers HTML du dossier
+
         Returns:
             List[Dict[str, str]]: Liste de dictionnaires contenant le contenu et les métadonnées des documents
         """
-        documents = []  # Liste qui stockera les documents chargés sous forme de dictionnaires
-        
-        # Parcourt tous les fichiers du répertoire spécifié
-        for filename in os.listdir(self.documents_path):  # Liste tous les fichiers dans le répertoire documents_path
-            if filename.endswith('.html'):  # Vérifie si le fichier est un fichier HTML
-                file_path = os.path.join(self.documents_path, filename)  # Construit le chemin complet du fichier HTML
-                with open(file_path, 'r', encoding='utf-8') as file:  # Ouvre le fichier en mode lecture avec encodage UTF-8
-                    soup = BeautifulSoup(file.read(), 'html.parser')  # Utilise BeautifulSoup pour parser le contenu HTML
-                    
-                    # Extraction du texte en supprimant les éléments <script> et <style>
-                    for script in soup(['script', 'style']):  # Parcourt tous les éléments <script> et <style>
-                        script.decompose()  # Supprime ces éléments du document HTML pour ne garder que le texte
-                    
-                    # Récupère le texte du document HTML en un seul bloc, séparé par des espaces, et supprime les espaces superflus
-                    text = soup.get_text(separator=' ', strip=True)
-                    
-                    # Ajoute le texte extrait et les métadonnées dans un dictionnaire
-                    documents.append({
-                        'page_content': text,  # Le texte du document
-                        'metadata': {  # Les métadonnées associées au document
-                            'source': filename,  # Nom du fichier comme source
-                            'type': 'assurance'  # Type de document (dans ce cas, "assurance")
-                        }
-                    })
-                    
-        return documents  # Retourne la liste des documents sous forme de dictionnaires
+        return list(self.iter_documents(filenames))  # Charge chaque document dans l'ordre
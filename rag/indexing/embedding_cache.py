@@ -0,0 +1,175 @@
+from collections import OrderedDict  # Importation d'OrderedDict pour l'éviction LRU
+from typing import Callable, Dict, Optional  # Importation des types pour la typisation statique
+import atexit  # Importation d'atexit pour sauvegarder le cache à l'arrêt du processus
+import os  # Importation de os pour l'écriture atomique du fichier de cache
+import re  # Importation du module regex pour normaliser les requêtes
+import tempfile  # Importation de tempfile pour un fichier temporaire propre à chaque sauvegarde
+import threading  # Importation des verrous : le cache est partagé entre les sessions
+import unicodedata  # Importation d'unicodedata pour normaliser les caractères accentués
+
+import numpy as np  # Importation de numpy pour stocker les embeddings en float32
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU des embeddings de requêtes, indexé par la requête normalisée.
+
+    Le cache peut être sauvegardé sur disque (fichier .npz) pour que les questions fréquentes
+    soient déjà encodées au redémarrage. L'espace de noms (nom du modèle) est enregistré avec
+    les données : un cache produit par un autre modèle est ignoré au chargement.
+    """
+
+    def __init__(self, max_size: int = 1024, persist_path: Optional[str] = None,
+                 namespace: str = "", autosave_every: int = 50):
+        """
+        Initialise le cache.
+
+        Args:
+            max_size (int): Nombre maximal de requêtes conservées
+            persist_path (Optional[str]): Fichier de sauvegarde. None pour un cache uniquement en mémoire
+            namespace (str): Identifiant du modèle d'embedding qui a produit les vecteurs
+            autosave_every (int): Nombre de nouvelles entrées entre deux sauvegardes automatiques
+        """
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.namespace = namespace
+        self.autosave_every = autosave_every
+        self.hits = 0  # Nombre de requêtes trouvées dans le cache
+        self.misses = 0  # Nombre de requêtes qu'il a fallu encoder
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()  # Requête normalisée -> embedding
+        self._unsaved = 0  # Nouvelles entrées depuis la dernière sauvegarde
+        self._lock = threading.Lock()
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)  # Sauvegarde finale à l'arrêt du processus
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Normalise une requête pour que les variantes triviales partagent la même entrée.
+
+        Args:
+            query (str): Requête brute de l'utilisateur
+
+        Returns:
+            str: Requête en minuscules, espaces réduits, sans ponctuation finale
+        """
+        query = unicodedata.normalize('NFKC', query).lower()  # Formes unicode et casse homogènes
+        query = re.sub(r'\s+', ' ', query).strip()  # Espaces multiples réduits à un seul
+        return query.rstrip(' ?!.')  # "Quels délais ?" et "quels délais" donnent la même clé
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        Cherche l'embedding d'une requête dans le cache.
+
+        Args:
+            query (str): Requête de l'utilisateur
+
+        Returns:
+            Optional[np.ndarray]: Embedding en lecture seule, ou None si absent
+        """
+        key = self.normalize(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)  # Entrée la plus récemment utilisée
+            self.hits += 1
+            return embedding
+
+    def put(self, query: str, embedding: np.ndarray) -> np.ndarray:
+        """
+        Ajoute l'embedding d'une requête au cache, en évinçant la moins récemment utilisée si besoin.
+
+        Args:
+            query (str): Requête de l'utilisateur
+            embedding (np.ndarray): Embedding de la requête
+
+        Returns:
+            np.ndarray: Copie float32 en lecture seule de l'embedding, telle que stockée
+        """
+        embedding = np.array(embedding, dtype=np.float32)  # Copie : l'appelant ne peut pas modifier le cache
+        embedding.setflags(write=False)
+        key = self.normalize(query)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:  # Éviction LRU
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            save_now = bool(self.persist_path) and self._unsaved >= self.autosave_every
+        if save_now:
+            self.save()
+        return embedding
+
+    def get_or_compute(self, query: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        """
+        Retourne l'embedding en cache, ou le calcule et le mémorise.
+
+        Args:
+            query (str): Requête de l'utilisateur
+            compute (Callable[[str], np.ndarray]): Fonction d'encodage appelée en cas d'absence
+
+        Returns:
+            np.ndarray: Embedding float32 de la requête
+        """
+        embedding = self.get(query)
+        if embedding is None:
+            embedding = self.put(query, compute(query))
+        return embedding
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            Dict[str, float]: Taille, succès, échecs et taux de succès
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def save(self) -> None:
+        """Sauvegarde le cache sur disque de manière atomique (fichier temporaire puis renommage)."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            if not self._entries or self._unsaved == 0:
+                return
+            keys = np.array(list(self._entries.keys()), dtype=object)
+            matrix = np.stack(list(self._entries.values()))
+            self._unsaved = 0
+
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        os.makedirs(directory, exist_ok=True)
+        # Fichier temporaire unique : la sauvegarde périodique et celle de l'arrêt du processus peuvent se croiser
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.persist_path) + '.', suffix='.tmp.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, keys=keys.astype(str), embeddings=matrix, namespace=np.array(self.namespace))
+            os.replace(tmp_path, self.persist_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def load(self) -> None:
+        """Recharge le cache depuis le disque, s'il existe et correspond au même modèle."""
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                if str(data['namespace']) != self.namespace:  # Vecteurs d'un autre modèle : inutilisables
+                    return
+                keys, matrix = data['keys'], data['embeddings'].astype(np.float32)
+        except (OSError, KeyError, ValueError):  # Fichier absent ou corrompu : cache vide
+            return
+
+        with self._lock:
+            # Les dernières lignes sont les plus récentes : on ne garde que la fin si le cache est plus petit
+            for key, embedding in list(zip(keys, matrix))[-self.max_size:]:
+                embedding.setflags(write=False)
+                self._entries[str(key)] = embedding
@@ -0,0 +1,261 @@
+"""
+Moteurs d'embedding interchangeables pour VectorStore, tous sur CPU.
+
+- 'torch' : modèle SentenceTransformer en pleine précision (référence)
+- 'torch-int8' : même modèle, couches linéaires quantifiées en int8 (quantification dynamique PyTorch)
+- 'onnx' : modèle exporté et exécuté par ONNX Runtime
+- 'onnx-int8' : modèle ONNX quantifié en int8 (nécessite un processeur AVX512-VNNI)
+
+Les moteurs ONNX nécessitent le paquet optionnel optimum[onnxruntime].
+
+Vérification de la dérive par rapport au modèle de référence sur le corpus (depuis la racine du projet) :
+    python -m rag.indexing.embeddings --backend torch-int8 --threads 4
+"""
+from typing import TYPE_CHECKING, Dict, List, Optional, Union  # Importation des types pour la typisation statique
+import argparse  # Importation d'argparse pour la vérification en ligne de commande
+import os  # Importation de os pour le dossier des modèles ONNX quantifiés
+import sys  # Importation de sys pour le code de sortie de la vérification
+import time  # Importation de time pour comparer les temps d'encodage
+
+import numpy as np  # Importation de numpy pour les embeddings float32
+
+if TYPE_CHECKING:  # sentence-transformers (et PyTorch) ne sont importés qu'au chargement d'un moteur
+    from sentence_transformers import SentenceTransformer
+
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "rag-iut", "onnx")  # Modèles ONNX quantifiés exportés
+
+class EmbeddingBackend:
+    """
+    Interface commune des moteurs d'embedding.
+
+    Un moteur expose le tokenizer du modèle (pour mesurer les chunks en tokens) et une
+    méthode encode() compatible avec celle de SentenceTransformer. Son identifiant distingue
+    les vecteurs produits par des moteurs différents (cache de requêtes, collection ChromaDB).
+    """
+
+    name = 'base'  # Nom court du moteur (ex : 'torch-int8')
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        """
+        Initialise le moteur.
+
+        Args:
+            model_name (str): Nom du modèle Hugging Face
+            threads (Optional[int]): Nombre de threads de calcul. None : valeur par défaut de la bibliothèque
+        """
+        self.model_name = model_name
+        self.threads = threads
+        self.model: "SentenceTransformer" = None  # Modèle chargé par les sous-classes
+
+    @property
+    def id(self) -> str:
+        """Identifiant des vecteurs produits : modèle et moteur."""
+        return f"{self.model_name}:{self.name}"
+
+    @property
+    def tokenizer(self):
+        """Tokenizer Hugging Face du modèle."""
+        return self.model.tokenizer
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        """
+        Encode un texte ou une liste de textes.
+
+        Args:
+            sentences (Union[str, List[str]]): Texte(s) à encoder
+            batch_size (int): Nombre de textes encodés par lot
+            convert_to_numpy (bool): Conservé pour la compatibilité avec SentenceTransformer (toujours numpy)
+
+        Returns:
+            np.ndarray: Embeddings float32, un vecteur (texte seul) ou une matrice (liste de textes)
+        """
+        embeddings = self.model.encode(sentences, batch_size=batch_size, convert_to_numpy=True,
+                                       show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+class TorchBackend(EmbeddingBackend):
+    """Modèle PyTorch en pleine précision : la référence pour la qualité."""
+
+    name = 'torch'
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        super().__init__(model_name, threads)
+        if threads:
+            import torch
+            torch.set_num_threads(threads)  # Réglage global au processus (PyTorch n'a pas de réglage par modèle)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+class QuantizedTorchBackend(TorchBackend):
+    """
+    Modèle PyTorch dont les couches linéaires sont quantifiées en int8 au chargement.
+
+    Aucun export ni dépendance supplémentaire : les poids des couches linéaires occupent
+    environ quatre fois moins de mémoire et les produits matriciels sont faits en int8.
+    """
+
+    name = 'torch-int8'
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        super().__init__(model_name, threads)
+        import torch
+        # Quantification sur place : on ne garde pas une copie float32 du modèle en mémoire
+        torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+class OnnxBackend(EmbeddingBackend):
+    """Modèle exécuté par ONNX Runtime (exporté automatiquement au premier chargement)."""
+
+    name = 'onnx'
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        super().__init__(model_name, threads)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu', backend='onnx', model_kwargs=self._model_kwargs())
+
+    def _model_kwargs(self, file_name: Optional[str] = None) -> Dict:
+        """
+        Options de la session ONNX Runtime.
+
+        Args:
+            file_name (Optional[str]): Fichier ONNX à charger dans le dossier du modèle. None : modèle par défaut
+
+        Returns:
+            Dict: Arguments transmis au chargement du modèle ONNX
+        """
+        try:
+            import onnxruntime
+        except ImportError as error:
+            raise ImportError("Le moteur ONNX nécessite : pip install optimum[onnxruntime]") from error
+        kwargs = {'provider': 'CPUExecutionProvider'}
+        if self.threads:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads  # Threads d'un même calcul (produits matriciels)
+            options.inter_op_num_threads = 1
+            kwargs['session_options'] = options
+        if file_name:
+            kwargs['file_name'] = file_name
+        return kwargs
+
+class QuantizedOnnxBackend(OnnxBackend):
+    """
+    Modèle ONNX quantifié dynamiquement en int8.
+
+    Le modèle quantifié est exporté une seule fois dans ONNX_CACHE_DIR, puis rechargé
+    directement aux démarrages suivants.
+    """
+
+    name = 'onnx-int8'
+    QUANTIZATION = 'avx512_vnni'  # Configuration de quantification de sentence-transformers
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        EmbeddingBackend.__init__(self, model_name, threads)
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        local_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace('/', '--'))
+        file_name = f"onnx/model_qint8_{self.QUANTIZATION}.onnx"
+        if not os.path.exists(os.path.join(local_dir, file_name)):
+            # Premier chargement : export ONNX du modèle, puis quantification dans le même dossier
+            model = SentenceTransformer(model_name, device='cpu', backend='onnx', model_kwargs=self._model_kwargs())
+            model.save_pretrained(local_dir)
+            export_dynamic_quantized_onnx_model(model, self.QUANTIZATION, local_dir)
+        self.model = SentenceTransformer(local_dir, device='cpu', backend='onnx',
+                                         model_kwargs=self._model_kwargs(file_name))
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend, QuantizedTorchBackend, OnnxBackend, QuantizedOnnxBackend)}
+
+def create_backend(name: str, model_name: str, threads: Optional[int] = None) -> EmbeddingBackend:
+    """
+    Crée un moteur d'embedding à partir de son nom.
+
+    Args:
+        name (str): 'torch', 'torch-int8', 'onnx' ou 'onnx-int8'
+        model_name (str): Nom du modèle Hugging Face
+        threads (Optional[int]): Nombre de threads de calcul
+
+    Returns:
+        EmbeddingBackend: Moteur chargé
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Moteur d'embedding inconnu : {name} (disponibles : {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_name, threads)
+
+def embedding_drift(candidate: EmbeddingBackend, reference: EmbeddingBackend, texts: List[str],
+                    k: int = 3, batch_size: int = 32) -> Dict[str, float]:
+    """
+    Mesure l'écart entre les embeddings d'un moteur et ceux du modèle de référence.
+
+    Deux indicateurs : la similarité cosinus entre les deux vecteurs de chaque texte, et la part
+    des k plus proches voisins de chaque texte (dans le corpus) conservés d'un moteur à l'autre,
+    ce qui correspond directement à la stabilité des résultats de recherche.
+
+    Args:
+        candidate (EmbeddingBackend): Moteur à vérifier
+        reference (EmbeddingBackend): Moteur de référence (en général 'torch')
+        texts (List[str]): Textes du corpus (chunks)
+        k (int): Nombre de voisins comparés
+        batch_size (int): Nombre de textes encodés par lot
+
+    Returns:
+        Dict[str, float]: Cosinus moyen et minimal, accord des voisins et temps d'encodage des deux moteurs
+    """
+    def normalized(backend: EmbeddingBackend):
+        started = time.perf_counter()
+        embeddings = backend.encode(texts, batch_size=batch_size)
+        seconds = time.perf_counter() - started
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12), seconds
+
+    reference_vectors, reference_seconds = normalized(reference)
+    candidate_vectors, candidate_seconds = normalized(candidate)
+    cosines = np.sum(reference_vectors * candidate_vectors, axis=1)
+
+    def neighbours(vectors: np.ndarray) -> np.ndarray:
+        similarities = vectors @ vectors.T
+        np.fill_diagonal(similarities, -np.inf)  # Un texte n'est pas son propre voisin
+        return np.argsort(-similarities, axis=1)[:, :k]
+
+    k = min(k, len(texts) - 1)
+    agreement = 1.0
+    if k > 0:
+        expected, found = neighbours(reference_vectors), neighbours(candidate_vectors)
+        agreement = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, found)]))
+
+    return {
+        'texts': len(texts),
+        'mean_cosine': float(cosines.mean()),
+        'min_cosine': float(cosines.min()),
+        f'neighbour_agreement@{k}': agreement,
+        'reference_ms_per_text': reference_seconds * 1000 / len(texts),
+        'candidate_ms_per_text': candidate_seconds * 1000 / len(texts)
+    }
+
+def main():
+    from rag.indexing.document_loader import DocumentLoader
+    from rag.indexing.text_splitter import TextSplitter
+    from rag.indexing.vectorstore import VectorStore
+
+    parser = argparse.ArgumentParser(description="Vérifie la dérive d'un moteur d'embedding sur le corpus")
+    parser.add_argument('--backend', required=True, choices=sorted(BACKENDS), help="Moteur à vérifier")
+    parser.add_argument('--reference', default='torch', choices=sorted(BACKENDS), help="Moteur de référence")
+    parser.add_argument('--documents', default="documents", help="Dossier des documents HTML")
+    parser.add_argument('--threads', type=int, help="Nombre de threads de calcul")
+    parser.add_argument('--min-cosine', type=float, default=0.98, help="Cosinus minimal accepté pour chaque texte")
+    args = parser.parse_args()
+
+    reference = create_backend(args.reference, VectorStore.MODEL_NAME, args.threads)
+    candidate = create_backend(args.backend, VectorStore.MODEL_NAME, args.threads)
+    # Mêmes chunks que ceux indexés par le moteur de recherche
+    splitter = TextSplitter(chunk_size=256, chunk_overlap=48, tokenizer=reference.tokenizer)
+    texts = [chunk['page_content'] for chunk in
+             splitter.iter_split_documents(DocumentLoader(args.documents).iter_documents())]
+
+    report = embedding_drift(candidate, reference, texts)
+    for name, value in report.items():
+        print(f"{name:<28}{value:>10.4f}" if isinstance(value, float) else f"{name:<28}{value:>10}")
+    if report['min_cosine'] < args.min_cosine:
+        print(f"Dérive trop forte : cosinus minimal {report['min_cosine']:.4f} < {args.min_cosine}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+from typing import Dict, List, Optional  # Importation des types pour la typisation statique
+import hashlib  # Importation de hashlib pour calculer l'empreinte des fichiers
+import json  # Importation du module JSON pour lire et écrire le manifeste
+import os  # Importation de la bibliothèque os pour manipuler les fichiers et répertoires
+import tempfile  # Importation de tempfile pour un fichier temporaire propre à chaque écriture du manifeste
+
+from rag.indexing.document_loader import DocumentLoader  # Chargement des documents HTML
+from rag.indexing.text_splitter import TextSplitter  # Découpage des documents en chunks
+from rag.indexing.vectorstore import VectorStore  # Stockage vectoriel des chunks
+
+class Indexer:
+    """
+    Maintient la base vectorielle synchronisée avec le dossier de documents de manière incrémentale.
+
+    Un manifeste (date de modification, taille et empreinte SHA-256 de chaque fichier) est conservé
+    à côté de la base ChromaDB : un corpus inchangé n'est ni relu, ni parsé, ni découpé.
+    """
+
+    MANIFEST_VERSION = 1  # À incrémenter si le format du manifeste change
+
+    def __init__(self, loader: DocumentLoader, splitter: TextSplitter, vector_store: VectorStore,
+                 manifest_path: Optional[str] = None, batch_size: int = 32):
+        """
+        Initialise l'indexeur.
+
+        Args:
+            loader (DocumentLoader): Chargeur des documents HTML
+            splitter (TextSplitter): Découpeur des documents en chunks
+            vector_store (VectorStore): Base vectorielle à maintenir à jour
+            manifest_path (Optional[str]): Chemin du manifeste. Par défaut dans le dossier de la base vectorielle
+            batch_size (int): Nombre de chunks encodés et écrits par lot
+        """
+        self.loader = loader
+        self.splitter = splitter
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        # Le manifeste est stocké avec la base : s'il est supprimé avec elle, tout est réindexé
+        self.manifest_path = manifest_path or os.path.join(vector_store.persist_directory, "index_manifest.json")
+
+    def _config(self) -> Dict:
+        """
+        Empreinte de la configuration d'indexation : si elle change, tous les fichiers sont retraités.
+
+        Returns:
+            Dict: Paramètres qui influencent le contenu des chunks
+        """
+        return {
+            'collection': self.vector_store.collection_name,
+            'loader_version': self.loader.VERSION,
+            'splitter_version': self.splitter.VERSION,
+            'chunk_size': self.splitter.chunk_size,
+            'chunk_overlap': self.splitter.chunk_overlap,
+            'length_unit': self.splitter.length_unit
+        }
+
+    def _load_manifest(self) -> Dict:
+        """Charge le manifeste depuis le disque, ou retourne un manifeste vide s'il est absent ou invalide."""
+        empty = {'version': self.MANIFEST_VERSION, 'config': self._config(), 'files': {}}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):  # Fichier absent ou corrompu : on repart de zéro
+            return empty
+
+        # Un manifeste d'une autre version ou d'une autre configuration n'est pas réutilisable
+        if manifest.get('version') != self.MANIFEST_VERSION or manifest.get('config') != self._config():
+            return empty
+        return manifest
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        """Écrit le manifeste de manière atomique (fichier temporaire puis renommage)."""
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+        # Fichier temporaire unique : deux indexations simultanées n'écrivent jamais dans le même fichier
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.manifest_path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)  # Le renommage est atomique : jamais de manifeste à moitié écrit
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _file_hash(path: str) -> str:
+        """Calcule l'empreinte SHA-256 d'un fichier en le lisant par blocs."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def corpus_version(self) -> str:
+        """
+        Calcule une empreinte du corpus indexé, qui change dès qu'un fichier est ajouté, modifié ou supprimé.
+
+        Returns:
+            str: Empreinte SHA-256 des fichiers du manifeste et de la configuration
+        """
+        manifest = self._load_manifest()
+        files = {name: entry.get('sha256') for name, entry in manifest['files'].items()}
+        payload = json.dumps({'config': manifest['config'], 'files': files}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def has_changes(self) -> bool:
+        """
+        Indique, sans lire le contenu des fichiers, si update() peut avoir quelque chose à faire.
+
+        Returns:
+            bool: True si un fichier a été ajouté, supprimé, ou a changé de date ou de taille,
+                si la configuration a changé ou si la collection est vide
+        """
+        known_files = self._load_manifest()['files']  # Vide si la configuration a changé
+        if self.vector_store.count() == 0:
+            return True
+        filenames = self.loader.list_files()
+        if set(filenames) != set(known_files):
+            return True
+        for filename in filenames:
+            stat = os.stat(os.path.join(self.loader.documents_path, filename))
+            if (known_files[filename]['mtime'], known_files[filename]['size']) != (stat.st_mtime, stat.st_size):
+                return True
+        return False
+
+    def update(self) -> Dict[str, int]:
+        """
+        Synchronise la base vectorielle avec le dossier de documents.
+
+        Returns:
+            Dict[str, int]: Statistiques de la mise à jour (fichiers modifiés, supprimés, chunks ajoutés, etc.)
+        """
+        manifest = self._load_manifest()
+        known_files = manifest['files']
+        # Si la collection est vide, le manifeste ne reflète plus la base : tout est réindexé
+        force = self.vector_store.count() == 0
+
+        changed: List[str] = []  # Fichiers à reparser
+        current_files = {}  # Nouvel état des fichiers présents sur le disque
+        for filename in self.loader.list_files():
+            path = os.path.join(self.loader.documents_path, filename)
+            stat = os.stat(path)
+            entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            previous = known_files.get(filename)
+
+            # Même date et même taille : le fichier est considéré inchangé sans même le relire
+            if not force and previous and previous['mtime'] == entry['mtime'] and previous['size'] == entry['size']:
+                current_files[filename] = previous
+                continue
+
+            # Sinon on compare l'empreinte : un simple "touch" ne déclenche pas de réindexation
+            entry['sha256'] = self._file_hash(path)
+            current_files[filename] = entry
+            if force or not previous or previous.get('sha256') != entry['sha256']:
+                changed.append(filename)
+
+        # Fichiers disparus du dossier. Sans manifeste exploitable, on se fie aux sources présentes dans la base
+        previous_sources = set(known_files) if known_files else self.vector_store.indexed_sources()
+        removed = sorted(previous_sources - set(current_files))
+        stats = {'changed_files': len(changed), 'removed_files': len(removed), 'added': 0, 'unchanged': 0, 'updated': 0, 'deleted': 0}
+
+        # Parsing, découpage et encodage des seuls fichiers nouveaux ou modifiés, en flux continu
+        if changed:
+            indexed_sources = set()  # Sources ayant produit au moins un chunk
+
+            def chunk_stream():
+                # Les chunks passent directement du découpeur à l'encodage, sans liste intermédiaire
+                documents = self.loader.iter_documents(changed)  # Parsing (éventuellement parallèle) au fil de l'eau
+                for chunk in self.splitter.iter_split_documents(documents):
+                    indexed_sources.add(chunk['metadata']['source'])
+                    yield chunk
+
+            result = self.vector_store.add_documents_stream(chunk_stream(), batch_size=self.batch_size)
+            for key in ('added', 'unchanged', 'updated', 'deleted'):
+                stats[key] += result[key]
+            # Un fichier modifié qui ne produit plus aucun chunk doit aussi être vidé de l'index
+            removed += sorted(set(changed) - indexed_sources)
+
+        # Suppression des chunks dont le fichier source a disparu
+        if removed:
+            self.vector_store.delete_sources(removed)
+
+        # Le manifeste n'est réécrit que si quelque chose a changé
+        if changed or removed or current_files != known_files:
+            manifest['files'] = current_files
+            self._save_manifest(manifest)
+
+        return stats
+
+    def ingest_chunk_file(self, path: str) -> Dict[str, float]:
+        """
+        Indexe des chunks déjà découpés depuis un fichier JSON Lines, sans reparser le HTML.
+
+        Les identifiants étant dérivés du contenu, les chunks déjà présents sont ignorés :
+        relancer l'ingestion après une interruption reprend là où elle s'était arrêtée.
+
+        Args:
+            path (str): Fichier écrit par TextSplitter (option dump_path)
+
+        Returns:
+            Dict[str, float]: Statistiques d'ingestion de VectorStore.add_documents_stream
+        """
+        return self.vector_store.add_documents_stream(TextSplitter.read_chunks(path), batch_size=self.batch_size)
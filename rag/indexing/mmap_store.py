@@ -0,0 +1,481 @@
+"""
+Stockage alternatif à ChromaDB : recherche exacte sur des embeddings dans un fichier projeté en mémoire.
+
+Pour quelques milliers à quelques centaines de milliers de chunks, un produit matrice-vecteur
+NumPy sur tous les embeddings est à la fois exact et plus rapide qu'un index HNSW interrogé à
+travers SQLite. Les embeddings normalisés sont stockés dans un fichier brut (float32, float16 ou
+int8 avec un facteur d'échelle par ligne) ouvert avec np.memmap : plusieurs processus qui servent
+la même version de l'index partagent les mêmes pages du cache du système d'exploitation. Les
+identifiants, textes et métadonnées sont dans une petite base SQLite à côté.
+
+MmapClient et MmapCollection reprennent la partie de l'API de ChromaDB utilisée par VectorStore
+(get_collection, create_collection, delete_collection ; add, get, update, delete, query, count)
+avec les mêmes formats de résultats. Les distances sont des distances L2 au carré entre vecteurs
+normalisés (2 - 2 x cosinus), du plus proche au plus lointain.
+
+Les écritures (indexation) se font dans un seul processus ; les autres processus ouvrent une
+version publiée de l'index, qui ne change plus (voir SnapshotStore).
+"""
+from typing import Any, Dict, List, Optional, Sequence  # Importation des types pour la typisation statique
+import json  # Importation de json pour les métadonnées et les informations de la collection
+import os  # Importation de os pour les chemins et la taille des fichiers
+import shutil  # Importation de shutil pour supprimer une collection
+import sqlite3  # Importation de sqlite3 pour la table des identifiants, textes et métadonnées
+
+import numpy as np  # Importation de numpy pour le calcul des scores
+
+DTYPES = ('float32', 'float16', 'int8')  # Précisions de stockage disponibles
+
+def matches(metadata: Optional[Dict], where: Optional[Dict]) -> bool:
+    """
+    Indique si des métadonnées respectent un filtre au format ChromaDB.
+
+    Opérateurs pris en charge : égalité simple, $eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $and, $or.
+
+    Args:
+        metadata (Optional[Dict]): Métadonnées d'un chunk
+        where (Optional[Dict]): Filtre, ex : {'product': {'$in': ['vol', 'incendie']}}. None : tout passe
+
+    Returns:
+        bool: True si le chunk respecte le filtre
+    """
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == '$eq' and value != operand:
+                    return False
+                if operator == '$ne' and value == operand:
+                    return False
+                if operator == '$in' and value not in operand:
+                    return False
+                if operator == '$nin' and value in operand:
+                    return False
+                if operator in ('$gt', '$gte', '$lt', '$lte'):
+                    if value is None:
+                        return False
+                    if ((operator == '$gt' and not value > operand) or (operator == '$gte' and not value >= operand)
+                            or (operator == '$lt' and not value < operand) or (operator == '$lte' and not value <= operand)):
+                        return False
+                if operator not in ('$eq', '$ne', '$in', '$nin', '$gt', '$gte', '$lt', '$lte'):
+                    raise ValueError(f"Opérateur de filtre non pris en charge : {operator}")
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class MmapCollection:
+    """
+    Collection d'embeddings normalisés dans un fichier projeté en mémoire, avec recherche exacte.
+
+    Les lignes supprimées laissent un trou (masqué à la recherche) jusqu'au compactage, déclenché
+    quand plus de la moitié des lignes sont vides.
+    """
+
+    BLOCK_ROWS = 32768  # Lignes converties en float32 à la fois (float16 / int8) : mémoire temporaire bornée
+    INITIAL_CAPACITY = 1024  # Lignes réservées à la création du fichier (doublées à chaque agrandissement)
+
+    def __init__(self, path: str, name: str):
+        """
+        Ouvre une collection existante.
+
+        Args:
+            path (str): Dossier de la collection
+            name (str): Nom de la collection
+        """
+        self.path = path
+        self.name = name
+        self._conn = sqlite3.connect(os.path.join(path, "rows.sqlite3"), check_same_thread=False)
+        info = dict(self._conn.execute('SELECT key, value FROM info'))
+        self.dtype: str = info['dtype']
+        self.metadata: Dict = json.loads(info['metadata'])  # Métadonnées de la collection (moteur d'embedding...)
+        self.dim: int = int(info['dim'])  # 0 tant qu'aucun vecteur n'a été ajouté
+        self._size = int(info['size'])  # Nombre de lignes utilisées dans le fichier (trous compris)
+        self._capacity = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None  # Facteur d'échelle de chaque ligne (int8 uniquement)
+
+        # Identifiants et métadonnées en mémoire (filtres) ; les textes restent dans SQLite
+        self._ids: List[Optional[str]] = [None] * self._size
+        self._metadatas: List[Optional[Dict]] = [None] * self._size
+        self._positions: Dict[str, int] = {}
+        for position, chunk_id, metadata in self._conn.execute('SELECT position, id, metadata FROM rows'):
+            self._ids[position] = chunk_id
+            self._metadatas[position] = json.loads(metadata)
+            self._positions[chunk_id] = position
+        self._alive = np.zeros(self._size, dtype=bool)
+        self._alive[list(self._positions.values())] = True
+        self._masks: Dict[str, np.ndarray] = {}  # Filtre -> lignes autorisées (vidé à chaque écriture)
+        if self.dim:
+            self._map(self._file_capacity())
+
+    @classmethod
+    def create(cls, path: str, name: str, metadata: Optional[Dict] = None, dtype: str = 'float32') -> "MmapCollection":
+        """
+        Crée une collection vide.
+
+        Args:
+            path (str): Dossier de la collection (créé)
+            name (str): Nom de la collection
+            metadata (Optional[Dict]): Métadonnées de la collection
+            dtype (str): 'float32', 'float16' ou 'int8'
+
+        Returns:
+            MmapCollection: Collection ouverte
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Précision inconnue : {dtype} (disponibles : {', '.join(DTYPES)})")
+        os.makedirs(path)
+        with sqlite3.connect(os.path.join(path, "rows.sqlite3")) as conn:
+            conn.execute('''
+                CREATE TABLE rows (
+                    position INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    document TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.executemany('INSERT INTO info VALUES (?, ?)', [
+                ('dtype', dtype), ('metadata', json.dumps(metadata or {})), ('dim', '0'), ('size', '0')
+            ])
+        conn.close()
+        return cls(path, name)
+
+    # --- Fichiers projetés en mémoire ---
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.bin")
+
+    def _scales_path(self) -> str:
+        return os.path.join(self.path, "scales.bin")
+
+    def _file_capacity(self) -> int:
+        """Nombre de lignes que peut contenir le fichier des vecteurs."""
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize
+        return os.path.getsize(self._vectors_path()) // row_bytes
+
+    def _map(self, capacity: int) -> None:
+        """
+        Projette (ou agrandit puis reprojette) les fichiers des vecteurs en mémoire.
+
+        Args:
+            capacity (int): Nombre de lignes à réserver
+        """
+        self._vectors = self._scales = None  # Libère les projections précédentes avant d'agrandir les fichiers
+        files = [(self._vectors_path(), self.dtype, (capacity, self.dim))]
+        if self.dtype == 'int8':
+            files.append((self._scales_path(), 'float32', (capacity,)))
+        arrays = []
+        for path, dtype, shape in files:
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, 'ab') as f:  # Crée le fichier au besoin ; l'agrandissement ne copie pas les données
+                if f.tell() < size:
+                    f.truncate(size)
+            arrays.append(np.memmap(path, dtype=dtype, mode='r+', shape=shape))
+        self._vectors = arrays[0]
+        self._scales = arrays[1] if self.dtype == 'int8' else None
+        self._capacity = capacity
+
+    def _set_info(self, **values) -> None:
+        """Met à jour la table d'informations (dans la transaction en cours)."""
+        self._conn.executemany('INSERT OR REPLACE INTO info VALUES (?, ?)',
+                               [(key, str(value)) for key, value in values.items()])
+
+    def _encode(self, embeddings: np.ndarray):
+        """
+        Convertit des embeddings normalisés vers la précision de stockage.
+
+        Returns:
+            Tuple[np.ndarray, Optional[np.ndarray]]: Lignes stockées et facteurs d'échelle (int8 uniquement)
+        """
+        if self.dtype == 'int8':
+            # Quantification symétrique par ligne : la plus grande composante vaut ±127
+            scales = np.maximum(np.abs(embeddings).max(axis=1), 1e-12) / 127.0
+            return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return embeddings.astype(self.dtype), None
+
+    def _rows(self, start: int, end: int) -> np.ndarray:
+        """Lignes [start, end) du fichier, en float32 (normalisées)."""
+        block = np.asarray(self._vectors[start:end], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[start:end, None]
+        return block
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        """Matrice float32 de vecteurs unitaires (une ligne par vecteur)."""
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    # --- API compatible ChromaDB ---
+
+    def count(self) -> int:
+        """Nombre de chunks de la collection."""
+        return len(self._positions)
+
+    def add(self, embeddings, documents: List[str], metadatas: List[Dict], ids: List[str]) -> None:
+        """
+        Ajoute des chunks (les identifiants déjà présents sont ignorés, comme dans ChromaDB).
+
+        Args:
+            embeddings: Matrice des embeddings (une ligne par chunk)
+            documents (List[str]): Textes des chunks
+            metadatas (List[Dict]): Métadonnées des chunks
+            ids (List[str]): Identifiants des chunks
+        """
+        embeddings = self._normalize(embeddings)
+        seen = set()
+        keep = []
+        for i, chunk_id in enumerate(ids):
+            if chunk_id not in self._positions and chunk_id not in seen:
+                seen.add(chunk_id)
+                keep.append(i)
+        if not keep:
+            return
+        embeddings = embeddings[keep]
+        if not self.dim:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Dimension {embeddings.shape[1]} incompatible avec la collection ({self.dim})")
+
+        start, end = self._size, self._size + len(keep)
+        if end > self._capacity:
+            capacity = max(self._capacity, self.INITIAL_CAPACITY)
+            while capacity < end:
+                capacity *= 2
+            self._map(capacity)
+        rows, scales = self._encode(embeddings)
+        self._vectors[start:end] = rows
+        if scales is not None:
+            self._scales[start:end] = scales
+        self._vectors.flush()  # Vecteurs sur le disque avant que les lignes ne les référencent
+        if self._scales is not None:
+            self._scales.flush()
+
+        entries = [(start + j, ids[i], documents[i], json.dumps(metadatas[i] or {}, ensure_ascii=False))
+                   for j, i in enumerate(keep)]
+        with self._conn:
+            self._conn.executemany('INSERT INTO rows VALUES (?, ?, ?, ?)', entries)
+            self._set_info(dim=self.dim, size=end)
+
+        self._size = end
+        self._ids.extend(ids[i] for i in keep)
+        self._metadatas.extend(dict(metadatas[i] or {}) for i in keep)
+        self._positions.update((ids[i], start + j) for j, i in enumerate(keep))
+        self._alive = np.concatenate([self._alive, np.ones(len(keep), dtype=bool)])
+        self._masks.clear()
+
+    def _select(self, ids: Optional[Sequence[str]], where: Optional[Dict]) -> List[int]:
+        """Positions des chunks désignés par leurs identifiants et/ou un filtre, dans l'ordre de la collection."""
+        if ids is not None:
+            positions = sorted(self._positions[chunk_id] for chunk_id in set(ids) if chunk_id in self._positions)
+        else:
+            positions = np.flatnonzero(self._alive).tolist()
+        if where:
+            mask = self._mask(where)
+            positions = [position for position in positions if mask[position]]
+        return positions
+
+    def _documents(self, positions: List[int]) -> List[str]:
+        """Textes des chunks, lus dans SQLite par groupes."""
+        texts: Dict[int, str] = {}
+        for i in range(0, len(positions), 500):  # Limite du nombre de paramètres d'une requête SQLite
+            group = positions[i:i + 500]
+            query = f"SELECT position, document FROM rows WHERE position IN ({','.join('?' * len(group))})"
+            texts.update(self._conn.execute(query, group))
+        return [texts[position] for position in positions]
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None,
+            include: Sequence[str] = ('metadatas', 'documents'), limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Lit des chunks par identifiants et/ou filtre de métadonnées.
+
+        Returns:
+            Dict[str, Any]: 'ids' et les champs demandés ('documents', 'metadatas', 'embeddings')
+        """
+        positions = self._select(ids, where)
+        start = offset or 0
+        positions = positions[start:start + limit if limit is not None else None]
+        result: Dict[str, Any] = {'ids': [self._ids[position] for position in positions]}
+        if 'metadatas' in include:
+            result['metadatas'] = [dict(self._metadatas[position]) for position in positions]
+        if 'documents' in include:
+            result['documents'] = self._documents(positions)
+        if 'embeddings' in include:
+            result['embeddings'] = [self._rows(position, position + 1)[0] for position in positions]
+        return result
+
+    def update(self, ids: List[str], metadatas: List[Dict]) -> None:
+        """Remplace les métadonnées de chunks existants (les embeddings ne changent pas)."""
+        changes = [(json.dumps(metadata or {}, ensure_ascii=False), self._positions[chunk_id], dict(metadata or {}))
+                   for chunk_id, metadata in zip(ids, metadatas) if chunk_id in self._positions]
+        with self._conn:
+            self._conn.executemany('UPDATE rows SET metadata = ? WHERE position = ?',
+                                   [(text, position) for text, position, _ in changes])
+        for _, position, metadata in changes:
+            self._metadatas[position] = metadata
+        self._masks.clear()
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> None:
+        """Supprime des chunks par identifiants et/ou filtre de métadonnées."""
+        if ids is None and not where:
+            raise ValueError("delete() attend des identifiants ou un filtre")
+        positions = self._select(ids, where)
+        if not positions:
+            return
+        with self._conn:
+            self._conn.executemany('DELETE FROM rows WHERE position = ?', [(position,) for position in positions])
+        for position in positions:
+            del self._positions[self._ids[position]]
+            self._ids[position] = self._metadatas[position] = None
+        self._alive[positions] = False
+        self._masks.clear()
+        if self._size > self.INITIAL_CAPACITY and self.count() < self._size // 2:
+            self.compact()
+
+    def compact(self) -> None:
+        """Réécrit les fichiers sans les lignes supprimées (les positions sont renumérotées)."""
+        positions = np.flatnonzero(self._alive)
+        if len(positions) == self._size:
+            return
+        # Lignes vivantes regroupées au début du fichier (l'indexation par tableau copie avant d'écrire)
+        self._vectors[:len(positions)] = self._vectors[positions]
+        if self._scales is not None:
+            self._scales[:len(positions)] = self._scales[positions]
+        self._vectors.flush()
+        if self._scales is not None:
+            self._scales.flush()
+        with self._conn:
+            # Renumérotation en deux temps : les nouvelles positions ne heurtent jamais les anciennes
+            self._conn.executemany('UPDATE rows SET position = ? WHERE position = ?',
+                                   [(-1 - new, old) for new, old in enumerate(positions.tolist())])
+            self._conn.execute('UPDATE rows SET position = -1 - position')
+            self._set_info(size=len(positions))
+        self._ids = [self._ids[position] for position in positions]
+        self._metadatas = [self._metadatas[position] for position in positions]
+        self._positions = {chunk_id: position for position, chunk_id in enumerate(self._ids)}
+        self._size = len(positions)
+        self._alive = np.ones(self._size, dtype=bool)
+        self._masks.clear()
+
+    def _mask(self, where: Optional[Dict]) -> np.ndarray:
+        """Lignes vivantes qui respectent le filtre (gardé en cache jusqu'à la prochaine écriture)."""
+        if not where:
+            return self._alive
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._alive.copy()
+            for position in np.flatnonzero(mask):
+                mask[position] = matches(self._metadatas[position], where)
+            if len(self._masks) >= 256:  # Filtres très variés : on repart d'un cache vide
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def scores(self, query_embeddings) -> np.ndarray:
+        """
+        Similarité cosinus de chaque requête avec chaque ligne du fichier.
+
+        Args:
+            query_embeddings: Embeddings des requêtes (une ligne par requête)
+
+        Returns:
+            np.ndarray: Matrice (requêtes x lignes) des cosinus, float32
+        """
+        queries = self._normalize(query_embeddings)
+        scores = np.empty((len(queries), self._size), dtype=np.float32)
+        if self.dtype == 'float32':
+            # Un seul produit matriciel directement sur les pages projetées (aucune copie du fichier)
+            np.matmul(queries, self._vectors[:self._size].T, out=scores)
+            return scores
+        for start in range(0, self._size, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, self._size)
+            scores[:, start:end] = queries @ self._rows(start, end).T
+        return scores
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Sequence[str] = ('metadatas', 'documents', 'distances')) -> Dict[str, List[List[Any]]]:
+        """
+        Recherche exacte des plus proches voisins, pour une ou plusieurs requêtes en un seul calcul.
+
+        Args:
+            query_embeddings: Embeddings des requêtes (une ligne par requête)
+            n_results (int): Nombre de résultats par requête
+            where (Optional[Dict]): Filtre de métadonnées au format ChromaDB
+            include (Sequence[str]): Champs retournés en plus des identifiants
+
+        Returns:
+            Dict[str, List[List[Any]]]: 'ids', 'documents', 'metadatas', 'distances' : une liste par requête,
+                du plus proche au plus lointain
+        """
+        n_queries = len(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        mask = self._mask(where)
+        n = min(n_results, int(mask.sum()))
+        result: Dict[str, List[List[Any]]] = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        if n == 0 or not self._size:
+            for key in result:
+                result[key] = [[] for _ in range(n_queries)]
+            return result
+
+        scores = self.scores(query_embeddings)
+        scores[:, ~mask] = -np.inf  # Lignes supprimées ou hors filtre
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]  # k meilleurs de chaque requête, non triés
+        for row, candidates in zip(scores, top):
+            order = candidates[np.argsort(-row[candidates], kind='stable')]
+            positions = order.tolist()
+            result['ids'].append([self._ids[position] for position in positions])
+            # Distance L2 au carré entre vecteurs unitaires, comme l'espace par défaut de ChromaDB
+            result['distances'].append(np.maximum(2.0 - 2.0 * row[order], 0.0).astype(float).tolist())
+            result['metadatas'].append([dict(self._metadatas[position]) for position in positions]
+                                       if 'metadatas' in include else None)
+            result['documents'].append(self._documents(positions) if 'documents' in include else None)
+        return result
+
+class MmapClient:
+    """
+    Équivalent de chromadb.PersistentClient pour les collections MmapCollection.
+    """
+
+    def __init__(self, path: str, dtype: str = 'float32'):
+        """
+        Initialise le client.
+
+        Args:
+            path (str): Dossier contenant les collections
+            dtype (str): Précision des collections créées ('float32', 'float16' ou 'int8')
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Précision inconnue : {dtype} (disponibles : {', '.join(DTYPES)})")
+        self.path = path
+        self.dtype = dtype
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def get_collection(self, name: str) -> MmapCollection:
+        """Ouvre une collection existante (ValueError si elle n'existe pas)."""
+        if not os.path.isfile(os.path.join(self._path(name), "rows.sqlite3")):
+            raise ValueError(f"Collection {name} does not exist.")
+        return MmapCollection(self._path(name), name)
+
+    def create_collection(self, name: str, metadata: Optional[Dict] = None) -> MmapCollection:
+        """Crée une collection vide (ValueError si elle existe déjà)."""
+        if os.path.exists(self._path(name)):
+            raise ValueError(f"Collection {name} already exists.")
+        return MmapCollection.create(self._path(name), name, metadata, self.dtype)
+
+    def delete_collection(self, name: str) -> None:
+        """Supprime une collection et ses fichiers."""
+        shutil.rmtree(self._path(name), ignore_errors=True)
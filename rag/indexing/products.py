@@ -0,0 +1,51 @@
+from typing import Dict, List, Tuple  # Importation des types pour la typisation statique
+import re  # Importation du module regex pour découper le texte en mots
+import unicodedata  # Importation d'unicodedata pour ignorer les accents
+
+# Mots-clés (sans accents, en minuscules) qui désignent chaque gamme de produits.
+# Utilisés à la fois pour classer les fichiers du corpus et pour router les questions.
+PRODUCT_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    'auto': ('auto', 'automobile', 'voiture', 'vehicule', 'vehicules', 'conducteur', 'collision',
+             'accident', 'accidents', 'constat', 'permis', 'pare', 'brise', 'carrosserie'),
+    'degat_des_eaux': ('eau', 'eaux', 'fuite', 'fuites', 'inondation', 'infiltration', 'infiltrations',
+                       'canalisation', 'canalisations', 'humidite', 'plombier', 'debordement'),
+    'incendie': ('incendie', 'incendies', 'feu', 'feux', 'fumee', 'flammes', 'brule', 'brulure',
+                 'explosion', 'pompiers'),
+    'vol': ('vol', 'vols', 'vole', 'volee', 'voles', 'volees', 'voleur', 'voleurs', 'cambriolage',
+            'cambrioleur', 'effraction', 'cambriole'),
+}
+
+WORD_PATTERN = re.compile(r'\w+')  # Mots du texte (après suppression des accents)
+
+def _words(text: str) -> List[str]:
+    """Découpe un texte en mots sans accents ni majuscules."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return WORD_PATTERN.findall(text)
+
+def detect_products(text: str) -> List[str]:
+    """
+    Détecte les gammes de produits évoquées dans un texte (nom de fichier ou question).
+
+    Args:
+        text (str): Texte à analyser
+
+    Returns:
+        List[str]: Produits détectés, du plus au moins cité (liste vide si aucun)
+    """
+    words = _words(text)
+    counts = {product: sum(word in keywords for word in words) for product, keywords in PRODUCT_KEYWORDS.items()}
+    return sorted((product for product, count in counts.items() if count), key=lambda product: -counts[product])
+
+def product_of(filename: str) -> str:
+    """
+    Gamme de produits d'un document à partir de son nom de fichier.
+
+    Args:
+        filename (str): Nom du fichier (ex : "OptiSecure Assurances - Vol.html")
+
+    Returns:
+        str: Produit le plus cité dans le nom, ou "autre" si aucun n'est reconnu
+    """
+    products = detect_products(filename)
+    return products[0] if products else 'autre'
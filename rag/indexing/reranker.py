@@ -0,0 +1,154 @@
+from collections import OrderedDict  # Importation d'OrderedDict pour l'éviction LRU des scores
+from typing import Dict, List, Optional, Tuple  # Importation des types pour la typisation statique
+import logging  # Importation de logging pour signaler les dépassements du budget de latence
+import threading  # Importation des verrous : le modèle et le cache sont partagés entre les sessions
+import time  # Importation de time pour mesurer le budget de latence
+
+from rag.indexing.embedding_cache import QueryEmbeddingCache  # Normalisation des requêtes (clés du cache)
+from rag.monitoring.tracing import span  # Durée du re-classement (sans effet hors d'une trace)
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """
+    Second étage de la recherche : réordonne un ensemble de candidats avec un cross-encoder sur CPU.
+
+    Le cross-encoder lit la question et le chunk ensemble, ce qui classe mieux les premiers
+    résultats que la seule distance entre embeddings. Les candidats sont scorés par lots, les
+    scores sont gardés en cache par couple (question, chunk), et si le budget de latence est
+    dépassé, l'ordre de la première recherche est conservé.
+    """
+
+    MODEL_NAME = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'  # Cross-encoder multilingue (entraîné sur mMARCO, dont le français)
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_size: int = 16, latency_budget: float = 0.5,
+                 cache_size: int = 4096, max_length: int = 512):
+        """
+        Initialise le re-classeur.
+
+        Args:
+            model_name (str): Nom du cross-encoder Hugging Face
+            batch_size (int): Nombre de couples (question, chunk) scorés par appel au modèle
+            latency_budget (float): Durée maximale (en secondes) consacrée au re-classement d'une question
+            cache_size (int): Nombre maximal de scores conservés
+            max_length (int): Longueur maximale (en tokens) d'un couple question + chunk
+        """
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.cache_size = cache_size
+        from sentence_transformers import CrossEncoder  # Import différé : chargé avec le modèle, pas avec le module
+        self.model = CrossEncoder(model_name, max_length=max_length, device='cpu')
+        self.hits = 0  # Scores trouvés dans le cache
+        self.misses = 0  # Scores calculés par le modèle
+        self.fallbacks = 0  # Questions pour lesquelles le budget a été dépassé
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()  # (question normalisée, chunk) -> score
+        self._seconds_per_pair: Optional[float] = None  # Coût moyen d'un couple, pour anticiper le budget
+        self._model_lock = threading.Lock()  # Le modèle n'est pas conçu pour des appels concurrents
+        self._cache_lock = threading.Lock()
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[float]:
+        """Cherche un score dans le cache (et le marque comme récemment utilisé)."""
+        with self._cache_lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _store(self, keys: List[Tuple[str, str]], scores: List[float]) -> None:
+        """Ajoute des scores au cache en évinçant les moins récemment utilisés."""
+        with self._cache_lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def score(self, query: str, chunk_ids: List[str], documents: List[str]) -> Optional[List[float]]:
+        """
+        Score la pertinence de chaque chunk pour la question, dans la limite du budget de latence.
+
+        Args:
+            query (str): Question de l'utilisateur
+            chunk_ids (List[str]): Identifiants des chunks (clés du cache)
+            documents (List[str]): Textes des chunks
+
+        Returns:
+            Optional[List[float]]: Un score par chunk, ou None si le budget a été dépassé
+        """
+        started = time.perf_counter()
+        normalized = QueryEmbeddingCache.normalize(query)
+        keys = [(normalized, chunk_id) for chunk_id in chunk_ids]
+        scores: List[Optional[float]] = [self._cached(key) for key in keys]
+        missing = [i for i, value in enumerate(scores) if value is None]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            elapsed = time.perf_counter() - started
+            # Abandon avant le lot qui ferait dépasser le budget (estimation d'après les lots précédents)
+            expected = (self._seconds_per_pair or 0.0) * len(batch)
+            if elapsed + expected > self.latency_budget:
+                return None
+
+            batch_started = time.perf_counter()
+            with self._model_lock:
+                batch_scores = self.model.predict([(query, documents[i]) for i in batch],
+                                                  batch_size=self.batch_size, show_progress_bar=False)
+            per_pair = (time.perf_counter() - batch_started) / len(batch)
+            # Moyenne glissante : s'adapte à la charge de la machine sans réagir à un seul lot lent
+            self._seconds_per_pair = per_pair if self._seconds_per_pair is None else 0.8 * self._seconds_per_pair + 0.2 * per_pair
+
+            batch_scores = [float(value) for value in batch_scores]
+            self._store([keys[i] for i in batch], batch_scores)  # Gardés même si le budget saute ensuite
+            for i, value in zip(batch, batch_scores):
+                scores[i] = value
+
+        if time.perf_counter() - started > self.latency_budget:
+            return None
+        return scores
+
+    def rerank(self, query: str, results: Dict, k: int) -> Dict:
+        """
+        Réordonne les candidats d'une recherche et garde les k meilleurs.
+
+        Args:
+            query (str): Question de l'utilisateur
+            results (Dict): Candidats au format de VectorStore.search (une seule requête)
+            k (int): Nombre de chunks à garder
+
+        Returns:
+            Dict: Résultat au même format, limité aux k meilleurs. En cas de dépassement du budget,
+                les k premiers candidats dans l'ordre de la première recherche
+        """
+        ids = results['ids'][0]
+        order = list(range(len(ids)))
+        with span('rerank', candidates=len(ids)) as current:
+            hits = self.hits
+            scores = self.score(query, ids, results['documents'][0]) if len(ids) > 1 else None
+            current.set(cached=self.hits - hits, fallback=scores is None and len(ids) > 1)
+        if scores is not None:
+            order.sort(key=lambda i: scores[i], reverse=True)
+        elif len(ids) > 1:
+            self.fallbacks += 1
+            logger.warning("Re-classement abandonné (budget de %.2f s dépassé) : ordre de la recherche conservé",
+                           self.latency_budget)
+
+        order = order[:k]
+        reranked = {key: [[values[0][i] for i in order]] for key, values in results.items()
+                    if isinstance(values, list) and values and isinstance(values[0], list)}
+        if scores is not None:
+            reranked['rerank_scores'] = [[scores[i] for i in order]]
+        return reranked
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Statistiques du re-classeur.
+
+        Returns:
+            Dict[str, float]: Scores en cache, taux de succès du cache et nombre de replis sur l'ordre initial
+        """
+        with self._cache_lock:
+            size = len(self._scores)
+        total = self.hits + self.misses
+        return {'size': size, 'hit_rate': self.hits / total if total else 0.0, 'fallbacks': self.fallbacks}
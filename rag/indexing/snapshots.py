@@ -0,0 +1,231 @@
+"""
+Versions successives de l'index (base ChromaDB, index BM25, manifeste), publiées par un pointeur atomique.
+
+Organisation du dossier racine (par défaut ./chroma_db) :
+    versions/<version>/      une base complète par version, construite puis validée
+    versions/<version>/snapshot.json   présent seulement une fois la version validée
+    CURRENT                  nom de la version servie, remplacé par un renommage atomique
+
+Une reconstruction écrit dans une nouvelle version (copie de la version servie, mise à jour de
+manière incrémentale) pendant que l'ancienne continue de répondre ; les processus en cours
+passent à la nouvelle version dès que le pointeur change. Les keep dernières versions sont
+conservées pour revenir en arrière.
+
+Administration (depuis la racine du projet) :
+    python -m rag.indexing.snapshots list
+    python -m rag.indexing.snapshots build
+    python -m rag.indexing.snapshots rollback [--to VERSION]
+"""
+from datetime import datetime, timezone  # Importation de datetime pour nommer les versions
+from typing import Dict, Iterable, List, Optional  # Importation des types pour la typisation statique
+import argparse  # Importation d'argparse pour l'administration en ligne de commande
+import json  # Importation du module JSON pour les informations de chaque version
+import logging  # Importation de logging pour tracer les publications et retours en arrière
+import os  # Importation de os pour manipuler les fichiers et répertoires
+import shutil  # Importation de shutil pour copier et supprimer les versions
+import tempfile  # Importation de tempfile pour des fichiers temporaires propres à chaque écriture
+
+logger = logging.getLogger(__name__)
+
+class SnapshotStore:
+    """
+    Gère les versions de l'index et le pointeur vers la version servie.
+    """
+
+    POINTER = "CURRENT"  # Fichier contenant le nom de la version servie
+    INFO = "snapshot.json"  # Informations d'une version validée (sa présence marque la version comme publiable)
+
+    def __init__(self, root: str = "./chroma_db", keep: int = 3):
+        """
+        Initialise le gestionnaire de versions.
+
+        Args:
+            root (str): Dossier racine des versions et du pointeur
+            keep (int): Nombre de versions validées conservées (la version servie l'est toujours)
+        """
+        self.root = root
+        self.keep = max(keep, 1)
+        self.versions_dir = os.path.join(root, "versions")
+
+    def path(self, version: str) -> str:
+        """Dossier de la base d'une version."""
+        return os.path.join(self.versions_dir, version)
+
+    def versions(self) -> List[str]:
+        """
+        Versions validées, de la plus ancienne à la plus récente.
+
+        Returns:
+            List[str]: Noms des versions (triables par date de création)
+        """
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir)
+                      if os.path.isfile(os.path.join(self.versions_dir, name, self.INFO)))
+
+    def current(self) -> Optional[str]:
+        """
+        Version servie, d'après le pointeur.
+
+        Returns:
+            Optional[str]: Nom de la version, ou None si aucune version n'a encore été publiée
+        """
+        try:
+            with open(os.path.join(self.root, self.POINTER), 'r', encoding='utf-8') as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+        return version if version and os.path.isfile(os.path.join(self.path(version), self.INFO)) else None
+
+    def info(self, version: str) -> Dict:
+        """
+        Informations enregistrées à la validation d'une version.
+
+        Args:
+            version (str): Nom de la version
+
+        Returns:
+            Dict: Nombre de chunks, date de création, empreinte du corpus, etc.
+        """
+        with open(os.path.join(self.path(version), self.INFO), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def create(self, base: Optional[str] = None) -> str:
+        """
+        Crée le dossier d'une nouvelle version, copie d'une version existante ou vide.
+
+        Args:
+            base (Optional[str]): Version à copier (mise à jour incrémentale). None : nouvelle base vide
+
+        Returns:
+            str: Nom de la nouvelle version (pas encore validée)
+        """
+        os.makedirs(self.versions_dir, exist_ok=True)
+        version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')  # Triable, unique à la microseconde
+        if base is not None:
+            # La version servie n'est que lue pendant la copie : les écritures se font dans la copie
+            shutil.copytree(self.path(base), self.path(version), ignore=shutil.ignore_patterns(self.INFO))
+        else:
+            os.makedirs(self.path(version))
+        return version
+
+    def mark_ready(self, version: str, info: Dict) -> None:
+        """
+        Enregistre les informations d'une version validée, qui devient publiable.
+
+        Args:
+            version (str): Nom de la version
+            info (Dict): Informations à conserver (nombre de chunks, empreinte du corpus...)
+        """
+        info = dict(info, version=version, created_at=datetime.now(timezone.utc).isoformat(timespec='seconds'))
+        self._write_atomic(os.path.join(self.path(version), self.INFO), json.dumps(info, indent=2, ensure_ascii=False))
+
+    def publish(self, version: str, in_use: Iterable[str] = ()) -> None:
+        """
+        Fait de version la version servie, puis supprime les versions qui ne sont plus conservées.
+
+        Args:
+            version (str): Version validée à publier
+            in_use (Iterable[str]): Versions encore ouvertes par l'appelant, à ne pas supprimer (voir prune)
+        """
+        if version not in self.versions():
+            raise ValueError(f"Version non validée : {version}")
+        self._write_atomic(os.path.join(self.root, self.POINTER), version)
+        logger.info("Version de l'index publiée : %s", version)
+        self.prune(in_use)
+
+    def rollback(self, version: Optional[str] = None) -> str:
+        """
+        Revient à une version précédente.
+
+        Args:
+            version (Optional[str]): Version à servir. None : la version validée qui précède la version servie
+
+        Returns:
+            str: Version désormais servie
+        """
+        versions = self.versions()
+        current = self.current()
+        if version is None:
+            older = [name for name in versions if current is None or name < current]
+            if not older:
+                raise ValueError("Aucune version antérieure à la version servie")
+            version = older[-1]
+        elif version not in versions:
+            raise ValueError(f"Version inconnue ou non validée : {version}")
+        self._write_atomic(os.path.join(self.root, self.POINTER), version)
+        logger.warning("Retour à la version de l'index %s (précédemment %s)", version, current)
+        return version
+
+    def discard(self, version: str) -> None:
+        """Supprime une version (construction échouée ou sans changement)."""
+        shutil.rmtree(self.path(version), ignore_errors=True)
+
+    def prune(self, in_use: Iterable[str] = ()) -> List[str]:
+        """
+        Supprime les versions validées au-delà des keep plus récentes (jamais la version servie).
+
+        Les dossiers sans snapshot.json plus anciens que la dernière version validée (constructions
+        interrompues) sont aussi supprimés.
+
+        Args:
+            in_use (Iterable[str]): Versions dont la base est encore ouverte (supprimées plus tard, une fois fermées)
+
+        Returns:
+            List[str]: Versions supprimées
+        """
+        versions = self.versions()
+        current = self.current()
+        kept = set(versions[-self.keep:]) | {current} | set(in_use)
+        newest = versions[-1] if versions else ''
+        removed = []
+        for name in sorted(os.listdir(self.versions_dir)) if os.path.isdir(self.versions_dir) else []:
+            unfinished = name not in versions and name < newest  # Une construction en cours est plus récente
+            if (name in versions and name not in kept) or unfinished:
+                self.discard(name)
+                removed.append(name)
+        return removed
+
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        """Écrit un fichier de manière atomique (fichier temporaire puis renommage)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Fichier temporaire unique : une publication et un retour en arrière simultanés (application et
+        # ligne de commande) n'écrivent jamais dans le même fichier
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())  # Le contenu est sur le disque avant que le renommage ne le rende visible
+            os.replace(tmp_path, path)  # Les lecteurs voient l'ancien ou le nouveau fichier, jamais un fichier partiel
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+def main():
+    parser = argparse.ArgumentParser(description="Versions de l'index de recherche")
+    parser.add_argument('command', choices=['list', 'build', 'rollback'], help="Action à effectuer")
+    parser.add_argument('--root', default="./chroma_db", help="Dossier racine des versions")
+    parser.add_argument('--documents', default="documents", help="Dossier des documents HTML (build)")
+    parser.add_argument('--to', help="Version à servir (rollback). Par défaut la version précédente")
+    args = parser.parse_args()
+
+    snapshots = SnapshotStore(args.root)
+    if args.command == 'build':
+        # Construction, validation et publication ; les processus en cours basculent sur la nouvelle version
+        from rag.engine.retrieval_engine import RetrievalEngine
+        engine = RetrievalEngine(args.documents, args.root, rerank=False)
+        print(f"Version servie : {engine.version}")
+    elif args.command == 'rollback':
+        print(f"Version servie : {snapshots.rollback(args.to)}")
+    else:
+        current = snapshots.current()
+        for version in snapshots.versions():
+            info = snapshots.info(version)
+            print(f"{'*' if version == current else ' '} {version}  {info.get('count', '?'):>8} chunks  "
+                  f"{info.get('corpus_version', '')[:12]}")
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,291 @@
-from typing import List, Dict  # Importation des types pour un typage statique plus précis
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple, Any  # Importation des types pour un typage statique plus précis
 import re  # Importation du module regex pour le découpage en sections
 import json  # Importation du module JSON pour enregistrer les résultats dans un fichier
+import os  # Importation de os pour le renommage atomique du fichier de chunks
+import tempfile  # Importation de tempfile pour un fichier temporaire propre à chaque écriture
+from collections import deque  # Importation de deque pour la fenêtre glissante des morceaux
+from itertools import islice  # Importation d'islice pour parcourir la fenêtre sans la copier
+
+# Titre de section principale sur sa propre ligne (ex : "2. Prise en charge selon les contrats")
+SECTION_PATTERN = re.compile(r'^\d+\.\s+\S.*$', re.MULTILINE)
+
+# Séparateurs essayés dans l'ordre, du plus structurant au plus fin :
+# sous-titres (ex : "2.1 Contrat ..."), lignes, fins de phrases, mots
+SEPARATORS = [
+    (re.compile(r'\n(?=\d+\.\d+\.?\s)'), '\n'),
+    (re.compile(r'\n+'), '\n'),
+    (re.compile(r'(?<=[.!?;:])\s+'), ' '),
+    (re.compile(r'\s+'), ' '),
+]
 
 class TextSplitter:
     """
     Classe responsable du découpage des documents en chunks plus petits.
+
+    Le découpage est récursif : chaque section principale est découpée d'abord sur les
+    sous-titres, puis sur les lignes, les phrases et enfin les mots, jusqu'à ce que chaque
+    morceau tienne dans chunk_size. Les morceaux sont ensuite regroupés en chunks de taille
+    maximale chunk_size avec un chevauchement d'environ chunk_overlap. Les tailles sont
+    comptées en tokens si un tokenizer est fourni, en caractères sinon.
     """
-    
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+
+    VERSION = 3  # À incrémenter quand la logique de découpage change (force la réindexation)
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, tokenizer: Optional[Any] = None,
+                 dump_path: Optional[str] = None):
         """
         Initialise le découpeur de texte.
-        
+
         Args:
-            chunk_size (int): Taille maximale de chaque chunk en caractères
-            chunk_overlap (int): Nombre de caractères de chevauchement entre les chunks
+            chunk_size (int): Taille maximale de chaque chunk (en tokens avec un tokenizer, en caractères sinon)
+            chunk_overlap (int): Taille du chevauchement entre deux chunks consécutifs d'une même section
+            tokenizer (Optional[Any]): Tokenizer Hugging Face du modèle d'embedding (ex : model.tokenizer)
+            dump_path (Optional[str]): Fichier JSON Lines où enregistrer les chunks produits. None (par défaut) : aucun fichier
         """
-        self.chunk_size = chunk_size  # Taille de chaque chunk en caractères
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap doit être strictement inférieur à chunk_size")
+        self.chunk_size = chunk_size  # Taille maximale de chaque chunk
         self.chunk_overlap = chunk_overlap  # Taille du chevauchement entre les chunks
-        
-    def split_documents(self, documents: List[Dict[str, str]], output_file: str = "chunks.json") -> List[Dict[str, str]]:
+        self.tokenizer = tokenizer  # Tokenizer utilisé pour compter les tokens (None : caractères)
+        self.dump_path = dump_path  # Enregistrement des chunks désactivé par défaut
+
+    @property
+    def length_unit(self) -> str:
+        """Unité dans laquelle chunk_size et chunk_overlap sont exprimés."""
+        return 'tokens' if self.tokenizer is not None else 'characters'
+
+    def _lengths(self, texts: List[str]) -> List[int]:
+        """
+        Mesure la taille de plusieurs textes en un seul appel au tokenizer.
+
+        Args:
+            texts (List[str]): Textes à mesurer
+
+        Returns:
+            List[int]: Taille de chaque texte (tokens ou caractères)
+        """
+        if self.tokenizer is None or not texts:
+            return [len(text) for text in texts]
+        encoded = self.tokenizer(texts, add_special_tokens=False)['input_ids']  # Tokenisation par lot (rapide)
+        return [len(ids) for ids in encoded]
+
+    def _hard_split(self, text: str) -> List[str]:
+        """
+        Coupe un texte sans séparateur exploitable en fenêtres de chunk_size.
+
+        Args:
+            text (str): Texte trop long (ex : un mot ou une URL démesurés)
+
+        Returns:
+            List[str]: Morceaux de taille au plus chunk_size
         """
-        Découpe les documents en chunks par sections principales et enregistre le résultat dans un fichier JSON.
-        
+        if self.tokenizer is None:
+            return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        # Découpe sur les frontières de tokens grâce aux positions renvoyées par le tokenizer
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+        pieces = []
+        for i in range(0, len(offsets), self.chunk_size):
+            window = offsets[i:i + self.chunk_size]
+            pieces.append(text[window[0][0]:window[-1][1]])
+        return pieces
+
+    def _split_pieces(self, text: str, level: int = 0) -> List[Tuple[str, str, int]]:
+        """
+        Découpe récursivement un texte en morceaux qui tiennent chacun dans chunk_size.
+
+        Chaque niveau ne redécoupe que les morceaux trop longs : le texte est parcouru une fois
+        par séparateur, soit un coût linéaire en la taille du document.
+
+        Args:
+            text (str): Texte à découper
+            level (int): Indice du séparateur à utiliser dans SEPARATORS
+
+        Returns:
+            List[Tuple[str, str, int]]: (morceau, séparateur à placer avant lui, taille du morceau)
+        """
+        if level >= len(SEPARATORS):
+            hard_pieces = self._hard_split(text)
+            return [(piece, '', length) for piece, length in zip(hard_pieces, self._lengths(hard_pieces))]
+
+        pattern, joiner = SEPARATORS[level]
+        parts = [part for part in pattern.split(text) if part.strip()]
+        pieces = []
+        for part, length in zip(parts, self._lengths(parts)):
+            if length <= self.chunk_size:
+                pieces.append((part.strip(), joiner, length))
+            else:
+                sub_pieces = self._split_pieces(part.strip(), level + 1)
+                # Le premier sous-morceau est séparé du morceau précédent par le séparateur de ce niveau
+                pieces.append((sub_pieces[0][0], joiner, sub_pieces[0][2]))
+                pieces.extend(sub_pieces[1:])
+        return pieces
+
+    def _merge_pieces(self, pieces: List[Tuple[str, str, int]]) -> List[str]:
+        """
+        Regroupe les morceaux en chunks de taille maximale chunk_size, avec chevauchement.
+
+        Args:
+            pieces (List[Tuple[str, str, int]]): Morceaux produits par _split_pieces
+
+        Returns:
+            List[str]: Textes des chunks
+        """
+        chunks = []
+        window: "deque[Tuple[str, str, int]]" = deque()  # Morceaux du chunk en cours
+        window_size = 0  # Taille cumulée des morceaux de la fenêtre
+
+        def emit():
+            text = window[0][0] + ''.join(joiner + piece for piece, joiner, _ in islice(window, 1, None))
+            chunks.append(text)
+
+        for piece in pieces:
+            size = piece[2] + 1  # +1 pour le séparateur qui le relie au morceau précédent (borne prudente)
+            if window and window_size + size > self.chunk_size:
+                emit()
+                # Conserve la fin du chunk comme chevauchement, dans la limite de chunk_overlap
+                # et en laissant la place au morceau suivant
+                while window and (window_size > self.chunk_overlap or window_size + size > self.chunk_size):
+                    window_size -= window.popleft()[2] + 1
+            window.append(piece)
+            window_size += size
+
+        if window:
+            emit()
+        return chunks
+
+    def split_sections(self, text: str) -> List[Tuple[str, List[str]]]:
+        """
+        Découpe un texte en chunks section par section.
+
+        Args:
+            text (str): Texte complet d'un document
+
+        Returns:
+            List[Tuple[str, List[str]]]: (titre de la section, chunks de la section), dans l'ordre du document.
+                Le titre est vide pour le texte qui précède la première section
+        """
+        # Positions des titres de sections principales : chaque section est découpée séparément
+        starts = [0] + [match.start() for match in SECTION_PATTERN.finditer(text) if match.start() > 0]
+        bounds = zip(starts, starts[1:] + [len(text)])
+
+        sections = []
+        for start, end in bounds:
+            section = text[start:end].strip()
+            if section:
+                first_line = section.split('\n', 1)[0]
+                heading = first_line if SECTION_PATTERN.match(first_line) else ''
+                sections.append((heading, self._merge_pieces(self._split_pieces(section))))
+        return sections
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        Découpe un texte en chunks sans jamais mélanger deux sections principales.
+
+        Args:
+            text (str): Texte complet d'un document
+
+        Returns:
+            List[str]: Textes des chunks, dans l'ordre du document
+        """
+        return [chunk for _, chunks in self.split_sections(text) for chunk in chunks]
+
+    def iter_split_documents(self, documents: Iterable[Dict[str, str]],
+                             dump_path: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        """
+        Découpe les documents en chunks au fil de l'eau, sans les garder en mémoire.
+
+        Args:
+            documents (Iterable[Dict[str, str]]): Documents à découper (liste ou générateur)
+            dump_path (Optional[str]): Fichier JSON Lines où enregistrer les chunks. Par défaut self.dump_path (None : aucun fichier)
+
+        Yields:
+            Dict[str, str]: Chunks de documents, dans l'ordre des documents
+        """
+        chunks = self._iter_chunks(documents)
+        dump_path = dump_path or self.dump_path
+        if dump_path:  # Enregistrement optionnel, écrit au fur et à mesure que les chunks sont produits
+            chunks = self._dump_chunks(chunks, dump_path)
+        yield from chunks
+
+    def _iter_chunks(self, documents: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Produit les chunks de chaque document, dans l'ordre, avec leur section et leur position."""
+        for doc in documents:  # Parcourt chaque document du flux
+            sections = self.split_sections(doc['page_content'])  # Découpe le document en chunks, section par section
+            chunk_count = sum(len(chunks) for _, chunks in sections)
+            position = 0
+            for heading, chunks in sections:
+                for chunk in chunks:
+                    metadata = doc['metadata'].copy()  # Copie les métadonnées associées au document
+                    metadata.update({
+                        'section': heading,  # Titre de la section principale (ex : "2. Prise en charge")
+                        'chunk_index': position,  # Position du chunk dans le document
+                        'chunk_count': chunk_count  # Nombre total de chunks du document
+                    })
+                    yield {
+                        'page_content': chunk,  # Texte du chunk
+                        'metadata': metadata
+                    }
+                    position += 1
+
+    @staticmethod
+    def _dump_chunks(chunks: Iterator[Dict[str, str]], dump_path: str) -> Iterator[Dict[str, str]]:
+        """
+        Transmet les chunks tout en les écrivant, un objet JSON par ligne, dans un fichier temporaire.
+
+        Le fichier définitif n'est remplacé (renommage atomique) que si le flux est allé jusqu'au bout :
+        plusieurs sessions qui découpent en même temps n'écrivent jamais dans le même fichier,
+        et un découpage interrompu ne laisse pas de fichier tronqué.
+
+        Args:
+            chunks (Iterator[Dict[str, str]]): Flux de chunks à enregistrer
+            dump_path (str): Chemin du fichier JSON Lines
+
+        Yields:
+            Dict[str, str]: Les mêmes chunks, inchangés
+        """
+        directory = os.path.dirname(os.path.abspath(dump_path))
+        os.makedirs(directory, exist_ok=True)
+        # Fichier temporaire propre à ce flux, dans le même dossier pour que le renommage reste atomique
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(dump_path) + '.', suffix='.tmp', dir=directory)
+        completed = False
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(json.dumps(chunk, ensure_ascii=False, separators=(',', ':')) + '\n')
+                    yield chunk
+            os.replace(tmp_path, dump_path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):  # Flux interrompu : on supprime le fichier partiel
+                os.remove(tmp_path)
+
+    @staticmethod
+    def read_chunks(path: str) -> Iterator[Dict[str, str]]:
+        """
+        Relit un fichier de chunks JSON Lines au fil de l'eau.
+
+        Permet de reprendre une indexation à partir des chunks déjà découpés, sans reparser le HTML.
+
+        Args:
+            path (str): Chemin du fichier écrit par iter_split_documents / split_documents
+
+        Yields:
+            Dict[str, str]: Chunks avec 'page_content' et 'metadata'
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def split_documents(self, documents: List[Dict[str, str]], output_file: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Découpe les documents en chunks, avec enregistrement optionnel au format JSON Lines.
+
         Args:
             documents (List[Dict[str, str]]): Liste des documents à découper
-            output_file (str): Chemin du fichier JSON de sortie
-            
+            output_file (Optional[str]): Fichier JSON Lines de sortie. Par défaut self.dump_path (None : aucun fichier)
+
         Returns:
             List[Dict[str, str]]: Liste des chunks de documents
         """
-        chunks = []  # Liste qui stockera les chunks de documents créés
-        
-        for doc in documents:  # Parcourt chaque document dans la liste des documents
-            text = doc['page_content']  # Récupère le contenu texte du document
-            
-            # Découpage en sections principales (grand titre). Cela divise le texte par les titres de section
-            sections = re.split(r'\n\s*\n(?=\d+\.\s)', text)  # Utilisation d'une expression régulière pour séparer par grands titres (ex: 1., 2., 3., ...)
-            
-            for section in sections:  # Parcourt chaque section obtenue
-                chunks.append({
-                    'page_content': section.strip(),  # Nettoie et ajoute le texte de la section
-                    'metadata': doc['metadata'].copy()  # Copie les métadonnées associées au document
-                })
-        
-        # Enregistrement des chunks dans un fichier JSON
-        with open(output_file, 'w', encoding='utf-8') as f:  # Ouvre le fichier JSON pour écriture
-            json.dump(chunks, f, ensure_ascii=False, indent=4)  # Enregistre les chunks au format JSON dans le fichier
-
-        return chunks  # Retourne la liste des chunks créés
+        return list(self.iter_split_documents(documents, dump_path=output_file))  # Retourne la liste des chunks créés
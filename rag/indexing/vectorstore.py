@@ -1,92 +1,748 @@
 # Import du modèle de transformers pour la création d'embeddings (vecteurs) à partir du texte
-from sentence_transformers import SentenceTransformer
-# Import de ChromaDB pour la base de données vectorielle
-import chromadb
+from rag.indexing.embeddings import EmbeddingBackend, TorchBackend  # Moteurs d'embedding interchangeables (PyTorch, int8, ONNX)
 # Import des types pour le typage statique
-from typing import List, Dict
+from typing import List, Dict, Iterable, Set, Tuple, Optional, Callable
+# Import de numpy pour manipuler les embeddings en float32
+import numpy as np
+# Import pour le calcul des empreintes (hash) servant d'identifiants stables
+import json  # Importation du module JSON pour identifier les filtres de métadonnées
+import hashlib
 # Import pour la gestion des chemins de fichiers
 import os
+# Import des verrous pour partager une même instance entre plusieurs sessions (threads)
+import threading
+from contextlib import contextmanager
+# Import pour mesurer le débit d'indexation
+import time
+# Import du module de journalisation pour le suivi de l'indexation
+import logging
+
+from rag.indexing.embedding_cache import QueryEmbeddingCache  # Cache LRU des embeddings de requêtes
+from rag.monitoring.tracing import span  # Durée des étapes de la recherche (sans effet hors d'une trace)
+from rag.indexing.bm25_index import BM25Index  # Index lexical BM25 pour la recherche hybride
+
+logger = logging.getLogger(__name__)  # Journal du module (progression de l'indexation)
+
+class _ReadWriteLock:
+    """
+    Verrou lecteurs/rédacteur : les lectures se font en parallèle, une écriture est exclusive.
+    
+    Un rédacteur en attente bloque les nouvelles lectures : une indexation n'attend pas
+    indéfiniment derrière un flux continu de recherches.
+    """
+    
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0  # Lectures en cours
+        self._writing = False  # Écriture en cours
+        self._waiting_writers = 0  # Écritures en attente
+    
+    @contextmanager
+    def read(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writing and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+    
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                self._condition.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
 
 class VectorStore:
     """
     Classe responsable de la vectorisation et du stockage des documents.
     Cette classe gère la transformation des textes en vecteurs et leur stockage dans ChromaDB.
+    Une même instance peut être partagée entre plusieurs threads : les recherches (lectures de la
+    collection, encodage des requêtes) se font en parallèle ; seules les écritures de l'indexation
+    sont exclusives.
     """
     
-    def __init__(self, collection_name: str = "documents"):
+    MODEL_NAME = 'HIT-TMG/KaLM-embedding-multilingual-mini-instruct-v1.5'  # Modèle d'embedding utilisé
+    SEARCH_MODES = ('dense', 'lexical', 'hybrid')  # Modes de recherche disponibles
+    BACKENDS = ('chroma', 'mmap')  # Stockages des embeddings : ChromaDB (HNSW) ou fichier projeté en mémoire (recherche exacte)
+    RRF_K = 60  # Constante de la fusion par rangs réciproques (valeur usuelle)
+    MAX_CONCURRENT_ENCODES = 4  # Encodages simultanés : au-delà, les threads de calcul du modèle se concurrencent
+    
+    def __init__(self, collection_name: str = "documents", persist_directory: str = "./chroma_db",
+                 query_cache: Optional[QueryEmbeddingCache] = None, search_mode: str = 'dense',
+                 hybrid_weights: Tuple[float, float] = (1.0, 1.0),
+                 embedding_backend: Optional[EmbeddingBackend] = None,
+                 backend: str = 'chroma', vector_dtype: str = 'float32'):
         """
         Initialise la base de données vectorielle.
         
         Args:
             collection_name (str): Nom de la collection dans ChromaDB. Par défaut "documents"
+            persist_directory (str): Dossier où ChromaDB sauvegarde ses données. Par défaut "./chroma_db"
+            query_cache (Optional[QueryEmbeddingCache]): Cache des embeddings de requêtes. Par défaut un cache en mémoire
+            search_mode (str): Mode de recherche par défaut : 'dense' (embeddings), 'lexical' (BM25) ou 'hybrid' (fusion des deux)
+            hybrid_weights (Tuple[float, float]): Poids (dense, lexical) de la fusion par rangs réciproques
+            embedding_backend (Optional[EmbeddingBackend]): Moteur d'embedding. Par défaut le modèle PyTorch en pleine précision
+            backend (str): 'chroma' (ChromaDB, index HNSW) ou 'mmap' (embeddings normalisés dans un fichier projeté
+                en mémoire, recherche exacte, pages partagées entre processus)
+            vector_dtype (str): Précision des embeddings stockés par le backend 'mmap' : 'float32', 'float16' ou 'int8'
         """
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {search_mode}")
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Stockage inconnu : {backend} (disponibles : {', '.join(self.BACKENDS)})")
+        self.backend = backend
+        self.vector_dtype = vector_dtype
+        self.collection_name = collection_name  # Nom de la collection, utile pour l'empreinte de configuration de l'index
+        self.persist_directory = persist_directory  # Dossier de persistance (le manifeste d'indexation y est aussi stocké)
+        # L'inférence est sans état et relâche le GIL : plusieurs encodages en parallèle, en nombre borné
+        # (mêmes paramètres de troncature à chaque appel : le tokenizer partagé n'est pas reconfiguré)
+        self._encode_slots = threading.BoundedSemaphore(self.MAX_CONCURRENT_ENCODES)
+        self._db_lock = _ReadWriteLock()  # Lectures de la collection en parallèle, écritures exclusives
+        self.search_mode = search_mode
+        self.hybrid_weights = hybrid_weights
+        
+        # Index lexical BM25 sauvegardé à côté de la base, chargé ou reconstruit à la première utilisation
+        self.lexical_index_path = os.path.join(persist_directory, "bm25_index.npz")
+        self._lexical_index: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()  # Une seule reconstruction de l'index lexical à la fois
+        self._lexical_dirty = False  # True quand la collection a changé depuis la dernière construction
+        self._lexical_masks: Dict[str, np.ndarray] = {}  # Filtre de métadonnées -> masque des chunks autorisés dans l'index BM25
+        
         # Initialisation du modèle d'embedding multilingue pour la vectorisation des textes
         # Ce modèle spécifique est choisi pour sa capacité à traiter le français
-        self.embedding_model = SentenceTransformer('HIT-TMG/KaLM-embedding-multilingual-mini-instruct-v1.5')
+        self.embedding_model = embedding_backend or TorchBackend(self.MODEL_NAME)
         
-        # Création d'un client ChromaDB persistant qui stocke les données sur le disque
-        # Le chemin './chroma_db' indique où les données seront sauvegardées
-        self.client = chromadb.PersistentClient(path="./chroma_db")
+        # Cache des embeddings de requêtes : une question répétée n'est encodée qu'une fois
+        self.query_cache = query_cache or QueryEmbeddingCache(namespace=self.embedding_model.id)
+        
+        if backend == 'mmap':
+            # Même interface que le client ChromaDB, collections dans persist_directory/mmap
+            from rag.indexing.mmap_store import MmapClient
+            missing_collection = ValueError  # Erreur levée par get_collection pour une collection absente
+            self.client = MmapClient(os.path.join(persist_directory, "mmap"), dtype=vector_dtype)
+        else:
+            # Création d'un client ChromaDB persistant qui stocke les données sur le disque
+            # (import différé : importer ce module ne charge pas ChromaDB)
+            import chromadb
+            from chromadb.errors import ChromaError
+            missing_collection = (ValueError, ChromaError)  # Selon la version de ChromaDB
+            # Télémétrie remplacée : celle de ChromaDB n'est pas prévue pour des recherches simultanées
+            settings = chromadb.config.Settings(anonymized_telemetry=False,
+                                                chroma_product_telemetry_impl="rag.indexing.chroma_telemetry.NoTelemetry")
+            self.client = chromadb.PersistentClient(path=persist_directory, settings=settings)
         
         # Tentative de récupération ou création de la collection
         try:
             # Essaie d'abord de récupérer une collection existante
             self.collection = self.client.get_collection(name=collection_name)
-        except:
+        except missing_collection:
             # Si la collection n'existe pas, en crée une nouvelle
-            self.collection = self.client.create_collection(name=collection_name)
+            self.collection = self._create_collection()
+        
+        # Vecteurs produits par un autre moteur (ou stockés dans une autre précision) : la collection est recréée
+        # (les collections créées avant les moteurs interchangeables ont été remplies par le modèle PyTorch)
+        current = dict({'embedding': f"{self.MODEL_NAME}:{TorchBackend.name}"}, **(self.collection.metadata or {}))
+        expected = self._collection_metadata()
+        if any(current.get(key) != value for key, value in expected.items()):
+            logger.warning("Collection %s créée avec %s : réindexation complète avec %s",
+                           collection_name, current, expected)
+            self.client.delete_collection(name=collection_name)
+            self.collection = self._create_collection()
     
-    def add_documents(self, documents: List[Dict[str, str]]):
+    def _collection_metadata(self) -> Dict[str, str]:
+        """Métadonnées qui décrivent le contenu de la collection : moteur d'embedding (et précision en mode 'mmap')."""
+        metadata = {'embedding': self.embedding_model.id}
+        if self.backend == 'mmap':
+            metadata['vector_dtype'] = self.vector_dtype
+        return metadata
+    
+    def _create_collection(self):
+        """Crée la collection en y enregistrant le moteur d'embedding qui la remplit."""
+        return self.client.create_collection(name=self.collection_name, metadata=self._collection_metadata())
+    
+    @staticmethod
+    def chunk_id(document: Dict[str, str]) -> str:
         """
-        Vectorise et stocke les documents dans ChromaDB.
+        Calcule l'identifiant stable d'un chunk à partir de sa source et de son contenu.
+        
+        Deux chunks identiques issus du même fichier obtiennent toujours le même identifiant,
+        ce qui permet de savoir sans ré-encoder si un chunk est déjà présent dans la collection.
+        
+        Args:
+            document (Dict[str, str]): Chunk avec 'page_content' et 'metadata'
+            
+        Returns:
+            str: Identifiant de la forme "<hash de la source>-<hash du contenu>"
+        """
+        source = document['metadata'].get('source', '')  # Fichier d'origine du chunk
+        source_hash = hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]  # Empreinte courte de la source
+        content_hash = hashlib.sha256(document['page_content'].encode('utf-8')).hexdigest()[:32]  # Empreinte du contenu
+        return f"{source_hash}-{content_hash}"
+    
+    def count(self) -> int:
+        """
+        Retourne le nombre de chunks présents dans la collection.
+        
+        Returns:
+            int: Nombre de chunks indexés
+        """
+        with self._db_lock.read():
+            return self.collection.count()
+    
+    def close(self) -> None:
+        """
+        Libère le client de la base (index HNSW et connexions SQLite), avant de supprimer son dossier.
+        
+        ChromaDB garde en cache un système par dossier pour toute la durée du processus : sans cet
+        arrêt, chaque version de l'index ouverte puis abandonnée resterait en mémoire. Le stockage
+        'mmap' n'a pas de cache global : ses fichiers sont libérés avec l'objet. L'instance n'est
+        plus utilisable ensuite.
+        
+        ChromaDB n'offre pas d'arrêt public pour un seul dossier (clear_system_cache arrête tous les
+        systèmes du processus, y compris celui de la version servie ; reset efface les données) :
+        le cache interne est donc manipulé avec précaution, pour la version épinglée dans requirements.txt.
+        """
+        if self.backend != 'chroma':
+            return
+        from chromadb.api.client import SharedSystemClient
+        registry = getattr(SharedSystemClient, '_identifier_to_system', None)
+        identifier = getattr(self.client, '_identifier', None)
+        if not isinstance(registry, dict) or identifier is None:
+            # Autre version de ChromaDB : le système n'est pas libéré, mais rien ne casse
+            logger.warning("Version de ChromaDB non prise en charge par close() : %s reste ouvert jusqu'à la fin du processus",
+                           self.persist_directory)
+            return
+        with self._db_lock.write():
+            system = registry.pop(identifier, None)
+            if system is not None:
+                system.stop()
+    
+    def add_documents(self, documents: List[Dict[str, str]]) -> Dict[str, int]:
+        """
+        Vectorise et stocke les documents dans ChromaDB de manière incrémentale.
+        
+        Les documents fournis sont considérés comme la version complète de leurs sources :
+        seuls les chunks nouveaux ou modifiés sont encodés, et les anciens chunks de ces
+        mêmes sources qui n'existent plus sont supprimés.
         
         Args:
             documents (List[Dict[str, str]]): Liste des documents à stocker
                 Chaque document est un dictionnaire avec 'page_content' et 'metadata'
+                
+        Returns:
+            Dict[str, int]: Nombre de chunks ajoutés, inchangés et supprimés
+        """
+        stats = self.add_documents_stream(documents)
+        return {key: stats[key] for key in ('added', 'unchanged', 'deleted')}
+    
+    def add_documents_stream(self, documents: Iterable[Dict[str, str]], batch_size: int = 32,
+                             sort_window: int = 8,
+                             progress_callback: Optional[Callable[[Dict[str, float]], None]] = None) -> Dict[str, float]:
+        """
+        Vectorise et stocke un flux de chunks par lots, avec une mémoire bornée.
+        
+        Les chunks sont lus au fil de l'eau depuis un itérable (générateur). Une fenêtre de
+        `batch_size * sort_window` chunks est triée par longueur avant l'encodage pour limiter
+        le padding, puis chaque lot est encodé en float32 et écrit immédiatement dans ChromaDB.
+        Comme pour add_documents, les anciens chunks des sources rencontrées sont supprimés à la fin.
+        
+        Args:
+            documents (Iterable[Dict[str, str]]): Flux de chunks avec 'page_content' et 'metadata'
+            batch_size (int): Nombre de chunks encodés et écrits par lot
+            sort_window (int): Nombre de lots regroupés pour le tri par longueur
+            progress_callback (Optional[Callable]): Fonction appelée après chaque lot avec les statistiques courantes
+            
+        Returns:
+            Dict[str, float]: Chunks traités, ajoutés, inchangés (dont métadonnées mises à jour), supprimés, durée et débit (chunks/s)
+        """
+        started = time.perf_counter()
+        stats = {'processed': 0, 'added': 0, 'unchanged': 0, 'updated': 0, 'deleted': 0,
+                 'seconds': 0.0, 'chunks_per_second': 0.0}
+        ids_by_source: Dict[str, Set[str]] = {}  # Identifiants vus par source (seules les chaînes sont conservées)
+        window: List[Tuple[str, Dict[str, str]]] = []  # Chunks en attente d'encodage
+        
+        def report():
+            # Met à jour la durée et le débit, puis prévient l'appelant
+            stats['seconds'] = time.perf_counter() - started
+            stats['chunks_per_second'] = stats['processed'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+            logger.info("Indexation : %d chunks traités (%d ajoutés), %.1f chunks/s",
+                        stats['processed'], stats['added'], stats['chunks_per_second'])
+            if progress_callback is not None:
+                progress_callback(dict(stats))
+        
+        for doc in documents:
+            chunk_id = self.chunk_id(doc)
+            source_ids = ids_by_source.setdefault(doc['metadata'].get('source', ''), set())
+            if chunk_id in source_ids:  # Doublon exact dans la même source : ignoré
+                continue
+            source_ids.add(chunk_id)
+            window.append((chunk_id, doc))
+            
+            # La fenêtre est pleine : on l'encode et on l'écrit avant de lire la suite du flux
+            if len(window) >= batch_size * sort_window:
+                self._flush_window(window, batch_size, stats, report)
+                window = []
+        
+        if window:
+            self._flush_window(window, batch_size, stats, report)
+        
+        # Supprime les chunks devenus obsolètes (contenu modifié ou supprimé dans la source)
+        sources = sorted(ids_by_source)
+        for i in range(0, len(sources), 100):  # Par groupes de sources pour garder des requêtes raisonnables
+            group = sources[i:i + 100]
+            with self._db_lock.write():
+                existing = self.collection.get(where={'source': {'$in': group}}, include=['metadatas'])
+                stale_ids = [
+                    chunk_id for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])
+                    if chunk_id not in ids_by_source.get((metadata or {}).get('source', ''), ())
+                ]
+                if stale_ids:
+                    self.collection.delete(ids=stale_ids)
+            stats['deleted'] += len(stale_ids)
+        
+        if stats['added'] or stats['deleted']:
+            self._mark_lexical_dirty()
+        report()
+        return stats
+    
+    def _flush_window(self, window: List[Tuple[str, Dict[str, str]]], batch_size: int,
+                      stats: Dict[str, float], report: Callable[[], None]) -> None:
+        """
+        Encode et écrit une fenêtre de chunks, lot par lot.
+        
+        Args:
+            window (List[Tuple[str, Dict[str, str]]]): Couples (identifiant, chunk) à traiter
+            batch_size (int): Nombre de chunks par lot
+            stats (Dict[str, float]): Statistiques mises à jour en place
+            report (Callable[[], None]): Fonction de suivi appelée après chaque lot
+        """
+        # Les chunks déjà présents dans la collection ne sont pas ré-encodés
+        with self._db_lock.read():
+            existing = self.collection.get(ids=[chunk_id for chunk_id, _ in window], include=['metadatas'])
+        existing_metadata = dict(zip(existing['ids'], existing['metadatas']))
+        new_chunks = [(chunk_id, doc) for chunk_id, doc in window if chunk_id not in existing_metadata]
+        stats['unchanged'] += len(window) - len(new_chunks)
+        
+        # Chunk inchangé mais métadonnées enrichies (ex : nouvelle version du chargeur) : mise à jour sans ré-encodage
+        outdated = [(chunk_id, doc['metadata']) for chunk_id, doc in window
+                    if chunk_id in existing_metadata and existing_metadata[chunk_id] != doc['metadata']]
+        if outdated:
+            with self._db_lock.write():
+                self.collection.update(ids=[chunk_id for chunk_id, _ in outdated],
+                                       metadatas=[metadata for _, metadata in outdated])
+            stats['updated'] += len(outdated)
+        stats['processed'] += len(window) - len(new_chunks)
+        
+        # Tri par longueur : les textes d'un même lot ont des tailles proches, donc peu de padding
+        new_chunks.sort(key=lambda item: len(item[1]['page_content']), reverse=True)
+        
+        for i in range(0, len(new_chunks), batch_size):
+            batch = new_chunks[i:i + batch_size]
+            texts = [doc['page_content'] for _, doc in batch]
+            
+            # Les embeddings restent un tableau numpy float32 jusqu'à ChromaDB (pas de listes de floats Python)
+            with self._encode_slots:
+                embeddings = np.asarray(
+                    self.embedding_model.encode(texts, batch_size=batch_size),
+                    dtype=np.float32
+                )
+            
+            # Écriture immédiate du lot : la mémoire utilisée ne dépend pas de la taille du corpus
+            with self._db_lock.write():
+                self.collection.add(
+                    embeddings=embeddings,                      # Les vecteurs des chunks
+                    documents=texts,                            # Le texte brut des chunks
+                    metadatas=[doc['metadata'] for _, doc in batch],  # Les métadonnées associées
+                    ids=[chunk_id for chunk_id, _ in batch]     # Les identifiants stables
+                )
+            stats['added'] += len(batch)
+            stats['processed'] += len(batch)
+            report()
+    
+    def indexed_sources(self) -> Set[str]:
+        """
+        Liste les fichiers sources présents dans la collection.
+        
+        Returns:
+            Set[str]: Noms des fichiers sources indexés
+        """
+        with self._db_lock.read():
+            if self.collection.count() == 0:
+                return set()
+            metadatas = self.collection.get(include=['metadatas'])['metadatas']  # Parcours complet, réservé aux reconstructions
+        return {metadata.get('source', '') for metadata in metadatas if metadata}
+    
+    def delete_sources(self, sources: Iterable[str]) -> None:
+        """
+        Supprime de la collection tous les chunks provenant des sources indiquées.
+        
+        Args:
+            sources (Iterable[str]): Noms des fichiers sources à retirer de l'index
+        """
+        sources = sorted(set(sources))
+        if sources:  # ChromaDB refuse un filtre $in vide
+            with self._db_lock.write():
+                self.collection.delete(where={'source': {'$in': sources}})
+            self._mark_lexical_dirty()
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Retourne l'embedding d'une requête, en passant par le cache.
+        
+        Args:
+            query (str): Requête de l'utilisateur
+            
+        Returns:
+            np.ndarray: Embedding float32 (en lecture seule) de la requête
+        """
+        encoded = []  # Rempli seulement si la requête n'était pas dans le cache
+        
+        def encode(text: str) -> np.ndarray:
+            encoded.append(text)
+            with self._encode_slots:
+                return self.embedding_model.encode(text)
+        
+        with span('embed') as current:
+            embedding = self.query_cache.get_or_compute(query, encode)
+            current.set(cache_hit=not encoded)
+        return embedding
+    
+    def embed_queries(self, queries: List[str]) -> List[np.ndarray]:
         """
-        # Vérifie si la collection est vide pour éviter les doublons
-        if self.collection.count() == 0:
-            # Extrait le contenu textuel de chaque document
-            texts = [doc['page_content'] for doc in documents]
+        Retourne les embeddings de plusieurs requêtes, en encodant les absentes du cache en un seul lot.
+        
+        Args:
+            queries (List[str]): Requêtes à encoder
             
-            # Convertit chaque texte en vecteur (embedding)
-            # .tolist() convertit les vecteurs numpy en listes Python pour ChromaDB
-            embeddings = self.embedding_model.encode(texts).tolist()
+        Returns:
+            List[np.ndarray]: Embeddings float32 (en lecture seule), dans l'ordre de queries
+        """
+        embeddings = [self.query_cache.get(query) for query in queries]
+        # Requêtes à encoder, par clé du cache : une requête répétée dans le lot n'est encodée qu'une fois
+        missing: Dict[str, str] = {}
+        for query, embedding in zip(queries, embeddings):
+            if embedding is None:
+                missing.setdefault(self.query_cache.normalize(query), query)
+        with span('embed', queries=len(queries), cache_hits=len(queries) - len(missing)):
+            if missing:
+                with self._encode_slots:
+                    encoded = self.embedding_model.encode(list(missing.values()))
+                computed = {key: self.query_cache.put(query, vector)
+                            for (key, query), vector in zip(missing.items(), encoded)}
+                embeddings = [embedding if embedding is not None else computed[self.query_cache.normalize(query)]
+                              for query, embedding in zip(queries, embeddings)]
+        return embeddings
+    
+    def _mark_lexical_dirty(self) -> None:
+        """La collection a changé : l'index lexical sera reconstruit à la prochaine utilisation."""
+        with self._lexical_lock:
+            self._lexical_dirty = True
+    
+    @property
+    def lexical_index(self) -> BM25Index:
+        """
+        Index BM25 de la collection, chargé depuis le disque ou reconstruit s'il est absent ou périmé.
+        
+        Returns:
+            BM25Index: Index lexical à jour
+        """
+        with self._lexical_lock:
+            if self._lexical_index is None and not self._lexical_dirty:
+                index = BM25Index.load(self.lexical_index_path)
+                # Un index sauvegardé qui ne correspond plus à la collection est ignoré : les identifiants
+                # dépendant du contenu des chunks, les mêmes identifiants garantissent les mêmes textes
+                if index is not None and len(index) == self.count() and set(index.ids) == self._collection_ids():
+                    self._lexical_index = index
+            if self._lexical_index is None or self._lexical_dirty:
+                self._lexical_index = self._build_lexical_index()
+                self._lexical_dirty = False
+                self._lexical_masks = {}  # Les masques portent sur l'ancien index
+            return self._lexical_index
+    
+    def _collection_ids(self) -> Set[str]:
+        """Identifiants de tous les chunks de la collection."""
+        with self._db_lock.read():
+            return set(self.collection.get(include=[])['ids'])
+    
+    def _lexical_mask(self, index: BM25Index, where: Dict) -> np.ndarray:
+        """
+        Masque des chunks de l'index BM25 qui respectent un filtre de métadonnées.
+        
+        Les filtres étant peu nombreux (un par produit), les masques sont gardés jusqu'à la
+        prochaine reconstruction de l'index.
+        
+        Args:
+            index (BM25Index): Index lexical courant
+            where (Dict): Filtre au format ChromaDB
             
-            # Récupère les métadonnées de chaque document
-            metadatas = [doc['metadata'] for doc in documents]
+        Returns:
+            np.ndarray: Tableau booléen des chunks autorisés
+        """
+        key = json.dumps(where, sort_keys=True)
+        mask = self._lexical_masks.get(key)
+        if mask is None or len(mask) != len(index):
+            with self._db_lock.read():
+                allowed_ids = self.collection.get(where=where, include=[])['ids']
+            mask = index.mask_for(allowed_ids)
+            if len(self._lexical_masks) >= 64:  # Borne de sécurité si les filtres varient beaucoup
+                self._lexical_masks = {}
+            self._lexical_masks[key] = mask
+        return mask
+    
+    def _lexical_search(self, query: str, n_results: int, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        Recherche BM25, restreinte aux chunks qui respectent le filtre éventuel.
+        
+        Args:
+            query (str): Requête de l'utilisateur
+            n_results (int): Nombre de résultats souhaités
+            where (Optional[Dict]): Filtre de métadonnées au format ChromaDB
+            
+        Returns:
+            List[Tuple[str, float]]: Couples (identifiant du chunk, score BM25)
+        """
+        index = self.lexical_index
+        with span('search.lexical', n_results=n_results, filtered=bool(where)):
+            mask = self._lexical_mask(index, where) if where else None
+            return index.search(query, n_results, mask=mask)
+    
+    def _build_lexical_index(self, page_size: int = 1000) -> BM25Index:
+        """
+        Construit l'index BM25 à partir des textes de la collection, lus par pages, puis le sauvegarde.
+        
+        Args:
+            page_size (int): Nombre de chunks lus par requête à ChromaDB
+            
+        Returns:
+            BM25Index: Index construit
+        """
+        def documents():
+            offset = 0
+            while True:
+                with self._db_lock.read():
+                    page = self.collection.get(include=['documents'], limit=page_size, offset=offset)
+                if not page['ids']:
+                    return
+                yield from zip(page['ids'], page['documents'])
+                offset += len(page['ids'])
+        
+        index = BM25Index.build(documents())
+        os.makedirs(self.persist_directory, exist_ok=True)
+        index.save(self.lexical_index_path)
+        return index
+    
+    def _dense_search(self, query_embedding: np.ndarray, n_results: int, where: Optional[Dict] = None) -> Dict:
+        """
+        Recherche par similarité des embeddings dans la collection.
+        
+        Args:
+            query_embedding (np.ndarray): Embedding de la requête
+            n_results (int): Nombre de résultats souhaités
+            where (Optional[Dict]): Filtre de métadonnées au format ChromaDB (ex : {'product': 'vol'})
             
-            # Génère des identifiants uniques pour chaque document
-            ids = [f"doc_{i}" for i in range(len(documents))]
+        Returns:
+            Dict: Résultats au format ChromaDB (listes imbriquées, une par requête)
+        """
+        return self._dense_search_batch([query_embedding], n_results, where)
+    
+    def _dense_search_batch(self, query_embeddings: List[np.ndarray], n_results: int,
+                            where: Optional[Dict] = None) -> Dict:
+        """
+        Recherche par similarité pour plusieurs requêtes en un seul appel à la collection.
+        
+        Args:
+            query_embeddings (List[np.ndarray]): Embeddings des requêtes
+            n_results (int): Nombre de résultats souhaités par requête
+            where (Optional[Dict]): Filtre de métadonnées au format ChromaDB, commun à toutes les requêtes
             
-            # Ajoute les documents, leurs embeddings et métadonnées à ChromaDB
-            self.collection.add(
-                embeddings=embeddings,  # Les vecteurs des documents
-                documents=texts,        # Le texte brut des documents
-                metadatas=metadatas,    # Les métadonnées associées
-                ids=ids                 # Les identifiants uniques
+        Returns:
+            Dict: Résultats au format ChromaDB, une liste par requête dans l'ordre de query_embeddings
+        """
+        # Le stockage mmap calcule directement sur la matrice ; ChromaDB attend des listes Python
+        embeddings = (np.vstack(query_embeddings) if self.backend == 'mmap'
+                      else [embedding.tolist() for embedding in query_embeddings])
+        with span('search.dense', n_results=n_results, filtered=bool(where), queries=len(query_embeddings)), \
+                self._db_lock.read():
+            return self.collection.query(
+                query_embeddings=embeddings,  # Les vecteurs des requêtes
+                n_results=n_results,          # Nombre de résultats souhaités
+                where=where or None           # Filtre appliqué avant la recherche (moins de candidats)
             )
     
-    def search(self, query: str, k: int = 3) -> List[Dict]:
+    def _distance(self, query_embedding: np.ndarray, embedding) -> float:
+        """
+        Distance entre une requête et un chunk, dans l'espace de la collection.
+        
+        Args:
+            query_embedding (np.ndarray): Embedding de la requête
+            embedding: Embedding stocké du chunk
+            
+        Returns:
+            float: Distance L2 au carré (entre vecteurs normalisés pour le stockage mmap)
+        """
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if self.backend == 'mmap':
+            # Les vecteurs stockés sont unitaires : 2 - 2 x cosinus, comme MmapCollection.query
+            norm = float(np.linalg.norm(query_embedding)) or 1.0
+            return max(2.0 - 2.0 * float(embedding @ query_embedding) / norm, 0.0)
+        # Distance L2 au carré, comme l'espace par défaut des collections ChromaDB
+        return float(np.sum((embedding - query_embedding) ** 2))
+    
+    def _results_for_ids(self, ids: List[str], query_embedding: np.ndarray, known: Dict) -> Dict:
+        """
+        Construit un résultat au format ChromaDB pour une liste ordonnée d'identifiants.
+        
+        Les chunks déjà présents dans un résultat dense sont repris tels quels ; les autres
+        (trouvés uniquement par BM25) sont lus dans la collection et leur distance est recalculée.
+        
+        Args:
+            ids (List[str]): Identifiants des chunks, du plus au moins pertinent
+            query_embedding (np.ndarray): Embedding de la requête
+            known (Dict): Résultat dense déjà obtenu (peut être vide)
+            
+        Returns:
+            Dict: Résultat avec 'ids', 'documents', 'metadatas' et 'distances'
+        """
+        rows = {}
+        if known.get('ids'):
+            for row in zip(known['ids'][0], known['documents'][0], known['metadatas'][0], known['distances'][0]):
+                rows[row[0]] = row[1:]
+        
+        missing = [chunk_id for chunk_id in ids if chunk_id not in rows]
+        if missing:
+            with self._db_lock.read():
+                fetched = self.collection.get(ids=missing, include=['documents', 'metadatas', 'embeddings'])
+            for chunk_id, document, metadata, embedding in zip(fetched['ids'], fetched['documents'],
+                                                               fetched['metadatas'], fetched['embeddings']):
+                rows[chunk_id] = (document, metadata, self._distance(query_embedding, embedding))
+        
+        ids = [chunk_id for chunk_id in ids if chunk_id in rows]
+        return {
+            'ids': [ids],
+            'documents': [[rows[chunk_id][0] for chunk_id in ids]],
+            'metadatas': [[rows[chunk_id][1] for chunk_id in ids]],
+            'distances': [[rows[chunk_id][2] for chunk_id in ids]]
+        }
+    
+    def search(self, query: str, k: int = 3, mode: Optional[str] = None, where: Optional[Dict] = None,
+               query_embedding: Optional[np.ndarray] = None) -> Dict:
         """
         Recherche les documents les plus pertinents pour une requête.
         
+        En mode 'hybrid', les classements dense et BM25 d'un ensemble de candidats sont fusionnés
+        par rangs réciproques (RRF), pondérés par hybrid_weights. Le résultat garde le format
+        ChromaDB quel que soit le mode, trié du plus au moins pertinent.
+        
         Args:
             query (str): Requête de l'utilisateur à rechercher
             k (int): Nombre de documents à retourner (par défaut 3)
+            mode (Optional[str]): 'dense', 'lexical' ou 'hybrid'. Par défaut self.search_mode
+            where (Optional[Dict]): Filtre de métadonnées au format ChromaDB, ex : {'product': 'vol'}
+                ou {'product': {'$in': ['vol', 'incendie']}}. None : toute la collection
+            query_embedding (Optional[np.ndarray]): Embedding de la requête s'il est déjà calculé (voir embed_query)
+            
+        Returns:
+            Dict: Les k documents les plus pertinents ('ids', 'documents', 'metadatas', 'distances')
+        """
+        mode = mode or self.search_mode
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {mode}")
+        
+        with span('search', mode=mode, k=k, filtered=bool(where)) as current:
+            results = self._search(query, k, mode, where, query_embedding=query_embedding)
+            current.set(results=len(results['ids'][0]))
+        return results
+    
+    def search_batch(self, queries: List[str], k: int = 3, mode: Optional[str] = None,
+                     where: Optional[Dict] = None, query_embeddings: Optional[List[np.ndarray]] = None) -> List[Dict]:
+        """
+        Recherche pour plusieurs requêtes à la fois (évaluation, traitements par lots).
+        
+        Les requêtes absentes du cache sont encodées en un seul lot et la recherche dense de toutes
+        les requêtes se fait en un seul appel à la collection ; la fusion hybride reste par requête.
+        Chaque résultat est identique à celui de search() pour la même requête.
+        
+        Args:
+            queries (List[str]): Requêtes à rechercher
+            k (int): Nombre de documents à retourner par requête
+            mode (Optional[str]): 'dense', 'lexical' ou 'hybrid'. Par défaut self.search_mode
+            where (Optional[Dict]): Filtre de métadonnées au format ChromaDB, commun à toutes les requêtes
+            query_embeddings (Optional[List[np.ndarray]]): Embeddings des requêtes s'ils sont déjà calculés
+                (voir embed_queries), dans l'ordre de queries
             
         Returns:
-            List[Dict]: Liste des k documents les plus pertinents avec leurs scores
+            List[Dict]: Un résultat au format de search() par requête, dans l'ordre de queries
+        """
+        mode = mode or self.search_mode
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {mode}")
+        if not queries:
+            return []
+        
+        with span('search', mode=mode, k=k, filtered=bool(where), queries=len(queries)):
+            if query_embeddings is None:
+                query_embeddings = self.embed_queries(queries)
+            dense_batch = None
+            if mode != 'lexical':
+                n_results = k if mode == 'dense' else max(k * 4, 20)
+                dense_batch = self._dense_search_batch(query_embeddings, n_results, where)
+            
+            results = []
+            for position, (query, query_embedding) in enumerate(zip(queries, query_embeddings)):
+                # Résultat dense de cette requête, remis au format d'une recherche simple
+                dense = None if dense_batch is None else {
+                    key: [values[position]] for key, values in dense_batch.items()
+                    if key in ('ids', 'documents', 'metadatas', 'distances')
+                }
+                results.append(self._search(query, k, mode, where, query_embedding=query_embedding, dense=dense))
+        return results
+    
+    def _search(self, query: str, k: int, mode: str, where: Optional[Dict],
+                query_embedding: Optional[np.ndarray] = None, dense: Optional[Dict] = None) -> Dict:
         """
-        # Convertit la requête en vecteur pour la comparaison
-        query_embedding = self.embedding_model.encode(query).tolist()
+        Recherche proprement dite (voir search), pour un mode déjà validé.
+        
+        search_batch fournit l'embedding de la requête (search aussi, si l'appelant l'a déjà calculé) et le résultat dense déjà calculés
+        (k résultats en mode 'dense', l'ensemble des candidats en mode 'hybrid').
+        """
+        # Convertit la requête en vecteur pour la comparaison (ou le récupère dans le cache)
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        
+        if mode == 'dense':
+            # Trouve les k documents les plus proches du vecteur de la requête
+            return dense if dense is not None else self._dense_search(query_embedding, k, where)
+        
+        if mode == 'lexical':
+            lexical_ids = [chunk_id for chunk_id, _ in self._lexical_search(query, k, where)]
+            return self._results_for_ids(lexical_ids, query_embedding, {})
+        
+        # Mode hybride : un ensemble de candidats plus large dans chaque classement, puis fusion
+        n_candidates = max(k * 4, 20)
+        if dense is None:
+            dense = self._dense_search(query_embedding, n_candidates, where)
+        lexical = self._lexical_search(query, n_candidates, where)
         
-        # Effectue une recherche par similarité dans ChromaDB
-        # Trouve les k documents les plus proches du vecteur de la requête
-        results = self.collection.query(
-            query_embeddings=[query_embedding],  # Le vecteur de la requête
-            n_results=k                         # Nombre de résultats souhaités
-        )
+        dense_weight, lexical_weight = self.hybrid_weights
+        scores: Dict[str, float] = {}
+        for rank, chunk_id in enumerate(dense['ids'][0], start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + dense_weight / (self.RRF_K + rank)
+        for rank, (chunk_id, _) in enumerate(lexical, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + lexical_weight / (self.RRF_K + rank)
         
-        # Retourne les résultats de la recherche
-        return results
\ No newline at end of file
+        best_ids = sorted(scores, key=scores.get, reverse=True)[:k]
+        return self._results_for_ids(best_ids, query_embedding, dense)
@@ -0,0 +1,432 @@
+"""
+Traces des requêtes : durée de chaque étape du pipeline RAG (embedding, recherche, re-classement,
+construction du contexte, génération), avec leurs compteurs (chunks, tokens, succès des caches).
+
+Une trace couvre une question ; les étapes appelées pendant la trace y ajoutent leur span. Hors
+d'une trace (ou si le traçage est désactivé), span() retourne un objet inerte partagé : le coût
+se limite à la lecture d'une variable de contexte. Les traces terminées sont gardées dans un
+tampon circulaire en mémoire et, si un fichier est configuré, écrites en arrière-plan dans SQLite.
+
+Configuration par variables d'environnement :
+    RAG_TRACING=0         désactive le traçage
+    RAG_TRACE_DB=traces.db  écrit aussi les traces dans cette base SQLite (conservées entre les redémarrages)
+    RAG_TRACE_RETENTION_DAYS=7  durée de conservation des traces dans la base (les plus anciennes sont supprimées)
+
+Utilisation :
+    with get_tracer().trace('question') as trace:
+        with span('embed') as current:
+            ...
+            current.set(cache_hit=True)
+"""
+from collections import deque  # Importation de deque pour le tampon circulaire des traces
+from contextvars import ContextVar  # Importation de ContextVar : trace courante propre à chaque thread / tâche
+from typing import Dict, List, Optional, Sequence  # Importation des types pour la typisation statique
+import atexit  # Importation d'atexit pour écrire les dernières traces à l'arrêt du processus
+import json  # Importation de json pour stocker les attributs des spans dans SQLite
+import logging  # Importation de logging pour signaler les échecs d'écriture en arrière-plan
+import os  # Importation de os pour la configuration par variables d'environnement
+import queue  # Importation de queue pour la file des traces en attente d'écriture
+import sqlite3  # Importation de sqlite3 pour la conservation des traces
+import threading  # Importation de threading pour le thread d'écriture et les verrous
+import time  # Importation de time pour mesurer les durées
+import uuid  # Importation d'uuid pour identifier les traces
+
+import numpy as np  # Importation de numpy pour le calcul des percentiles
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar('rag_current_trace', default=None)
+
+class Span:
+    """Durée et attributs d'une étape, ajoutés à la trace courante à la sortie du bloc with."""
+
+    __slots__ = ('trace', 'name', 'attrs', 'start', 'duration_ms')
+
+    def __init__(self, trace: "Trace", name: str, attrs: Dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.duration_ms = 0.0
+
+    def set(self, **attrs) -> None:
+        """Ajoute des attributs au span (compteurs, succès d'un cache...)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.trace.add(self)
+        return False
+
+class _NoopSpan:
+    """Span inerte, utilisé hors d'une trace ou quand le traçage est désactivé."""
+
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+NOOP_SPAN = _NoopSpan()  # Instance unique : aucune allocation par appel hors trace
+
+class Trace:
+    """Ensemble des spans d'une requête, avec sa durée totale."""
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()  # Date de début (epoch), pour filtrer par période
+        self.duration_ms = 0.0
+        self.spans: List[Span] = []
+        self._start = 0.0
+        self._token = None
+        self._finished = False
+
+    def set(self, **attrs) -> None:
+        """Ajoute des attributs à la trace (ex : réponse servie depuis le cache)."""
+        self.attrs.update(attrs)
+
+    def add(self, span: Span) -> None:
+        """Ajoute un span terminé (ignoré si la trace est déjà close, ex : flux abandonné)."""
+        if not self._finished:
+            self.spans.append(span)
+
+    def __enter__(self) -> "Trace":
+        self._start = time.perf_counter()
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        _current_trace.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self._finished = True
+        self.tracer.record(self)
+        return False
+
+    def to_dict(self) -> Dict:
+        """
+        Représentation sérialisable de la trace.
+
+        Returns:
+            Dict: Identifiant, nom, date de début, durée, attributs et spans (nom, durée, attributs)
+        """
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'attrs': dict(self.attrs),
+            'spans': [{'name': span.name, 'duration_ms': span.duration_ms, 'attrs': dict(span.attrs)}
+                      for span in self.spans]
+        }
+
+def span(name: str, **attrs):
+    """
+    Ouvre un span dans la trace courante.
+
+    Args:
+        name (str): Nom de l'étape (ex : 'embed', 'search.dense')
+        **attrs: Attributs initiaux du span
+
+    Returns:
+        Span ou objet inerte (hors trace) à utiliser dans un bloc with
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name, attrs)
+
+class SQLiteTraceSink:
+    """
+    Conservation des traces dans SQLite, écrites par lots par un thread d'arrière-plan.
+
+    Une ligne par span (et une pour la durée totale de la trace, sous le nom de la trace), indexée
+    par date : les durées d'une étape sur une période se lisent sans parcourir toute la base. Les
+    spans plus anciens que retention sont supprimés par le thread d'écriture, au plus une fois par
+    PRUNE_INTERVAL : la taille de la base reste bornée.
+    """
+
+    PRUNE_INTERVAL = 3600.0  # Délai minimal (en secondes) entre deux suppressions des traces expirées
+
+    def __init__(self, db_path: str, batch_size: int = 64, flush_interval: float = 1.0,
+                 retention: float = 7 * 86400):
+        """
+        Initialise la base des traces.
+
+        Args:
+            db_path (str): Chemin vers la base de données SQLite
+            batch_size (int): Nombre maximal de traces écrites dans une même transaction
+            flush_interval (float): Délai maximal (en secondes) avant l'écriture d'une trace
+            retention (float): Durée de conservation des traces (en secondes)
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._pruned_at = 0.0  # Dernière suppression des traces expirées (horloge monotone)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS spans (
+                    trace_id TEXT NOT NULL,
+                    trace_name TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    attrs TEXT NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_started_at ON spans (started_at)')
+            self._conn.commit()
+
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)  # Les traces encore en file sont écrites à l'arrêt du processus
+
+    def put(self, trace: Dict) -> None:
+        """Ajoute une trace (au format de Trace.to_dict) à la file d'écriture."""
+        self._queue.put(trace)
+
+    def _write_loop(self):
+        """Boucle du thread d'écriture : regroupe les traces en attente et les écrit par lots."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval) if len(batch) == 1 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+                if time.monotonic() - self._pruned_at >= self.PRUNE_INTERVAL:
+                    self.prune()
+            except sqlite3.Error:
+                logger.exception("Échec de l'écriture de %d traces", len(batch))
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, traces: List[Dict]):
+        """Écrit un lot de traces dans une seule transaction."""
+        rows = []
+        for trace in traces:
+            rows.append((trace['trace_id'], trace['name'], trace['name'], trace['started_at'],
+                         trace['duration_ms'], json.dumps(trace['attrs'], ensure_ascii=False, default=str)))
+            for item in trace['spans']:
+                rows.append((trace['trace_id'], trace['name'], item['name'], trace['started_at'],
+                             item['duration_ms'], json.dumps(item['attrs'], ensure_ascii=False, default=str)))
+        with self._lock:
+            with self._conn:
+                self._conn.executemany('INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def prune(self) -> int:
+        """
+        Supprime les spans plus anciens que la durée de conservation.
+
+        Returns:
+            int: Nombre de spans supprimés
+        """
+        self._pruned_at = time.monotonic()
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute('DELETE FROM spans WHERE started_at < ?', (time.time() - self.retention,))
+        return cursor.rowcount
+
+    def latencies(self, since: Optional[float] = None) -> Dict[str, List[float]]:
+        """
+        Durées enregistrées par étape.
+
+        Args:
+            since (Optional[float]): Début de la période (epoch). None : toute la durée de conservation
+
+        Returns:
+            Dict[str, List[float]]: {nom de l'étape: durées en millisecondes}
+        """
+        since = max(since or 0.0, time.time() - self.retention)  # Les traces expirées pas encore supprimées sont ignorées
+        with self._lock:
+            rows = self._conn.execute('SELECT name, duration_ms FROM spans WHERE started_at >= ?', (since,)).fetchall()
+        latencies: Dict[str, List[float]] = {}
+        for name, duration_ms in rows:
+            latencies.setdefault(name, []).append(duration_ms)
+        return latencies
+
+    def flush(self):
+        """Attend que toutes les traces en file soient écrites."""
+        self._queue.join()
+
+    def close(self):
+        """Écrit les traces en attente, arrête le thread d'écriture et ferme la connexion."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+class Tracer:
+    """
+    Point d'entrée du traçage : ouvre les traces et conserve les traces terminées.
+    """
+
+    def __init__(self, enabled: bool = True, capacity: int = 2000, sink_path: Optional[str] = None,
+                 retention: float = 7 * 86400):
+        """
+        Initialise le traceur.
+
+        Args:
+            enabled (bool): False : trace() et span() ne mesurent rien
+            capacity (int): Nombre de traces gardées en mémoire (les plus anciennes sont oubliées)
+            sink_path (Optional[str]): Base SQLite où écrire aussi les traces. None : mémoire seulement
+            retention (float): Durée de conservation des traces dans la base (en secondes)
+        """
+        self.enabled = enabled
+        self._buffer: "deque[Dict]" = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.sink = SQLiteTraceSink(sink_path, retention=retention) if enabled and sink_path else None
+
+    def trace(self, name: str, **attrs):
+        """
+        Ouvre une trace (ou un simple span si une trace est déjà en cours dans ce contexte).
+
+        Args:
+            name (str): Nom de la trace (ex : 'question')
+            **attrs: Attributs initiaux
+
+        Returns:
+            Trace, Span ou objet inerte à utiliser dans un bloc with
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if _current_trace.get() is not None:
+            return span(name, **attrs)
+        return Trace(self, name, attrs)
+
+    def record(self, trace: Trace) -> None:
+        """Conserve une trace terminée dans le tampon circulaire (et la base, si configurée)."""
+        record = trace.to_dict()
+        with self._lock:
+            self._buffer.append(record)
+        if self.sink is not None:
+            self.sink.put(record)
+
+    def recent(self, limit: int = 100) -> List[Dict]:
+        """
+        Dernières traces terminées, de la plus récente à la plus ancienne.
+
+        Args:
+            limit (int): Nombre maximal de traces
+
+        Returns:
+            List[Dict]: Traces au format de Trace.to_dict
+        """
+        with self._lock:
+            return list(self._buffer)[::-1][:limit]
+
+    def latencies(self, since: Optional[float] = None) -> Dict[str, List[float]]:
+        """
+        Durées par étape, lues dans la base si elle est configurée, sinon dans le tampon en mémoire.
+
+        Args:
+            since (Optional[float]): Début de la période (epoch). None : toutes les traces conservées
+
+        Returns:
+            Dict[str, List[float]]: {nom de l'étape (ou de la trace, pour la durée totale): durées en millisecondes}
+        """
+        if self.sink is not None:
+            return self.sink.latencies(since)
+        with self._lock:
+            traces = [trace for trace in self._buffer if since is None or trace['started_at'] >= since]
+        latencies: Dict[str, List[float]] = {}
+        for trace in traces:
+            latencies.setdefault(trace['name'], []).append(trace['duration_ms'])
+            for item in trace['spans']:
+                latencies.setdefault(item['name'], []).append(item['duration_ms'])
+        return latencies
+
+    def stage_percentiles(self, since: Optional[float] = None,
+                          percentiles: Sequence[int] = (50, 95, 99)) -> Dict[str, Dict[str, float]]:
+        """
+        Percentiles de latence par étape.
+
+        Args:
+            since (Optional[float]): Début de la période (epoch). None : toutes les traces conservées
+            percentiles (Sequence[int]): Percentiles calculés
+
+        Returns:
+            Dict[str, Dict[str, float]]: {étape: {'count': n, 'p50': ms, 'p95': ms, ...}}
+        """
+        report = {}
+        for name, durations in sorted(self.latencies(since).items()):
+            values = np.percentile(np.asarray(durations, dtype=np.float64), list(percentiles))
+            report[name] = {'count': len(durations), **{f'p{p}': float(v) for p, v in zip(percentiles, values)}}
+        return report
+
+    def close(self) -> None:
+        """Écrit les traces en attente dans la base, si elle est configurée."""
+        if self.sink is not None:
+            self.sink.close()
+
+
+_tracer: Optional[Tracer] = None  # Traceur partagé par le processus
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """
+    Retourne le traceur partagé, configuré par RAG_TRACING, RAG_TRACE_DB et RAG_TRACE_RETENTION_DAYS au premier appel.
+
+    Returns:
+        Tracer: Instance unique du traceur
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                enabled = os.environ.get('RAG_TRACING', '1').lower() not in ('0', 'false', 'no')
+                _tracer = Tracer(enabled=enabled, sink_path=os.environ.get('RAG_TRACE_DB') or None,
+                                 retention=float(os.environ.get('RAG_TRACE_RETENTION_DAYS', 7)) * 86400)
+    return _tracer
+
+def set_tracer(tracer: Tracer) -> None:
+    """
+    Remplace le traceur partagé (ex : traçage désactivé dans un banc de mesure).
+
+    Args:
+        tracer (Tracer): Nouveau traceur
+    """
+    global _tracer
+    with _tracer_lock:
+        previous, _tracer = _tracer, tracer
+    if previous is not None and previous is not tracer:
+        previous.close()
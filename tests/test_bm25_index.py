@@ -0,0 +1,67 @@
+"""Tests de l'index lexical BM25 : termes, classement, filtre et sauvegarde."""
+import math
+
+from rag.indexing.bm25_index import BM25Index, tokenize
+
+DOCUMENTS = [
+    ('vol', "Le vol de bijoux est couvert par la garantie vol."),
+    ('incendie', "L'incendie de la maison est couvert après expertise."),
+    ('degat', "Les dégâts des eaux sont couverts, franchise de 150 euros."),
+    ('franchise', "La franchise vol est de 300 euros, la franchise incendie de 500 euros."),
+]
+
+
+def test_tokenize_ignores_accents_case_and_stopwords():
+    assert tokenize("Les Dégâts de l'article 12") == ['degats', 'article', '12']
+
+
+def test_single_match_score_matches_bm25_formula():
+    index = BM25Index.build([('a', 'franchise vol'), ('b', 'incendie maison')])
+    (chunk_id, score), = index.search('vol', 2)
+    # Un document sur deux contient le terme, longueur égale à la moyenne : score = idf
+    assert chunk_id == 'a'
+    assert math.isclose(score, math.log(1 + 1.5 / 1.5), rel_tol=1e-6)
+
+
+def test_ranking_favours_term_frequency_and_rare_terms():
+    index = BM25Index.build(DOCUMENTS)
+    assert index.search('vol', 4)[0][0] == 'vol'  # Deux occurrences dans un document court
+    assert index.search('degats eaux', 4)[0][0] == 'degat'  # Accents ignorés
+    scores = dict(index.search('franchise bijoux', 4))
+    assert scores['vol'] > scores['degat']  # "bijoux" (1 document) pèse plus que "franchise" (2 documents)
+
+
+def test_unknown_terms_and_empty_index_return_nothing():
+    assert BM25Index.build(DOCUMENTS).search('assurance habitation', 4) == []
+    assert BM25Index().search('vol', 4) == []
+
+
+def test_k_limits_results_in_score_order():
+    results = BM25Index.build(DOCUMENTS).search('vol incendie franchise euros', 2)
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1]
+
+
+def test_mask_restricts_results():
+    index = BM25Index.build(DOCUMENTS)
+    mask = index.mask_for(['incendie', 'franchise'])
+    assert [chunk_id for chunk_id, _ in index.search('vol incendie', 4, mask=mask)] in (
+        ['franchise', 'incendie'], ['incendie', 'franchise'])
+
+
+def test_save_load_roundtrip(tmp_path):
+    index = BM25Index.build(DOCUMENTS, k1=1.2, b=0.5)
+    path = str(tmp_path / 'bm25.npz')
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert (loaded.k1, loaded.b) == (1.2, 0.5)
+    assert len(loaded) == len(index)
+    assert loaded.search('franchise vol', 4) == index.search('franchise vol', 4)
+    assert [p.name for p in tmp_path.iterdir()] == ['bm25.npz']  # Pas de fichier temporaire restant
+
+
+def test_load_missing_or_corrupt_file_returns_none(tmp_path):
+    assert BM25Index.load(str(tmp_path / 'absent.npz')) is None
+    corrupt = tmp_path / 'corrupt.npz'
+    corrupt.write_bytes(b'pas un fichier npz')
+    assert BM25Index.load(str(corrupt)) is None
@@ -0,0 +1,53 @@
+"""Tests de l'écriture des retours en arrière-plan : nouvelles tentatives et retours abandonnés."""
+import sqlite3
+
+import pytest
+
+from rag.feedback.feedback_manager import FeedbackManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = FeedbackManager(str(tmp_path / 'feedback.db'), flush_interval=0.01, write_retries=2, retry_backoff=0.01)
+    yield manager
+    manager.close()
+
+
+def fail_writes(manager: FeedbackManager, failures: int) -> None:
+    """Fait échouer les failures prochaines écritures de lots, comme une base verrouillée."""
+    write_batch = manager._write_batch
+    remaining = [failures]
+
+    def flaky(rows):
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        write_batch(rows)
+
+    manager._write_batch = flaky
+
+
+def test_votes_are_written_after_transient_errors(manager):
+    fail_writes(manager, failures=2)
+    manager.add_feedback("question", "réponse", True, sources=['vol.html'])
+    manager.add_feedback("question", "réponse", False)
+    manager.flush()
+    assert manager.get_statistics() == (1, 1)
+    assert manager.dropped == 0
+
+
+def test_votes_are_dropped_and_counted_after_repeated_errors(manager):
+    fail_writes(manager, failures=3)
+    manager.add_feedback("question", "réponse", True)
+    manager.flush()
+    assert manager.get_statistics() == (0, 0)
+    assert manager.dropped == 1
+    manager.add_feedback("question", "réponse", True)  # La base est de nouveau disponible
+    manager.flush()
+    assert manager.get_statistics() == (1, 0)
+
+
+def test_votes_are_refused_after_close(manager):
+    manager.close()
+    with pytest.raises(RuntimeError):
+        manager.add_feedback("question", "réponse", True)
@@ -0,0 +1,243 @@
+"""Tests du client résilient : seau à jetons, disjoncteur, reprises et regroupement des appels."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rag.chat.llm_client import (CircuitBreaker, LLMClient, LLMUnavailableError, ResilientLLMClient,
+                                 StubLLMClient, TokenBucket, UpstreamLimits)
+
+
+class PermissionDenied(Exception):
+    """Même nom que l'erreur de clé invalide de l'API Google : erreur permanente."""
+
+
+class FailingClient(LLMClient):
+    """Client qui lève error à chaque appel."""
+
+    name = 'failing'
+
+    def __init__(self, error: Exception):
+        self.error = error
+        self.calls = 0
+
+    def generate(self, prompt: str) -> str:
+        self.calls += 1
+        raise self.error
+
+
+def resilient(client: LLMClient, **limits) -> ResilientLLMClient:
+    """Client résilient avec des limites propres au test (jamais celles partagées du processus)."""
+    limits = dict(dict(rate=0, failure_threshold=2, reset_timeout=0.05), **limits)
+    return ResilientLLMClient(client, deadline=2.0, retries=1, backoff=0.01, limits=UpstreamLimits(**limits))
+
+
+# Seau à jetons
+
+def test_token_bucket_allows_burst_then_refuses():
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0.1)  # Prochain jeton dans environ une seconde
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate=50.0, capacity=1)
+    assert bucket.acquire(timeout=0)
+    started = time.monotonic()
+    assert bucket.acquire(timeout=1.0)
+    assert 0.005 < time.monotonic() - started < 0.5
+
+
+def test_token_bucket_zero_rate_is_unlimited():
+    bucket = TokenBucket(rate=0, capacity=1)
+    assert all(bucket.acquire(timeout=0) for _ in range(100))
+
+
+def test_token_bucket_async():
+    bucket = TokenBucket(rate=1.0, capacity=1)
+
+    async def take_two():
+        return await bucket.acquire_async(0), await bucket.acquire_async(0.1)
+
+    assert asyncio.run(take_two()) == (True, False)
+
+
+# Disjoncteur
+
+def test_breaker_opens_after_threshold_and_refuses():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # L'appel d'essai est déjà parti
+
+
+@pytest.mark.parametrize("outcome, state", [('record_success', CircuitBreaker.CLOSED),
+                                            ('record_failure', CircuitBreaker.OPEN)])
+def test_breaker_trial_outcome_decides_state(outcome, state):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    getattr(breaker, outcome)()
+    assert breaker.state == state
+
+
+def test_breaker_release_returns_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()  # Un nouvel appel d'essai peut partir
+
+
+# Client résilient
+
+def test_transient_errors_are_retried_then_open_the_breaker():
+    inner = FailingClient(ConnectionError("coupure"))
+    client = resilient(inner)
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            client.generate("question")
+    assert inner.calls == 4  # Une reprise par appel
+    assert client.limits.circuit_breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(LLMUnavailableError):
+        client.generate("question")
+    assert inner.calls == 4  # Refusé sans appeler le modèle
+
+
+def test_permanent_error_is_not_retried_and_does_not_trip_the_breaker():
+    inner = FailingClient(PermissionDenied("clé invalide"))
+    client = resilient(inner, failure_threshold=1)
+    with pytest.raises(PermissionDenied):
+        client.generate("question")
+    assert inner.calls == 1
+    assert client.limits.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_permanent_error_during_trial_releases_it():
+    inner = FailingClient(PermissionDenied("clé invalide"))
+    client = resilient(inner, failure_threshold=1)
+    client.limits.circuit_breaker.record_failure()
+    time.sleep(0.06)
+    with pytest.raises(PermissionDenied):
+        client.generate("question")
+    assert client.limits.circuit_breaker.allow()  # L'appel d'essai n'est pas resté bloqué
+
+
+def test_rate_limit_does_not_trip_the_breaker():
+    client = resilient(StubLLMClient(), rate=0.01, burst=1, failure_threshold=1)
+    client.deadline = 0.1
+    client.generate("première")
+    with pytest.raises(LLMUnavailableError):
+        client.generate("seconde")
+    assert client.limits.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_timeout_counts_as_a_single_failure():
+    client = resilient(StubLLMClient(latency=0.3), failure_threshold=2)
+    client.deadline = 0.05
+    with pytest.raises(LLMUnavailableError):
+        client.generate("lente")
+    time.sleep(0.4)  # L'appel finit dans le pool : son issue n'est pas comptée une seconde fois
+    assert client.limits.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_identical_concurrent_prompts_are_coalesced():
+    inner = StubLLMClient(latency=0.2)
+    client = resilient(inner)
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(client.generate("même question")))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inner.calls == 1
+    assert len(answers) == 5 and len(set(answers)) == 1
+
+
+def test_identical_concurrent_prompts_are_coalesced_async():
+    inner = StubLLMClient(latency=0.2)
+    client = resilient(inner)
+
+    async def ask_all():
+        return await asyncio.gather(*(client.generate_async("même question") for _ in range(5)))
+
+    answers = asyncio.run(ask_all())
+    assert inner.calls == 1
+    assert len(set(answers)) == 1
+
+
+def test_calls_queued_past_the_deadline_are_never_sent():
+    inner = StubLLMClient(latency=0.3)
+    client = resilient(inner, max_concurrency=1, failure_threshold=3, reset_timeout=60)
+    client.deadline, client.retries = 0.2, 0
+    errors = []
+
+    def ask(i):
+        try:
+            client.generate(f"question {i}")
+        except LLMUnavailableError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(0.5)  # Le pool vide sa file : les appels dont le demandeur est parti ne partent pas
+    assert len(errors) == 4
+    assert inner.calls == 1
+    assert client.limits.circuit_breaker._failures == 1  # Seul l'appel réellement envoyé compte
+
+
+def test_wrapped_client_timeout_is_capped_at_the_deadline():
+    inner = StubLLMClient()
+    inner.timeout = 60.0
+    ResilientLLMClient(inner, deadline=20.0, limits=UpstreamLimits(rate=0))
+    assert inner.timeout == 20.0
+
+
+def test_async_calls_respect_max_concurrency():
+    class SlowAsyncClient(LLMClient):
+        name = 'slow'
+        running = peak = 0
+
+        async def generate_async(self, prompt: str) -> str:
+            SlowAsyncClient.running += 1
+            SlowAsyncClient.peak = max(SlowAsyncClient.peak, SlowAsyncClient.running)
+            await asyncio.sleep(0.02)
+            SlowAsyncClient.running -= 1
+            return prompt
+
+    client = resilient(SlowAsyncClient(), max_concurrency=2)
+
+    async def ask_all():
+        return await asyncio.gather(*(client.generate_async(f"question {i}") for i in range(8)))
+
+    assert len(asyncio.run(ask_all())) == 8
+    assert SlowAsyncClient.peak == 2
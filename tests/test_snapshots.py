@@ -0,0 +1,86 @@
+"""Tests des versions de l'index : publication, retour en arrière et nettoyage."""
+import os
+
+import pytest
+
+from rag.indexing.snapshots import SnapshotStore
+
+
+def build(store: SnapshotStore, base=None, chunks: int = 1) -> str:
+    """Crée une version contenant un fichier de données, puis la valide."""
+    version = store.create(base)
+    with open(os.path.join(store.path(version), 'data.txt'), 'a', encoding='utf-8') as f:
+        f.write(f"{version}\n")
+    store.mark_ready(version, {'chunks': chunks})
+    return version
+
+
+def test_publish_moves_the_pointer(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    assert store.current() is None
+    first = build(store)
+    store.publish(first)
+    assert store.current() == first
+    second = build(store, base=first, chunks=2)
+    assert store.current() == first  # Une version validée n'est servie qu'une fois publiée
+    store.publish(second)
+    assert store.current() == second
+    assert store.info(second)['chunks'] == 2
+    # La nouvelle version est une copie de la précédente, sans ses informations de validation
+    with open(os.path.join(store.path(second), 'data.txt'), encoding='utf-8') as f:
+        assert f.read().split() == [first, second]
+
+
+def test_publish_requires_a_validated_version(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    published = build(store)
+    store.publish(published)
+    unfinished = store.create(published)
+    with pytest.raises(ValueError):
+        store.publish(unfinished)
+    assert store.current() == published
+
+
+def test_rollback_to_previous_and_named_version(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=5)
+    versions = [build(store) for _ in range(3)]
+    store.publish(versions[-1])
+    assert store.rollback() == versions[1]
+    assert store.current() == versions[1]
+    assert store.rollback() == versions[0]
+    with pytest.raises(ValueError):
+        store.rollback()  # Plus de version antérieure
+    assert store.rollback(versions[2]) == versions[2]
+    with pytest.raises(ValueError):
+        store.rollback('inconnue')
+    assert store.current() == versions[2]
+
+
+def test_prune_keeps_recent_current_and_in_use_versions(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=2)
+    versions = [build(store) for _ in range(5)]
+    store.publish(versions[0], in_use=[versions[1]])
+    assert store.versions() == [versions[0], versions[1], versions[3], versions[4]]
+    assert store.prune() == [versions[1]]  # Supprimée une fois fermée par l'appelant
+    assert store.current() == versions[0]
+
+
+def test_prune_removes_interrupted_builds_only(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    published = build(store)
+    interrupted = store.create(published)  # Jamais validée
+    newer = build(store)
+    in_progress = store.create(newer)  # Construction en cours, plus récente que toute version validée
+    store.publish(newer)
+    remaining = sorted(os.listdir(store.versions_dir))
+    assert interrupted not in remaining
+    assert remaining == [published, newer, in_progress]
+
+
+def test_pointer_writes_leave_no_temporary_files(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    version = build(store)
+    store.publish(version)
+    store.rollback(version)
+    assert sorted(os.listdir(tmp_path)) == [SnapshotStore.POINTER, 'versions']
+    assert sorted(os.listdir(store.path(version))) == ['data.txt', SnapshotStore.INFO]
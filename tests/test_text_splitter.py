@@ -0,0 +1,62 @@
+"""Tests du découpage en chunks : bornes de taille, chevauchement et métadonnées."""
+import pytest
+
+from rag.indexing.text_splitter import TextSplitter
+
+
+def make_text(paragraphs: int = 40) -> str:
+    """Texte de contrat fictif avec sections, sous-titres, lignes et phrases."""
+    lines = []
+    for section in range(1, 4):
+        lines.append(f"{section}. Section principale numéro {section}")
+        for sub in range(1, 4):
+            lines.append(f"{section}.{sub} Sous-titre {sub}")
+            for i in range(paragraphs // 4):
+                lines.append(f"La garantie {i} couvre le vol et l'incendie. Une franchise de {i * 10} euros s'applique.")
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(200, 50), (500, 100), (1000, 200)])
+def test_chunks_never_exceed_chunk_size(chunk_size, chunk_overlap):
+    splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_text(make_text())
+    assert len(chunks) > 1
+    assert all(0 < len(chunk) <= chunk_size for chunk in chunks)
+
+
+def test_unbroken_word_is_hard_split():
+    splitter = TextSplitter(chunk_size=50, chunk_overlap=10)
+    chunks = splitter.split_text("Début " + "x" * 180 + " fin.")
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert "".join(chunks).count("x") >= 180  # Aucun caractère perdu (le chevauchement peut en répéter)
+
+
+def test_consecutive_chunks_overlap():
+    splitter = TextSplitter(chunk_size=200, chunk_overlap=60)
+    text = " ".join(f"Phrase numéro {i} du contrat." for i in range(60))
+    chunks = splitter.split_text(text)
+    assert len(chunks) > 2
+    for previous, following in zip(chunks, chunks[1:]):
+        assert following.split(" ")[0] in previous  # Le chunk suivant reprend la fin du précédent
+
+
+def test_sections_are_never_mixed():
+    splitter = TextSplitter(chunk_size=1000, chunk_overlap=100)
+    sections = splitter.split_sections("1. Première\nTexte un.\n2. Seconde\nTexte deux.")
+    assert [heading for heading, _ in sections] == ["1. Première", "2. Seconde"]
+    assert all("Texte deux" not in chunk for chunk in sections[0][1])
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        TextSplitter(chunk_size=100, chunk_overlap=100)
+
+
+def test_split_documents_metadata():
+    splitter = TextSplitter(chunk_size=200, chunk_overlap=50)
+    documents = [{'page_content': make_text(8), 'metadata': {'source': 'contrat.pdf'}}]
+    chunks = list(splitter.iter_split_documents(documents))
+    assert [chunk['metadata']['chunk_index'] for chunk in chunks] == list(range(len(chunks)))
+    assert all(chunk['metadata']['chunk_count'] == len(chunks) for chunk in chunks)
+    assert all(chunk['metadata']['source'] == 'contrat.pdf' for chunk in chunks)
+    assert documents[0]['metadata'] == {'source': 'contrat.pdf'}  # Les métadonnées d'origine ne sont pas modifiées
@@ -0,0 +1,25 @@
+"""Tests de la conservation des traces dans SQLite : période lue et suppression des traces expirées."""
+import time
+
+from rag.monitoring.tracing import Tracer
+
+
+def make_trace(trace_id: str, started_at: float, duration_ms: float) -> dict:
+    return {'trace_id': trace_id, 'name': 'question', 'started_at': started_at, 'duration_ms': duration_ms,
+            'attrs': {}, 'spans': [{'name': 'embed', 'duration_ms': duration_ms / 2, 'attrs': {}}]}
+
+
+def test_sink_reads_the_window_and_prunes_expired_spans(tmp_path):
+    tracer = Tracer(sink_path=str(tmp_path / 'traces.db'), retention=3600)
+    now = time.time()
+    try:
+        for trace in (make_trace('expirée', now - 7200, 10), make_trace('ancienne', now - 600, 20),
+                      make_trace('récente', now - 5, 30)):
+            tracer.sink.put(trace)
+        tracer.sink.flush()
+        assert tracer.latencies() == {'question': [20, 30], 'embed': [10, 15]}
+        assert tracer.stage_percentiles(since=now - 60)['question']['count'] == 1
+        tracer.sink.prune()
+        assert tracer.sink._conn.execute('SELECT COUNT(*) FROM spans').fetchone()[0] == 4
+    finally:
+        tracer.close()